@@ -16,7 +16,6 @@ Actions to take on resources
 """
 import base64
 from datetime import datetime
-import jmespath
 import logging
 import zlib
 
@@ -656,8 +655,8 @@ class PutMetric(BaseAction):
         values = []
         self.log.debug("searching for %s in %s", key_expression, resources)
         try:
-            values = jmespath.search("Resources[]." + key_expression,
-                                     {'Resources': resources})
+            values = utils.jmespath_search("Resources[]." + key_expression,
+                                           {'Resources': resources})
             # I had to wrap resourses in a dict like this in order to not have jmespath expressions
             # start with [] in the yaml files.  It fails to parse otherwise.
         except TypeError, oops:
@@ -13,16 +13,38 @@
 # limitations under the License.
 """Provide basic caching services to avoid extraneous queries over
 multiple policies on the same resource type.
+
+Cache backends are registered in :data:`backends` and selected with the
+``cache_type`` option, when not given the type is inferred from the cache
+path.
+
+CloudWatch datapoints are persisted across runs by a :class:`DatapointStore`
+over one of these backends, configured with the ``metrics_cache`` option.
+Other persistent state opens a backend by path with :func:`open_store`.
 """
 
+import calendar
 import cPickle
 
+from collections import OrderedDict
+from datetime import datetime
+import errno
+import hashlib
 import os
 import logging
+import sqlite3
+import tempfile
+import threading
 import time
+import zlib
+
+from c7n.registry import PluginRegistry
+from c7n.utils import Bag
 
 log = logging.getLogger('custodian.cache')
 
+backends = PluginRegistry('cache')
+
 
 def factory(config):
     if not config:
@@ -32,9 +54,80 @@ def factory(config):
         log.debug("Disabling cache")
         return NullCache(config)
 
-    return FileCacheManager(config)
+    cache_type = getattr(config, 'cache_type', None) or infer_cache_type(
+        config.cache)
+    klass = backends.get(cache_type)
+    if klass is None:
+        raise ValueError("Invalid cache type %s" % cache_type)
+    return klass(config)
+
+
+def infer_cache_type(path):
+    if path == 'memory':
+        return 'memory'
+    elif is_cache_directory(path):
+        return 'directory'
+    elif path.endswith(('.sqlite', '.db')):
+        return 'sqlite'
+    return 'file'
+
+
+def is_cache_directory(path):
+    """A cache path ending in a separator or naming a directory is sharded."""
+    return path.endswith(os.sep) or os.path.isdir(
+        os.path.expanduser(os.path.expandvars(path)))
+
+
+def encode(value):
+    return zlib.compress(cPickle.dumps(value, protocol=2))
+
+
+def decode(blob):
+    return cPickle.loads(zlib.decompress(blob))
+
+
+def key_digest(key):
+    return hashlib.sha1(cPickle.dumps(key, protocol=2)).hexdigest()
 
 
+class CacheStats(object):
+    """Process wide cache statistics by resource.
+
+    Tracks hits, misses, and the compressed bytes stored, to help tune
+    cache periods per resource type.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+
+    def record(self, key, hit=None, size=0):
+        if isinstance(key, dict):
+            name = key.get('resource', 'unknown')
+        else:
+            name = str(key)
+        with self.lock:
+            s = self.data.setdefault(
+                name, {'hits': 0, 'misses': 0, 'bytes': 0})
+            if hit is True:
+                s['hits'] += 1
+            elif hit is False:
+                s['misses'] += 1
+            s['bytes'] += size
+
+    def summary(self):
+        with self.lock:
+            return {k: dict(v) for k, v in self.data.items()}
+
+    def reset(self):
+        with self.lock:
+            self.data = {}
+
+
+stats = CacheStats()
+
+
+@backends.register('null')
 class NullCache(object):
 
     def __init__(self, config):
@@ -46,10 +139,11 @@ class NullCache(object):
     def get(self, key):
         pass
 
-    def save(self, key, data):
+    def save(self, key, data, ttl=None):
         pass
 
 
+@backends.register('file')
 class FileCacheManager(object):
 
     def __init__(self, config):
@@ -63,7 +157,9 @@ class FileCacheManager(object):
 
     def get(self, key):
         k = cPickle.dumps(key)
-        return self.data.get(k)
+        value = self.data.get(k)
+        stats.record(key, value is not None)
+        return value
 
     def load(self):
         if self.data:
@@ -80,7 +176,8 @@ class FileCacheManager(object):
             log.debug("Using cache file %s" % self.cache_path)
             return True
 
-    def save(self, key, data):
+    def save(self, key, data, ttl=None):
+        # entries share the file's cache period, ttl is not supported.
         try:
             with open(self.cache_path, 'w') as fh:
                 self.data[cPickle.dumps(key)] = data
@@ -96,3 +193,359 @@ class FileCacheManager(object):
                 except Exception as e:
                     log.warning("Could not create directory: %s err: %s" % (
                         directory, e))
+
+
+@backends.register('directory')
+class DirectoryCacheManager(object):
+    """Cache with one file per key in a directory tree.
+
+    Entries are laid out as ``<cache dir>/<region>/<resource>/<query hash>``,
+    compressed, and are written to a temporary file and renamed into place, so
+    concurrent custodian processes never observe partial entries and
+    readers don't need any locking. Each entry carries its own ttl, which
+    defaults to the configured cache period.
+
+    The directory is bounded in size, when a save takes it over
+    ``max_size`` bytes the least recently used entries are evicted, with
+    reads refreshing an entry's modification time. The directory's size
+    is read once, then tracked across saves, so the tree is only walked
+    again to evict; entries saved by other processes meanwhile are
+    accounted for then.
+    """
+
+    max_size = 1024 * 1024 * 512
+
+    def __init__(self, config):
+        self.config = config
+        self.cache_period = config.cache_period
+        self.cache_dir = os.path.abspath(
+            os.path.expanduser(
+                os.path.expandvars(
+                    config.cache)))
+        self.max_size = getattr(config, 'cache_size', None) or self.max_size
+        self.lock = threading.Lock()
+        self.size = None
+
+    def get_path(self, key):
+        digest = key_digest(key)
+        if isinstance(key, dict) and 'region' in key and 'resource' in key:
+            return os.path.join(
+                self.cache_dir, str(key['region']), key['resource'], digest)
+        return os.path.join(self.cache_dir, digest)
+
+    def load(self):
+        return True
+
+    def get(self, key):
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as fh:
+                blob = fh.read()
+            expires, data = decode(blob)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                log.warning("Could not read cache %s err: %s" % (path, e))
+            stats.record(key, False)
+            return None
+        except (EOFError, ValueError, zlib.error, cPickle.UnpicklingError) as e:
+            log.warning("Invalid cache entry %s err: %s" % (path, e))
+            stats.record(key, False)
+            return None
+        if expires < time.time():
+            stats.record(key, False)
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        stats.record(key, True)
+        return data
+
+    def save(self, key, data, ttl=None):
+        if ttl is None:
+            ttl = self.cache_period * 60
+        path = self.get_path(key)
+        directory = os.path.dirname(path)
+        try:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            blob = encode((time.time() + ttl, data))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp')
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(blob)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as e:
+            log.warning("Could not save cache %s err: %s" % (path, e))
+            return
+        stats.record(key, size=len(blob))
+        with self.lock:
+            if self.size is None:
+                self.size = sum([entry[2] for entry in self.entries()])
+            else:
+                self.size += len(blob) - replaced
+            if self.size > self.max_size:
+                self.evict()
+
+    def entries(self):
+        for root, dirs, files in os.walk(self.cache_dir):
+            for f in files:
+                if f.startswith('.tmp'):
+                    continue
+                path = os.path.join(root, f)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def evict(self):
+        """Remove least recently used entries until under the size bound."""
+        entries = sorted(self.entries(), key=lambda e: e[1])
+        total = sum([e[2] for e in entries])
+        for path, mtime, size in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            log.debug("Evicted cache entry %s" % path)
+            total -= size
+        self.size = total
+
+
+@backends.register('sqlite')
+class SqliteCacheManager(object):
+    """Cache stored in an embedded sqlite database.
+
+    The database file can be shared by multiple custodian processes on
+    a host, ie. cron jobs per account, sqlite takes care of locking
+    between writers and write ahead logging lets readers proceed
+    concurrently. Entries are compressed and expire per their ttl.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.cache_period = config.cache_period
+        self.cache_path = os.path.abspath(
+            os.path.expanduser(
+                os.path.expandvars(
+                    config.cache)))
+        self.local = threading.local()
+
+    @property
+    def conn(self):
+        # sqlite connections can't be shared across threads
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.cache_path, timeout=60)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'create table if not exists c7n_cache ('
+                ' key text primary key, expires real, value blob)')
+            self.local.conn = conn
+        return conn
+
+    def load(self):
+        try:
+            self.conn
+        except sqlite3.Error as e:
+            log.warning("Could not open cache %s err: %s" % (
+                self.cache_path, e))
+            return False
+        return True
+
+    def get(self, key):
+        try:
+            row = self.conn.execute(
+                'select value from c7n_cache where key = ? and expires > ?',
+                (key_digest(key), time.time())).fetchone()
+            if row is None:
+                stats.record(key, False)
+                return None
+            value = decode(str(row[0]))
+        except (sqlite3.Error, zlib.error, cPickle.UnpicklingError) as e:
+            log.warning("Could not read cache %s err: %s" % (
+                self.cache_path, e))
+            stats.record(key, False)
+            return None
+        stats.record(key, True)
+        return value
+
+    def save(self, key, data, ttl=None):
+        if ttl is None:
+            ttl = self.cache_period * 60
+        blob = encode(data)
+        try:
+            with self.conn:
+                self.conn.execute(
+                    'delete from c7n_cache where expires < ?', (time.time(),))
+                self.conn.execute(
+                    'insert or replace into c7n_cache values (?, ?, ?)',
+                    (key_digest(key), time.time() + ttl, sqlite3.Binary(blob)))
+        except sqlite3.Error as e:
+            log.warning("Could not save cache %s err: %s" % (
+                self.cache_path, e))
+            return
+        stats.record(key, size=len(blob))
+
+
+@backends.register('memory')
+class MemoryCacheManager(object):
+    """In process least recently used cache, shared by all resource managers.
+
+    Entries are stored compressed, which also gives every caller its own
+    copy of the cached value. The store is bounded to ``max_size`` bytes.
+    """
+
+    max_size = 1024 * 1024 * 256
+
+    lock = threading.Lock()
+    store = OrderedDict()
+    size = 0
+
+    def __init__(self, config):
+        self.config = config
+        self.cache_period = config.cache_period
+        self.max_size = getattr(config, 'cache_size', None) or self.max_size
+
+    def load(self):
+        return True
+
+    def get(self, key):
+        k = key_digest(key)
+        with self.lock:
+            entry = self.store.pop(k, None)
+            if entry is not None and entry[0] > time.time():
+                # re-insert as most recently used
+                self.store[k] = entry
+            elif entry is not None:
+                MemoryCacheManager.size -= len(entry[1])
+                entry = None
+        if entry is None:
+            stats.record(key, False)
+            return None
+        stats.record(key, True)
+        return decode(entry[1])
+
+    def save(self, key, data, ttl=None):
+        if ttl is None:
+            ttl = self.cache_period * 60
+        k = key_digest(key)
+        blob = encode(data)
+        with self.lock:
+            previous = self.store.pop(k, None)
+            if previous is not None:
+                MemoryCacheManager.size -= len(previous[1])
+            self.store[k] = (time.time() + ttl, blob)
+            MemoryCacheManager.size += len(blob)
+            while MemoryCacheManager.size > self.max_size and self.store:
+                _, (_, evicted) = self.store.popitem(last=False)
+                MemoryCacheManager.size -= len(evicted)
+        stats.record(key, size=len(blob))
+
+    @classmethod
+    def clear(cls):
+        with cls.lock:
+            cls.store.clear()
+            cls.size = 0
+
+
+class DatapointStore(object):
+    """CloudWatch datapoints persisted across runs.
+
+    Entries are keyed by account, region, namespace, metric, dimensions,
+    statistics and period, and hold the datapoints of the complete periods
+    from a start time, aligned to the period. A later query over an
+    overlapping window only has to retrieve the periods since then, rather
+    than the whole window. Periods ending within ``settle`` seconds of a
+    query aren't stored, as cloudwatch may still be aggregating them.
+    """
+
+    settle = 600
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    @staticmethod
+    def get_key(account_id, region, namespace, metric, dimensions,
+                statistics, period):
+        return {
+            'resource': 'metrics',
+            'region': region,
+            'account_id': account_id,
+            'namespace': namespace,
+            'metric': metric,
+            'dimensions': tuple(sorted(
+                [(d['Name'], d['Value']) for d in dimensions])),
+            'statistics': tuple(sorted(statistics)),
+            'period': period}
+
+    def get(self, key, start, period):
+        """Stored datapoints from start, and the time to resume from."""
+        start = align(epoch(start), period)
+        entry = self.cache.get(key)
+        if entry is None or not entry['start'] <= start <= entry['end']:
+            return [], datetime.utcfromtimestamp(start)
+        return ([p for p in entry['points']
+                 if epoch(p['Timestamp']) >= start],
+                datetime.utcfromtimestamp(entry['end']))
+
+    def update(self, key, start, end, period, stored, fetched):
+        """Merge retrieved datapoints with the stored ones, saving the
+        complete periods. Returns all the datapoints ordered by time.
+        """
+        start = align(epoch(start), period)
+        end = epoch(end)
+        complete = max(start, align(end - self.settle, period))
+        points = {epoch(p['Timestamp']): p for p in stored}
+        points.update([(epoch(p['Timestamp']), p) for p in fetched])
+        points = [points[t] for t in sorted(points) if t >= start]
+        self.cache.save(
+            key, {'start': start, 'end': complete, 'points': [
+                p for p in points
+                if epoch(p['Timestamp']) + period <= complete]},
+            ttl=end - start + period)
+        return points
+
+
+def epoch(dt):
+    """Seconds since the epoch of a utc datetime, naive or aware."""
+    return calendar.timegm(dt.utctimetuple())
+
+
+def align(seconds, period):
+    return seconds - seconds % period
+
+
+stores = {}
+
+
+def open_store(path):
+    """A cache backend persisting entries with their own ttl at path.
+
+    A path naming a sqlite database or ``memory`` selects that backend,
+    otherwise entries are stored in a directory. Backends are shared by
+    path within the process.
+    """
+    store = stores.get(path)
+    if store is None:
+        cache_type = infer_cache_type(path)
+        if cache_type == 'file':
+            # the file backend rewrites every entry on each save
+            cache_type = 'directory'
+        store = stores.setdefault(path, backends.get(cache_type)(Bag(
+            cache=path, cache_period=0, cache_size=None)))
+    return store
+
+
+def get_datapoint_store(config):
+    """The datapoint store configured with ``metrics_cache``, if any."""
+    path = getattr(config, 'metrics_cache', None)
+    if not path:
+        return None
+    return DatapointStore(open_store(path))
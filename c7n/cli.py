@@ -34,6 +34,7 @@ except ImportError:
     def setproctitle(t):
         return None
 
+from c7n import cache
 from c7n.commands import schema_completer
 from c7n.utils import get_account_id_from_sts
 
@@ -96,10 +97,19 @@ def _default_options(p, blacklist=""):
     if 'cache' not in blacklist:
         p.add_argument(
             "-f", "--cache", default="~/.cache/cloud-custodian.cache",
-            help="Cache file (default %(default)s)")
+            help="Cache file, or directory for a per resource cache "
+                 "(default %(default)s)")
         p.add_argument(
             "--cache-period", default=15, type=int,
             help="Cache validity in minutes (default %(default)i)")
+        p.add_argument(
+            "--cache-type", default=None, choices=sorted(cache.backends.keys()),
+            help="Cache backend, inferred from the cache path by default")
+        p.add_argument(
+            "--resource-cache-period", action='append', default=[],
+            dest='cache_periods', type=_cache_period_pair,
+            metavar='RESOURCE=MINUTES',
+            help="Repeatable. Cache validity for a resource type")
     else:
         p.add_argument("--cache", default=None, help=argparse.SUPPRESS)
 
@@ -179,6 +189,32 @@ def _metrics_options(p):
         '--days', type=int, default=14,
         help='Number of days of history to consider (default: %(default)i)')
     p.add_argument('--period', type=int, default=60 * 24 * 24)
+    _metrics_cache_option(p)
+
+
+def _metrics_cache_option(p):
+    p.add_argument(
+        "--metrics-cache", default=None,
+        help="Directory, or sqlite database, persisting cloudwatch "
+             "datapoints across runs, so only new periods are retrieved")
+
+
+def _forecast_options(p):
+    """ Add options specific to forecast subcommand. """
+    _default_options(p, blacklist=['log-group', 'output-dir'])
+
+    p.add_argument(
+        '--days', type=int, default=7,
+        help='Number of days of transitions to show (default: %(default)i)')
+    _offhours_index_option(p)
+
+
+def _offhours_index_option(p):
+    p.add_argument(
+        "--offhours-index", default=None,
+        help="Directory, or sqlite database, persisting the next on/off "
+             "hour transitions of resources, so runs only retrieve the "
+             "resources due")
 
 
 def _logs_options(p):
@@ -238,6 +274,30 @@ def _key_val_pair(value):
     return value
 
 
+def _cache_period_pair(value):
+    """
+    Type checker for --resource-cache-period values of the form resource=minutes
+    """
+    try:
+        resource_type, minutes = value.split('=', 1)
+        return resource_type, int(minutes)
+    except ValueError:
+        msg = 'values must be of the form `resource=minutes`'
+        raise argparse.ArgumentTypeError(msg)
+
+
+def _rate_limit_pair(value):
+    """
+    Type checker for --api-rate-limit values of the form service=rate
+    """
+    try:
+        service, rate = value.split('=', 1)
+        return service, float(rate)
+    except ValueError:
+        msg = 'values must be of the form `service=calls-per-second`'
+        raise argparse.ArgumentTypeError(msg)
+
+
 def setup_parser():
     c7n_desc = "Cloud fleet management"
     parser = argparse.ArgumentParser(description=c7n_desc)
@@ -265,6 +325,12 @@ def setup_parser():
     metrics.set_defaults(command="c7n.commands.metrics_cmd")
     _metrics_options(metrics)
 
+    forecast_desc = "Show the offhours transitions policies expect"
+    forecast = subs.add_parser(
+        'forecast', description=forecast_desc, help=forecast_desc)
+    forecast.set_defaults(command="c7n.commands.forecast")
+    _forecast_options(forecast)
+
     version = subs.add_parser(
         'version', help="Display installed version of custodian")
     version.set_defaults(command='c7n.commands.version_cmd')
@@ -326,10 +392,42 @@ def setup_parser():
     run.set_defaults(command="c7n.commands.run")
     _default_options(run)
     _dryrun_option(run)
+    _metrics_cache_option(run)
+    _offhours_index_option(run)
     run.add_argument(
         "-m", "--metrics-enabled",
         default=False, action="store_true",
         help="Emit metrics to CloudWatch Metrics")
+    run.add_argument(
+        "--stream", default=False, action="store_true",
+        help="Filter resources a page at a time as they're described, "
+             "bounding memory use for large resource sets")
+    run.add_argument(
+        "-j", "--jobs", default=1, type=int,
+        help="Number of policies to execute concurrently (default %(default)i)")
+    run.add_argument(
+        "--executor", default="thread", choices=['thread', 'process'],
+        help="Concurrency backend when running with --jobs (default %(default)s)")
+    run.add_argument(
+        "--preserve-filter-order", action="store_true", default=False,
+        help="Apply filters in policy order, rather than cheapest first")
+    run.add_argument(
+        "--columnar", action="store_true", default=False,
+        help="Evaluate value filters over large resource sets a column at "
+             "a time, requires numpy")
+    run.add_argument(
+        "--no-filter-memo", action="store_true", default=False,
+        help="Evaluate filters for each policy, rather than sharing results "
+             "of identical filters across policies")
+    run.add_argument(
+        "--max-concurrency", default=16, type=int,
+        help="Upper bound on concurrent api calls per service, concurrency "
+             "adapts to throttling below it (default %(default)i)")
+    run.add_argument(
+        "--api-rate-limit", action='append', default=[],
+        dest='rate_limits', type=_rate_limit_pair,
+        metavar='SERVICE=RATE',
+        help="Repeatable. Max api calls per second to a service, per region")
 
     return parser
 
@@ -350,7 +448,8 @@ def main():
     if getattr(options, 'config', None) is not None:
         options.configs.append(options.config)
 
-    if options.subparser in ('report', 'logs', 'metrics', 'run'):
+    if options.subparser in (
+            'report', 'logs', 'metrics', 'forecast', 'run'):
         _default_region(options)
         _default_account_id(options)
 
@@ -13,7 +13,8 @@
 # limitations under the License.
 from __future__ import print_function
 
-from collections import Counter, defaultdict
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import as_completed
 from datetime import timedelta, datetime
 from functools import wraps
 import inspect
@@ -24,14 +25,23 @@ import pprint
 import sys
 import time
 
+from dateutil.tz import tzutc
 import yaml
 
+from c7n.executor import executor
 from c7n.policy import Policy, PolicyCollection, load as policy_load
 from c7n.reports import report as do_report
-from c7n.utils import Bag, dumps, load_file
-from c7n.manager import resources
+from c7n.utils import (
+    API_LIMITS, Bag, CLIENT_POOL, ClientPool, JMESPATH_CACHE, dumps,
+    load_file)
+from c7n.manager import FILTER_MEMO, resources
 from c7n.resources import load_resources
-from c7n import schema
+from c7n import cache, schema
+from c7n.filters import columnar
+from c7n.filters.iamaccess import POLICY_CHECKS
+from c7n.filters.related import RELATED_RESOURCES
+from c7n.filters.usage import RESOURCE_USAGE
+from c7n.resources.iam import IAM_INVENTORY
 
 
 log = logging.getLogger('custodian.commands')
@@ -204,19 +214,140 @@ def validate(options):
 
 @policy_command
 def run(options, policies):
+    groups = PolicyCollection(policies, options).plan()
+    jobs = getattr(options, 'jobs', 1) or 1
+    # clients are shared across concurrently executing policies
+    CLIENT_POOL.resize(jobs * ClientPool.max_connections)
+    API_LIMITS.configure(getattr(options, 'rate_limits', None), *[
+        p.execution_options.get('rate_limits') for p in policies])
+    if not getattr(options, 'no_filter_memo', False):
+        FILTER_MEMO.enable()
+    RELATED_RESOURCES.enable()
+    RESOURCE_USAGE.enable()
+    IAM_INVENTORY.enable()
+    if getattr(options, 'columnar', False) and columnar.numpy is None:
+        log.warning("numpy not available, columnar evaluation disabled")
+    try:
+        if jobs > 1 and len(groups) > 1:
+            exit_code = _run_concurrent(options, _schedule(groups), jobs)
+        else:
+            exit_code = max([
+                _run_policies(g, options.debug) for g in groups] or [0])
+    finally:
+        log.debug("shared filter results hits:%(hits)d misses:%(misses)d",
+                  FILTER_MEMO.summary())
+        FILTER_MEMO.reset()
+        log.debug("related resources hits:%(hits)d misses:%(misses)d",
+                  RELATED_RESOURCES.summary())
+        RELATED_RESOURCES.reset()
+        log.debug("resource usage scans hits:%(hits)d misses:%(misses)d",
+                  RESOURCE_USAGE.summary())
+        RESOURCE_USAGE.reset()
+        log.debug("iam inventory hits:%(hits)d misses:%(misses)d",
+                  IAM_INVENTORY.summary())
+        IAM_INVENTORY.reset()
+    for resource, counts in sorted(cache.stats.summary().items()):
+        log.debug(
+            "cache resource:%s hits:%d misses:%d bytes:%d",
+            resource, counts['hits'], counts['misses'], counts['bytes'])
+    for operation, counts in sorted(API_LIMITS.summary().items()):
+        log.debug(
+            "api operation:%s retries:%d throttles:%d",
+            operation, counts['retries'], counts['throttles'])
+    log.debug("jmespath cache size:%(size)d hits:%(hits)d misses:%(misses)d",
+              JMESPATH_CACHE.summary())
+    log.debug("policy checks size:%(size)d hits:%(hits)d misses:%(misses)d",
+              POLICY_CHECKS.summary())
+    if exit_code != 0:
+        sys.exit(exit_code)
+
+
+def _run_policies(policies, debug=False):
+    """Run a group of policies sharing a resource query, returning an exit code.
+    """
     exit_code = 0
     for policy in policies:
         try:
             policy()
         except Exception:
             exit_code = 2
-            if options.debug:
+            if debug:
                 raise
             log.exception(
                 "Error while executing policy %s, continuing" % (
                     policy.name))
-    if exit_code != 0:
-        sys.exit(exit_code)
+    # release the group's shared resources before moving on.
+    shared = getattr(policies[0].resource_manager, 'shared_query', None)
+    if shared is not None:
+        shared.release()
+    return exit_code
+
+
+def _run_policy_data(policy_data, debug=False):
+    """Process executor entry point, policies are rebuilt in the worker."""
+    load_resources()
+    policies = [Policy(data, options) for data, options in policy_data]
+    API_LIMITS.configure(
+        getattr(policies[0].options, 'rate_limits', None), *[
+            p.execution_options.get('rate_limits') for p in policies])
+    if not getattr(policies[0].options, 'no_filter_memo', False):
+        FILTER_MEMO.enable()
+    RELATED_RESOURCES.enable()
+    RESOURCE_USAGE.enable()
+    IAM_INVENTORY.enable()
+    return max([_run_policies(g, debug) for g in PolicyCollection(
+        policies, policies[0].options).plan()])
+
+
+def _schedule(groups):
+    """Order policy groups so consecutive groups target different services.
+
+    Groups are bucketed by region and service and then taken round robin
+    from each bucket, so api heavy policies against the same service
+    are spread out over the run rather than executing together.
+    """
+    buckets = OrderedDict()
+    for g in groups:
+        p = g[0]
+        service = getattr(
+            p.resource_manager.get_model(), 'service', p.resource_type)
+        buckets.setdefault((p.options.region, service), []).append(g)
+    ordered = []
+    while buckets:
+        for k in list(buckets):
+            ordered.append(buckets[k].pop(0))
+            if not buckets[k]:
+                del buckets[k]
+    return ordered
+
+
+def _run_concurrent(options, groups, jobs):
+    executor_type = getattr(options, 'executor', 'thread')
+    log.info(
+        "Running %d policy groups with %d %s workers",
+        len(groups), jobs, executor_type)
+    exit_code = 0
+    with executor(executor_type, max_workers=jobs) as w:
+        futures = {}
+        for g in groups:
+            if executor_type == 'process':
+                f = w.submit(
+                    _run_policy_data,
+                    [(p.data, p.options) for p in g], options.debug)
+            else:
+                f = w.submit(_run_policies, g, options.debug)
+            futures[f] = g
+        for f in as_completed(futures):
+            if f.exception():
+                exit_code = 2
+                if options.debug:
+                    raise f.exception()
+                log.error(
+                    "Error while executing policies %s\n%s",
+                    ", ".join([p.name for p in futures[f]]), f.exception())
+                continue
+            exit_code = max(exit_code, f.result())
+    return exit_code
 
 
 @policy_command
@@ -433,6 +564,30 @@ def metrics_cmd(options, policies):
     print(dumps(data, indent=2))
 
 
+@policy_command
+def forecast(options, policies):
+    from c7n.filters.offhours import Time, TransitionIndex
+
+    start = datetime.now(tzutc()).replace(minute=0, second=0, microsecond=0)
+    data = {}
+    for p in policies:
+        manager = p.resource_manager
+        for f in manager.filters:
+            if not isinstance(f, Time):
+                continue
+            index = f.get_index() or TransitionIndex(f, cache.NullCache(None))
+            if index.is_stale():
+                log.info('Indexing %s offhours', p)
+                index.update(
+                    manager.fetch_resources(manager.get_resource_query()),
+                    complete=True)
+                index.save()
+            data.setdefault(p.name, []).extend([
+                {'Time': t, 'Type': f.time_type, 'Resources': ids}
+                for t, ids in index.forecast(start, options.days * 24)])
+    print(dumps(data, indent=2))
+
+
 def version_cmd(options):
     from c7n.version import version
 
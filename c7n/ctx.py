@@ -13,6 +13,7 @@
 # limitations under the License.
 import time
 
+from c7n.executor import set_policy_context
 from c7n.output import FSOutput, MetricsOutput, CloudWatchLogOutput
 from c7n.utils import reset_session_cache
 
@@ -26,6 +27,7 @@ class ExecutionContext(object):
         self.session_factory = session_factory
         self.cloudwatch_logs = None
         self.start_time = None
+        self.previous_policy = None
 
         metrics_enabled = getattr(options, 'metrics_enabled', None)
         factory = MetricsOutput.select(metrics_enabled)
@@ -48,6 +50,7 @@ class ExecutionContext(object):
             return self.output.root_dir
 
     def __enter__(self):
+        self.previous_policy = set_policy_context(self.policy)
         if self.output:
             self.output.__enter__()
         if self.cloudwatch_logs:
@@ -57,10 +60,12 @@ class ExecutionContext(object):
 
     def __exit__(self, exc_type=None, exc_value=None, exc_traceback=None):
         self.metrics.flush()
-        # clear policy execution thread local session cache
-        reset_session_cache()
+        # clear policy execution thread local session cache, and the
+        # policy's pooled clients, leaving those of concurrent policies
+        reset_session_cache(self.session_factory)
         if self.cloudwatch_logs:
             self.cloudwatch_logs.__exit__(exc_type, exc_value, exc_traceback)
             self.cloudwatch_logs = None
         if self.output:
             self.output.__exit__(exc_type, exc_value, exc_traceback)
+        set_policy_context(self.previous_policy)
@@ -11,7 +11,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import jmespath
+from c7n.utils import jmespath_compile, jmespath_search
 
 
 class CloudWatchEvents(object):
@@ -90,7 +90,7 @@ class CloudWatchEvents(object):
         if k in cls.trail_events:
             v = dict(cls.trail_events[k])
             if isinstance(v['ids'], basestring):
-                v['ids'] = e = jmespath.compile('detail.%s' % v['ids'])
+                v['ids'] = e = jmespath_compile('detail.%s' % v['ids'])
                 cls.trail_events[k]['ids'] = e
             return v
 
@@ -117,7 +117,7 @@ class CloudWatchEvents(object):
             id_query = e.get('ids')
             if not id_query:
                 raise ValueError("No id query configured")
-            resource_ids = jmespath.search(
+            resource_ids = jmespath_search(
                 id_query, event.get('detail', {}))
             if resource_ids:
                 break
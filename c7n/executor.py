@@ -12,12 +12,29 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from concurrent.futures import (
-    ProcessPoolExecutor, ThreadPoolExecutor)
+from botocore.exceptions import ClientError
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor
 
 from c7n.registry import PluginRegistry
 
+import logging
 import threading
+import time
+
+log = logging.getLogger('custodian.executor')
+
+THROTTLE_CODES = frozenset((
+    'Throttled',
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'SlowDown'))
 
 
 class ExecutorRegistry(PluginRegistry):
@@ -39,6 +56,30 @@ def executor(name, **kw):
     return factory(**kw)
 
 
+class ThreadPoolExecutor(futures.ThreadPoolExecutor):
+    """Thread pool running submitted calls in the submitter's policy context.
+
+    The log records of a policy's worker threads are thereby attributed
+    to the policy, see :func:`set_policy_context`.
+    """
+
+    def submit(self, fn, *args, **kw):
+        policy = get_policy_context()
+        if policy is not None:
+            fn = _in_policy_context(policy, fn)
+        return super(ThreadPoolExecutor, self).submit(fn, *args, **kw)
+
+
+def _in_policy_context(policy, fn):
+    def run(*args, **kw):
+        previous = set_policy_context(policy)
+        try:
+            return fn(*args, **kw)
+        finally:
+            set_policy_context(previous)
+    return run
+
+
 class MainThreadExecutor(object):
     """ For running tests.
 
@@ -104,5 +145,157 @@ class MainThreadFuture(object):
         return fn(self)
 
 
+class ConcurrencyController(object):
+    """Adaptive limit on concurrent api calls to a service endpoint.
+
+    The limit grows additively as calls succeed and is cut
+    multiplicatively when the service throttles (AIMD), converging on
+    the concurrency an api tolerates. Throttles within ``cooldown``
+    seconds of a decrease are treated as part of the same congestion
+    event, so a burst of errors from in flight calls only backs off once.
+    """
+
+    def __init__(self, initial=2, minimum=1, maximum=16,
+                 increase=1.0, decrease=0.5, cooldown=1.0):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.active = 0
+        self.throttles = 0
+        self.last_decrease = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.active >= int(self.limit):
+                self.condition.wait()
+            self.active += 1
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def success(self):
+        with self.condition:
+            # roughly one more slot per limit's worth of successful calls
+            self.limit = min(
+                self.maximum, self.limit + self.increase / self.limit)
+            self.condition.notify_all()
+
+    def throttled(self):
+        with self.condition:
+            self.throttles += 1
+            now = time.time()
+            if now - self.last_decrease < self.cooldown:
+                return
+            self.last_decrease = now
+            self.limit = max(self.minimum, self.limit * self.decrease)
+        log.debug("Throttled, reducing concurrency to %d", int(self.limit))
+
+    def start(self, initial):
+        """Raise the limit to a caller's initial concurrency.
+
+        Only until the api throttles, from then on the limit learnt
+        applies to all callers.
+        """
+        with self.condition:
+            if self.throttles:
+                return
+            self.limit = max(self.limit, float(min(initial, self.maximum)))
+            self.condition.notify_all()
+
+    def run(self, func, *args, **kw):
+        """Invoke func within the limit, adjusting it by the outcome."""
+        self.acquire()
+        previous = getattr(_local, 'controller', None)
+        _local.controller = self
+        try:
+            result = func(*args, **kw)
+        except ClientError as e:
+            if e.response['Error']['Code'] in THROTTLE_CODES:
+                self.throttled()
+            raise
+        finally:
+            _local.controller = previous
+            self.release()
+        self.success()
+        return result
+
+
+class BoundedController(object):
+    """A caller's use of a shared controller, capped at its own maximum.
+
+    Calls are subject to the shared controller's limit, and at most
+    ``maximum`` of the caller's calls are made concurrently.
+    """
+
+    def __init__(self, controller, maximum):
+        self.controller = controller
+        self.maximum = max(1, min(maximum, controller.maximum))
+        self.semaphore = threading.Semaphore(self.maximum)
+
+    def run(self, func, *args, **kw):
+        with self.semaphore:
+            return self.controller.run(func, *args, **kw)
+
+
+_local = threading.local()
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_policy_context():
+    """The policy the current thread is executing, if any."""
+    return getattr(_local, 'policy', None)
+
+
+def set_policy_context(policy):
+    """Set the policy the current thread executes, returning the previous.
+
+    Inherited by the calls the thread submits to a :class:`ThreadPoolExecutor`.
+    """
+    previous = getattr(_local, 'policy', None)
+    _local.policy = policy
+    return previous
+
+
+def get_controller(key, initial=2, max_workers=None, **kw):
+    """Get the process wide concurrency controller for a key.
+
+    Keys are (account, region, service), so all policies and resource
+    types hitting the same api share what's been learnt about its limits.
+    Each caller's initial concurrency applies until the api throttles,
+    and with ``max_workers`` the caller's calls are capped at it.
+    """
+    with _controllers_lock:
+        controller = _controllers.get(key)
+        if controller is None:
+            controller = _controllers[key] = ConcurrencyController(
+                initial, **kw)
+    controller.start(initial)
+    if max_workers is not None:
+        return BoundedController(controller, max_workers)
+    return controller
+
+
+def reset_controllers():
+    with _controllers_lock:
+        _controllers.clear()
+
+
+def notify_throttle(code):
+    """Signal a throttled api call to the controller of the current task.
+
+    Called by retry loops which would otherwise swallow the error.
+    """
+    controller = getattr(_local, 'controller', None)
+    if controller is not None and code in THROTTLE_CODES:
+        controller.throttled()
+
+
 executors = ExecutorRegistry('executor')
 executors.load_plugins()
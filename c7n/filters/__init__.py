@@ -13,6 +13,9 @@
 # limitations under the License.
 from .core import (
     ANNOTATION_KEY,
+    COST_MEMORY,
+    COST_BATCH_API,
+    COST_RESOURCE_API,
     FilterValidationError,
     OPERATORS,
     FilterRegistry,
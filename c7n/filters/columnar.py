@@ -0,0 +1,205 @@
+# Copyright 2017 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Columnar evaluation of value filters over large resource sets.
+
+Rather than matching each resource in turn, the value a filter's key
+references is extracted once per resource into a column, which is then
+evaluated as a whole.
+
+- numbers, sizes and timezone aware datetimes (as int64 microseconds)
+  are compared with vectorized numpy operations.
+- other hashable values (strings, None, booleans) are interned into
+  categorical codes, the filter's predicate is evaluated once per
+  distinct value and mapped back over the codes.
+- unhashable values (lists, dicts) are matched a row at a time.
+
+Results are identical to the row at a time path, including annotations.
+Requires numpy, enabled with the ``columnar`` option.
+"""
+from datetime import datetime
+
+from dateutil.tz import tzutc
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from c7n.filters.core import ValueFilter, ANNOTATION_KEY
+from c7n.utils import set_annotation
+
+# Sets smaller than this aren't worth building columns for.
+MIN_RESOURCES = 1000
+
+# Integers beyond this lose precision as float64.
+MAX_EXACT = 2 ** 53
+
+NUMBERS = (int, long, float, bool)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=tzutc())
+
+UFUNCS = {
+    'eq': 'equal',
+    'equal': 'equal',
+    'ne': 'not_equal',
+    'not-equal': 'not_equal',
+    'gt': 'greater',
+    'greater-than': 'greater',
+    'ge': 'greater_equal',
+    'gte': 'greater_equal',
+    'lt': 'less',
+    'less-than': 'less',
+    'le': 'less_equal',
+    'lte': 'less_equal'}
+
+
+def supported(f):
+    """Whether the filter can be evaluated over columns."""
+    return numpy is not None and type(f) is ValueFilter
+
+
+def process(f, resources):
+    """Filter resources with a value filter, a column at a time."""
+    if f.data.get('value_type') == 'resource_count':
+        return f.process(resources)
+    if f._matcher is None:
+        f.compile()
+    mask = match(f, [f._getter(r) for r in resources])
+    results = [resources[idx] for idx in numpy.flatnonzero(mask)]
+    if f.annotate:
+        for r in results:
+            set_annotation(r, ANNOTATION_KEY, f.k)
+    return results
+
+
+def match(f, values):
+    """Boolean mask of the values (a column) matching the filter."""
+    mask = numpy.zeros(len(values), dtype=bool)
+    pending = numpy.ones(len(values), dtype=bool)
+
+    vectorized = _get_operation(f)
+    if vectorized is not None:
+        ufunc, sentinel, swap = vectorized
+        if f.vtype is None:
+            column, valid = _numbers(values)
+        elif f.vtype == 'size':
+            column, valid = _sizes(values)
+        else:
+            column, valid = _datetimes(values)
+        if valid.any():
+            if swap:
+                matched = ufunc(sentinel, column[valid])
+            else:
+                matched = ufunc(column[valid], sentinel)
+            mask[valid] = matched
+            pending &= ~valid
+
+    if pending.any():
+        _match_categorical(f._predicate, values, mask, pending)
+    return mask
+
+
+def _get_operation(f):
+    """The filter's vectorized operator, sentinel and if the sentinel is
+    the left operand, or None if it can't be vectorized.
+    """
+    name = UFUNCS.get(f.op)
+    if name is None:
+        return None
+    ufunc = getattr(numpy, name)
+    if f.vtype in (None, 'size'):
+        if type(f.v) not in NUMBERS or not _exact(f.v):
+            return None
+        return ufunc, f.v, False
+    elif f.vtype not in ('age', 'expiration'):
+        return None
+    # conversion returns (sentinel, value) for the operator's (value,
+    # sentinel) arguments, with age comparisons reversed.
+    left, right = f._convert(datetime.now(tz=tzutc()))
+    if f.vtype == 'age':
+        sentinel, swap = right, True
+    else:
+        sentinel, swap = left, False
+    sentinel = _epoch(sentinel)
+    if sentinel is None:
+        return None
+    return ufunc, sentinel, swap
+
+
+def _exact(v):
+    return type(v) is float or -MAX_EXACT <= v <= MAX_EXACT
+
+
+def _numbers(values):
+    valid = [type(v) in NUMBERS and _exact(v) for v in values]
+    column = numpy.array(
+        [ok and v or 0 for v, ok in zip(values, valid)],
+        dtype=numpy.float64)
+    return column, numpy.array(valid, dtype=bool)
+
+
+def _size(v):
+    try:
+        return len(v)
+    except TypeError:
+        return 0
+
+
+def _sizes(values):
+    return (numpy.array(map(_size, values), dtype=numpy.int64),
+            numpy.ones(len(values), dtype=bool))
+
+
+def _epoch(dt):
+    """Microseconds since the epoch of a timezone aware datetime, or
+    None for anything else.
+    """
+    if not isinstance(dt, datetime):
+        return None
+    try:
+        delta = dt - EPOCH
+    except TypeError:
+        return None
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _datetimes(values):
+    epochs = map(_epoch, values)
+    valid = numpy.array([e is not None for e in epochs], dtype=bool)
+    column = numpy.array(
+        [e or 0 for e in epochs], dtype=numpy.int64)
+    return column, valid
+
+
+def _match_categorical(predicate, values, mask, pending):
+    """Evaluate the predicate once per distinct value."""
+    index = {}
+    uniques = []
+    rows = numpy.flatnonzero(pending)
+    codes = numpy.zeros(len(rows), dtype=numpy.intp)
+    for pos, idx in enumerate(rows):
+        v = values[idx]
+        try:
+            code = index.setdefault((type(v), v), len(uniques))
+        except TypeError:
+            mask[idx] = predicate(v)
+            codes[pos] = -1
+            continue
+        if code == len(uniques):
+            uniques.append(v)
+        codes[pos] = code
+    table = numpy.array(map(predicate, uniques), dtype=bool)
+    hashed = codes >= 0
+    mask[rows[hashed]] = table[codes[hashed]]
@@ -17,25 +17,30 @@ Resource Filtering Logic
 
 from datetime import datetime, timedelta
 import fnmatch
+import functools
 import logging
 import operator
 import re
 
 from dateutil.tz import tzutc
-from dateutil.parser import parse
 import jmespath
 import ipaddress
 
 from c7n.executor import ThreadPoolExecutor
 from c7n.registry import PluginRegistry
 from c7n.resolver import ValuesFrom
-from c7n.utils import set_annotation, type_schema, parse_cidr
+from c7n.utils import (
+    set_annotation, type_schema, parse_cidr, get_tag_value, tag_map,
+    jmespath_compile, jmespath_search, parse_date)
 
 
 class FilterValidationError(Exception):
     pass
 
 
+# Keys which are a plain path of jmespath fields, ie. State.Name
+FIELD_PATH = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$')
+
 # Matching filters annotate their key onto objects
 ANNOTATION_KEY = "MatchedFilters"
 
@@ -62,6 +67,18 @@ def operator_ni(x, y):
     return x not in y
 
 
+def _member_in(members, x, y):
+    try:
+        return x in members
+    except TypeError:
+        # unhashable values fall back to comparing with each member
+        return x in y
+
+
+def _member_ni(members, x, y):
+    return not _member_in(members, x, y)
+
+
 OPERATORS = {
     'eq': operator.eq,
     'equal': operator.eq,
@@ -133,6 +150,12 @@ class FilterRegistry(PluginRegistry):
                     self.plugin_type, data))
 
 
+# Filter cost classes, and-ed filters are run cheapest first.
+COST_MEMORY = 0         # evaluated against the resource data
+COST_BATCH_API = 1      # a fixed number of api calls for the resource set
+COST_RESOURCE_API = 2   # api calls per resource
+
+
 # Really should be an abstract base class (abc) or
 # zope.interface
 
@@ -146,6 +169,24 @@ class Filter(object):
     permissions = ()
     schema = {'type': 'object'}
 
+    # Filters which don't declare a cost are assumed to be expensive, so
+    # that they're never moved ahead of the filters they follow.
+    cost = COST_RESOURCE_API
+
+    # Filters whose results depend on annotations made by the filters
+    # before them must keep their position.
+    reorderable = True
+
+    # Filters whose result for a resource depends on the rest of the
+    # resource set, ie. grouping, ranking or counting resources, need the
+    # complete set and keep their position.
+    barrier = False
+
+    # Filters whose result depends only on the resource and the filter's
+    # data, with no side effects besides annotating the resource, can
+    # share their results across the policies of a run.
+    shareable = False
+
     def __init__(self, data, manager=None):
         self.data = data
         self.manager = manager
@@ -157,6 +198,33 @@ class Filter(object):
         """validate filter config, return validation error or self"""
         return self
 
+    def is_barrier(self):
+        """Whether the filter needs the complete resource set.
+
+        When streaming resources a page at a time, filters before the
+        first barrier process each page, the rest process the
+        accumulated results.
+        """
+        return self.barrier
+
+    def get_cost(self):
+        return self.cost
+
+    def is_reorderable(self):
+        return self.reorderable
+
+    def is_shareable(self):
+        return self.shareable and not self.is_barrier()
+
+    def scope_resources(self):
+        """Resources the filter restricts the policy to, or None.
+
+        A filter able to retrieve the only resources it could match more
+        cheaply than listing them all, ie. by id from an index, returns
+        them here. They're still processed by the policy's filters.
+        """
+        return None
+
     def process(self, resources, event=None):
         """ Bulk process resources and return filtered set."""
         return filter(self, resources)
@@ -182,14 +250,34 @@ class Or(Filter):
                 return True
         return False
 
+    def is_barrier(self):
+        return any([f.is_barrier() for f in self.filters])
+
+    def get_cost(self):
+        return max([f.get_cost() for f in self.filters] or [COST_MEMORY])
+
+    def is_reorderable(self):
+        return all([f.is_reorderable() for f in self.filters])
+
+    def is_shareable(self):
+        return all([f.is_shareable() for f in self.filters])
+
     def process_set(self, resources, event):
-        resource_type = self.manager.get_model()
-        resource_map = {r[resource_type.id]: r for r in resources}
-        results = set()
+        # Each filter only sees the resources not yet matched, except
+        # barriers which need the complete set. Resources are tracked by
+        # identity, as ids aren't necessarily unique (ie. across regions).
+        matched = set()
+        remaining = resources
         for f in self.filters:
-            results = results.union([
-                r[resource_type.id] for r in f.process(resources, event)])
-        return [resource_map[r_id] for r_id in results]
+            if f.is_barrier():
+                candidates = resources
+            elif not remaining:
+                continue
+            else:
+                candidates = remaining
+            matched.update(map(id, f.process(candidates, event)))
+            remaining = [r for r in remaining if id(r) not in matched]
+        return [r for r in resources if id(r) in matched]
 
 
 class And(Filter):
@@ -198,12 +286,28 @@ class And(Filter):
         super(And, self).__init__(data)
         self.registry = registry
         self.filters = registry.parse(self.data.values()[0], manager)
+        self.manager = manager
 
     def process(self, resources, events=None):
-        for f in self.filters:
+        filters = self.filters
+        if self.manager:
+            filters = self.manager.get_filter_order(filters)
+        for f in filters:
             resources = f.process(resources, events)
         return resources
 
+    def is_barrier(self):
+        return any([f.is_barrier() for f in self.filters])
+
+    def get_cost(self):
+        return max([f.get_cost() for f in self.filters] or [COST_MEMORY])
+
+    def is_reorderable(self):
+        return all([f.is_reorderable() for f in self.filters])
+
+    def is_shareable(self):
+        return all([f.is_shareable() for f in self.filters])
+
 
 class Not(Filter):
 
@@ -228,17 +332,26 @@ class Not(Filter):
                 return True
         return False
 
-    def process_set(self, resources, event):
-        resource_type = self.manager.get_model()
-        resource_map = {r[resource_type.id]: r for r in resources}
+    def is_barrier(self):
+        return any([f.is_barrier() for f in self.filters])
 
-        for f in self.filters:
-            resources = f.process(resources, event)
+    def get_cost(self):
+        return max([f.get_cost() for f in self.filters] or [COST_MEMORY])
+
+    def is_reorderable(self):
+        return all([f.is_reorderable() for f in self.filters])
 
-        before = set(resource_map.keys())
-        after = set([r[resource_type.id] for r in resources])
-        results = before - after
-        return [resource_map[r_id] for r_id in results]
+    def is_shareable(self):
+        return all([f.is_shareable() for f in self.filters])
+
+    def process_set(self, resources, event):
+        matched = resources
+        for f in self.filters:
+            if not matched:
+                break
+            matched = f.process(matched, event)
+        matched = set(map(id, matched))
+        return [r for r in resources if id(r) not in matched]
 
 
 class ValueFilter(Filter):
@@ -246,6 +359,10 @@ class ValueFilter(Filter):
     """
     expr = None
     op = v = vtype = None
+    _matcher = _getter = _convert = _predicate = None
+    # current time of the process call, age and expiration sentinels are
+    # relative to it rather than to when the filter was compiled.
+    _now = None
 
     schema = {
         'type': 'object',
@@ -270,6 +387,8 @@ class ValueFilter(Filter):
             'op': {'enum': OPERATORS.keys()}}}
 
     annotate = True
+    cost = COST_MEMORY
+    shareable = True
 
     def _validate_resource_count(self):
         """ Specific validation for `resource_count` type
@@ -299,6 +418,7 @@ class ValueFilter(Filter):
 
     def validate(self):
         if len(self.data) == 1:
+            self.compile()
             return self
 
         # `resource_count` requires a slightly different schema than the rest of
@@ -323,8 +443,41 @@ class ValueFilter(Filter):
                 except re.error as e:
                     raise FilterValidationError(
                         "Invalid regex: %s %s" % (e, self.data))
+        # values from external sources are resolved on first use
+        if 'value_from' not in self.data:
+            self.compile()
         return self
 
+    def is_barrier(self):
+        return self.data.get('value_type') == 'resource_count'
+
+    def get_cost(self):
+        # Only plain value filters evaluate in memory, subclasses getting
+        # their values otherwise, ie. from api calls, are assumed to be
+        # expensive unless they declare a cost.
+        for klass in type(self).__mro__:
+            if klass is ValueFilter:
+                break
+            if 'cost' in vars(klass):
+                return klass.cost
+            if any([m in vars(klass) for m in (
+                    'process', '__call__', 'get_resource_value')]):
+                return Filter.cost
+        return self.cost
+
+    def is_reorderable(self):
+        # matching on another filter's annotations, ie. c7n:MatchedFilters
+        # or the datapoints of the metrics filter under c7n.metrics
+        key = self.data.get('key') or (
+            len(self.data) == 1 and self.data.keys()[0] or '')
+        return self.reorderable and not (
+            key.lstrip('"').startswith(('c7n:', 'c7n.')) or
+            'c7n:' in key or ANNOTATION_KEY in key)
+
+    def is_shareable(self):
+        return super(ValueFilter, self).is_shareable() and (
+            self.is_reorderable())
+
     def __call__(self, i):
         if self.data.get('value_type') == 'resource_count':
             return self.process(i)
@@ -342,29 +495,39 @@ class ValueFilter(Filter):
                 return resources
             return []
 
-        return super(ValueFilter, self).process(resources, event)
+        self._now = datetime.now(tz=tzutc())
+        try:
+            return super(ValueFilter, self).process(resources, event)
+        finally:
+            self._now = None
 
     def get_resource_value(self, k, i):
         if k.startswith('tag:'):
-            tk = k.split(':', 1)[1]
-            r = None
-            for t in i.get("Tags", []):
-                if t.get('Key') == tk:
-                    r = t.get('Value')
-                    break
+            r = get_tag_value(i, k.split(':', 1)[1])
         elif k in i:
             r = i.get(k)
         elif self.expr:
             r = self.expr.search(i)
         else:
-            self.expr = jmespath.compile(k)
+            self.expr = jmespath_compile(k)
             r = self.expr.search(i)
         return r
 
     def match(self, i):
-        if self.v is None and len(self.data) == 1:
+        if self._matcher is None:
+            self.compile()
+        return self._matcher(i)
+
+    def compile(self):
+        """Compile the filter into a predicate on a resource.
+
+        The key expression, value type sentinel and operator are resolved
+        once, rather than for each resource matched. Filters which change
+        their data after validation need to recompile.
+        """
+        if len(self.data) == 1:
             [(self.k, self.v)] = self.data.items()
-        elif self.v is None:
+        else:
             self.k = self.data.get('key')
             self.op = self.data.get('op')
             if 'value_from' in self.data:
@@ -374,40 +537,173 @@ class ValueFilter(Filter):
                 self.v = self.data.get('value')
             self.vtype = self.data.get('value_type')
 
-        if i is None:
-            return False
+        getter = self._compile_getter(self.k)
+        convert = self._compile_value_type(self.vtype, self.v)
+        if self.vtype in (None, 'normalize', 'integer', 'size', 'cidr_size'):
+            # the resource value is compared to the unconverted sentinel
+            op = self._compile_op(self.op, self.v)
+        else:
+            op = self.op and OPERATORS[self.op] or None
+        empty_in = self.op in ('in', 'not-in')
+        raw = self.v
+
+        def predicate(r):
+            if empty_in and r is None:
+                r = ()
+            if convert is not None:
+                v, r = convert(r)
+            else:
+                v = raw
+
+            if r is None and v == 'absent':
+                return True
+            elif r is not None and v == 'present':
+                return True
+            elif v == 'not-null' and r:
+                return True
+            elif v == 'empty' and not r:
+                return True
+            elif op is not None:
+                try:
+                    return op(r, v)
+                except TypeError:
+                    return False
+            return r == raw
 
-        # value extract
-        r = self.get_resource_value(self.k, i)
+        def matcher(i):
+            if i is None:
+                return False
+            return predicate(getter(i))
 
-        if self.op in ('in', 'not-in') and r is None:
-            r = ()
+        self._getter = getter
+        self._convert = convert
+        self._predicate = predicate
+        self._matcher = matcher
 
-        # value type conversion
-        if self.vtype is not None:
-            v, r = self.process_value_type(self.v, r)
-        else:
-            v = self.v
-
-        # Value match
-        if r is None and v == 'absent':
-            return True
-        elif r is not None and v == 'present':
-            return True
-        elif v == 'not-null' and r:
-            return True
-        elif v == 'empty' and not r:
-            return True
-        elif self.op:
-            op = OPERATORS[self.op]
+    def _compile_getter(self, k):
+        if k is None or (type(self).get_resource_value.__func__ is not
+                         ValueFilter.get_resource_value.__func__):
+            return functools.partial(self.get_resource_value, k)
+        if k.startswith('tag:'):
+            tk = k.split(':', 1)[1]
+
+            def get_tag(i):
+                return tag_map(i).get(tk)
+            return get_tag
+
+        if FIELD_PATH.match(k):
+            fields = k.split('.')
+
+            def get_field(i):
+                if k in i:
+                    return i.get(k)
+                for f in fields:
+                    if not isinstance(i, dict):
+                        return None
+                    i = i.get(f)
+                return i
+            return get_field
+
+        try:
+            expr = jmespath_compile(k)
+        except jmespath.exceptions.ParseError:
+            # keys which aren't expressions can still be direct lookups
+            expr = None
+
+        def get_value(i):
+            if k in i:
+                return i.get(k)
+            elif expr is None:
+                return jmespath_search(k, i)
+            return expr.search(i)
+        return get_value
+
+    def _compile_value_type(self, vtype, sentinel):
+        """Value type conversion with the sentinel pre-processed."""
+        if vtype is None:
+            return None
+        if (type(self).process_value_type.__func__ is not
+                ValueFilter.process_value_type.__func__):
+            return functools.partial(self.process_value_type, sentinel)
+
+        if vtype in ('age', 'expiration'):
+            get_sentinel = self._compile_date_sentinel(vtype, sentinel)
+
+        if vtype == 'age':
+            def convert_age(value):
+                now, sentinel = get_sentinel()
+                if not isinstance(value, datetime):
+                    try:
+                        value = parse_date(value, default=now)
+                    except (AttributeError, TypeError):
+                        value = 0
+                return value, sentinel
+            return convert_age
+        elif vtype == 'expiration':
+            def convert_expiration(value):
+                now, sentinel = get_sentinel()
+                if not isinstance(value, datetime):
+                    value = parse_date(value, default=now)
+                return sentinel, value
+            return convert_expiration
+        elif vtype == 'cidr':
+            s = parse_cidr(sentinel)
+
+            def convert_cidr(value):
+                v = parse_cidr(value)
+                if (isinstance(s, ipaddress._BaseAddress) and
+                        isinstance(v, ipaddress._BaseNetwork)):
+                    return v, s
+                return s, v
+            return convert_cidr
+        return functools.partial(self.process_value_type, sentinel)
+
+    def _compile_date_sentinel(self, vtype, days):
+        """Function returning the current time and the age or expiration
+        sentinel relative to it.
+
+        The time is that of the current process call, falling back to the
+        time of the match when the filter is called outside of one, the
+        sentinel is only recomputed when the time changes.
+        """
+        cache = [None, days]
+        if not isinstance(days, datetime):
+            delta = timedelta(days)
+            if vtype == 'age':
+                delta = -delta
+
+        def get_sentinel():
+            now = self._now or datetime.now(tz=tzutc())
+            if cache[0] != now:
+                cache[0] = now
+                if not isinstance(days, datetime):
+                    cache[1] = now + delta
+            return cache
+        return get_sentinel
+
+    @staticmethod
+    def _compile_op(op_name, value):
+        """Operator function, specialized for a constant value if possible."""
+        if not op_name:
+            return None
+        if op_name == 'regex' and isinstance(value, basestring):
+            pattern = re.compile(value, flags=re.IGNORECASE)
+            return lambda r, v: (
+                isinstance(r, basestring) and bool(pattern.match(r)))
+        elif op_name == 'glob' and isinstance(value, basestring):
+            pattern = re.compile(fnmatch.translate(value))
+            return lambda r, v: (
+                isinstance(r, basestring) and pattern.match(r) is not None)
+        elif op_name in ('in', 'ni', 'not-in') and isinstance(
+                value, (list, tuple)):
             try:
-                return op(r, v)
+                members = frozenset(value)
             except TypeError:
-                return False
-        elif r == self.v:
-            return True
-
-        return False
+                return OPERATORS[op_name]
+            if op_name == 'in':
+                return functools.partial(_member_in, members)
+            return functools.partial(_member_ni, members)
+        return OPERATORS[op_name]
 
     def process_value_type(self, sentinel, value):
         if self.vtype == 'normalize' and isinstance(value, basestring):
@@ -433,7 +729,7 @@ class ValueFilter(Filter):
                 # EMR bug when testing ages in EMR. This is due to
                 # EMR not having more functionality.
                 try:
-                    value = parse(value, default=datetime.now(tz=tzutc()))
+                    value = parse_date(value, default=datetime.now(tz=tzutc()))
 
                 except (AttributeError, TypeError):
                     value = 0
@@ -461,7 +757,7 @@ class ValueFilter(Filter):
                 sentinel = datetime.now(tz=tzutc()) + timedelta(sentinel)
 
             if not isinstance(value, datetime):
-                value = parse(value, default=datetime.now(tz=tzutc()))
+                value = parse_date(value, default=datetime.now(tz=tzutc()))
 
             return sentinel, value
         return sentinel, value
@@ -476,6 +772,8 @@ class AgeFilter(Filter):
     date_attribute = None
 
     schema = None
+    cost = COST_MEMORY
+    shareable = True
 
     def validate(self):
         if not self.date_attribute:
@@ -486,7 +784,7 @@ class AgeFilter(Filter):
     def get_resource_date(self, i):
         v = i[self.date_attribute]
         if not isinstance(v, datetime):
-            v = parse(v)
+            v = parse_date(v)
         if not v.tzinfo:
             v = v.replace(tzinfo=tzutc())
         return v
@@ -516,6 +814,8 @@ class EventFilter(ValueFilter):
     """Filter against a cloudwatch event associated to a resource type."""
 
     schema = type_schema('event', rinherit=ValueFilter.schema)
+    cost = COST_MEMORY
+    shareable = False
 
     def validate(self):
         if 'mode' not in self.manager.data:
@@ -14,7 +14,7 @@
 import itertools
 
 from c7n.utils import local_session, chunks, type_schema
-from .core import Filter
+from .core import Filter, COST_BATCH_API
 
 
 class HealthEventFilter(Filter):
@@ -35,6 +35,7 @@ class HealthEventFilter(Filter):
 
     permissions = ('health:DescribeEvents', 'health:DescribeAffectedEntities',
                    'health:DescribeEventDetails')
+    cost = COST_BATCH_API
 
     def process(self, resources, event=None):
         if not resources:
@@ -31,7 +31,10 @@ References
 - IAM Policy Reference - http://goo.gl/U0a06y
 
 """
+from collections import OrderedDict
+import hashlib
 import json
+import threading
 
 from c7n.filters import Filter
 from c7n.resolver import ValuesFrom
@@ -50,7 +53,7 @@ class CrossAccountAccessFilter(Filter):
     policy_attribute = 'Policy'
 
     def process(self, resources, event=None):
-        self.accounts = self.get_accounts()
+        self.accounts = frozenset(self.get_accounts())
         return super(CrossAccountAccessFilter, self).process(resources, event)
 
     def get_accounts(self):
@@ -69,12 +72,75 @@ class CrossAccountAccessFilter(Filter):
         p = self.get_resource_policy(r)
         if p is None:
             return False
-        violations = check_cross_account(p, self.accounts)
+        violations = POLICY_CHECKS.check(p, self.accounts)
         if violations:
             r['CrossAccountViolations'] = violations
             return True
 
 
+class PolicyChecks(object):
+    """Process wide least recently used cache of cross account checks.
+
+    Policies are keyed by a digest of their content, so identical
+    policies, common across templated resources, are parsed once and
+    checked once per set of allowed accounts.
+    """
+
+    max_size = 1024
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or self.max_size
+        self.lock = threading.Lock()
+        self.policies = OrderedDict()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def get_digest(policy):
+        if not isinstance(policy, basestring):
+            policy = json.dumps(policy, sort_keys=True)
+        if isinstance(policy, unicode):
+            policy = policy.encode('utf8')
+        return hashlib.sha1(policy).hexdigest()
+
+    def check(self, policy, allowed_accounts):
+        """Cross account violations of a policy, see check_cross_account.
+        """
+        digest = self.get_digest(policy)
+        accounts = frozenset(allowed_accounts)
+        with self.lock:
+            entry = self.policies.pop(digest, None)
+            if entry is not None:
+                self.policies[digest] = entry
+                if accounts in entry['checks']:
+                    self.hits += 1
+                    return list(entry['checks'][accounts])
+            self.misses += 1
+        if entry is None:
+            if isinstance(policy, basestring):
+                policy = json.loads(policy)
+            entry = {'policy': policy, 'checks': {}}
+        violations = check_cross_account(entry['policy'], accounts)
+        with self.lock:
+            entry = self.policies.setdefault(digest, entry)
+            entry['checks'][accounts] = violations
+            while len(self.policies) > self.max_size:
+                self.policies.popitem(last=False)
+        return list(violations)
+
+    def summary(self):
+        with self.lock:
+            return {'size': len(self.policies),
+                    'hits': self.hits, 'misses': self.misses}
+
+    def reset(self):
+        with self.lock:
+            self.policies.clear()
+            self.hits = self.misses = 0
+
+
+POLICY_CHECKS = PolicyChecks()
+
+
 def _account(arn):
     # we could try except but some minor runtime cost, basically flag
     # invalids values
@@ -85,6 +151,8 @@ def _account(arn):
 
 def check_cross_account(policy_text, allowed_accounts):
     """Find cross account access policy grant not explicitly allowed
+
+    The policy isn't modified, so parsed policies may be checked again.
     """
     if isinstance(policy_text, basestring):
         policy = json.loads(policy_text)
@@ -108,16 +176,18 @@ def check_cross_account(policy_text, allowed_accounts):
             violations.append(s)
             continue
 
+        principal = s['Principal']
         # Skip relays for events to sns
-        if 'Service' in s['Principal']:
-            s['Principal'].pop('Service')
-            if not s['Principal']:
+        if not isinstance(principal, basestring) and 'Service' in principal:
+            principal = dict(principal)
+            principal.pop('Service')
+            if not principal:
                 continue
 
-        assert len(s['Principal']) == 1, "Too many principals %s" % s
+        assert len(principal) == 1, "Too many principals %s" % s
 
         # At this point principal is required?
-        p = (isinstance(s['Principal'], basestring) and s['Principal'] or s['Principal']['AWS'])
+        p = (isinstance(principal, basestring) and principal or principal['AWS'])
 
         p = isinstance(p, basestring) and (p,) or p
         for pid in p:
@@ -16,7 +16,9 @@ CloudWatch Metrics suppport for resources
 """
 from concurrent.futures import as_completed
 from datetime import datetime, timedelta
+import math
 
+from c7n.cache import get_datapoint_store
 from c7n.filters import Filter, OPERATORS
 from c7n.utils import local_session, type_schema, chunks
 
@@ -48,6 +50,19 @@ class MetricsFilter(Filter):
     nor for resources to new to have existed the entire
     period. ie. being stopped for an ec2 intsance wouldn't lower the
     average cpu utilization, nor would
+
+    When the installed botocore supports GetMetricData, metrics are
+    retrieved for up to 100 resources per api call, otherwise a
+    GetMetricStatistics call is made per resource.
+
+    Retrieved datapoints are annotated on the resource under
+    ``c7n.metrics``, keyed by namespace, metric, statistic, period, days
+    and dimensions, so multiple metric filters in a policy don't collide.
+
+    With the ``metrics_cache`` option, datapoints of complete periods are
+    persisted across runs, and only the periods since the last run are
+    retrieved. This applies when the window spans multiple periods, the
+    window's start is then aligned to the period.
     """
 
     schema = type_schema(
@@ -66,11 +81,16 @@ class MetricsFilter(Filter):
            'percent-attr': {'type': 'string'},
            'required': ('value', 'name')})
 
-    permissions = ("cloudwatch:GetMetricStatistics",)
+    permissions = ("cloudwatch:GetMetricStatistics",
+                   "cloudwatch:GetMetricData")
 
     MAX_QUERY_POINTS = 50850
     MAX_RESULT_POINTS = 1440
 
+    # GetMetricData limits on queries and datapoints per call
+    MAX_DATA_QUERIES = 100
+    MAX_DATA_POINTS = 100800
+
     # Default per service, for overloaded services like ec2
     # we do type specific default namespace annotation
     # specifically AWS/EBS and AWS/EC2Spot
@@ -120,11 +140,25 @@ class MetricsFilter(Filter):
                 ns = self.DEFAULT_NAMESPACE[self.model.service]
         self.namespace = ns
 
+        # the datapoint store keeps whole periods, so it's only of use
+        # when the window spans multiple periods.
+        self.store = None
+        if self.period < duration.total_seconds():
+            self.store = get_datapoint_store(self.manager.config)
+
+        client = local_session(
+            self.manager.session_factory).client('cloudwatch')
+        self.batched = hasattr(client, 'get_metric_data')
+        if self.batched:
+            batch_size = self.get_batch_size(duration)
+        else:
+            batch_size = 50
+
         self.log.debug("Querying metrics for %d", len(resources))
         matched = []
         with self.executor_factory(max_workers=3) as w:
             futures = []
-            for resource_set in chunks(resources, 50):
+            for resource_set in chunks(resources, batch_size):
                 futures.append(
                     w.submit(self.process_resource_set, resource_set))
 
@@ -140,40 +174,160 @@ class MetricsFilter(Filter):
         return [{'Name': self.model.dimension,
                  'Value': resource[self.model.dimension]}]
 
+    def get_batch_size(self, duration):
+        """Resources per GetMetricData call, within its datapoint limit."""
+        points = max(1, int(math.ceil(
+            duration.total_seconds() / float(self.period))))
+        return max(1, min(self.MAX_DATA_QUERIES,
+                          self.MAX_DATA_POINTS // points))
+
+    def get_metric_key(self, dimensions):
+        return "%s.%s.%s.%s.%s.%s" % (
+            self.namespace, self.metric, self.statistics, self.period,
+            self.data.get('days', 14), ",".join(
+                ["%s=%s" % (d['Name'], d['Value']) for d in sorted(
+                    dimensions, key=lambda d: d['Name'])]))
+
+    def get_store_key(self, dimensions):
+        return self.store.get_key(
+            self.manager.config.account_id, self.manager.config.region,
+            self.namespace, self.metric, dimensions, [self.statistics],
+            self.period)
+
     def process_resource_set(self, resource_set):
         client = local_session(
             self.manager.session_factory).client('cloudwatch')
 
-        matched = []
+        # if we overload dimensions with multiple resources we get
+        # the statistics/average over those resources.
+        queries = []
         for r in resource_set:
-            # if we overload dimensions with multiple resources we get
-            # the statistics/average over those resources.
             dimensions = self.get_dimensions(r)
-            collected_metrics = r.setdefault('c7n.metrics', {})
-            # Note this annotation cache is policy scoped, not across
-            # policies, still the lack of full qualification on the key
-            # means multiple filters within a policy using the same metric
-            # across different periods or dimensions would be problematic.
-            key = "%s.%s.%s" % (self.namespace, self.metric, self.statistics)
-            if key not in collected_metrics:
-                collected_metrics[key] = client.get_metric_statistics(
-                    Namespace=self.namespace,
-                    MetricName=self.metric,
-                    Statistics=[self.statistics],
-                    StartTime=self.start,
-                    EndTime=self.end,
-                    Period=self.period,
-                    Dimensions=dimensions)['Datapoints']
-            if len(collected_metrics[key]) == 0:
+            queries.append((r, self.get_metric_key(dimensions), dimensions))
+        pending = [q for q in queries
+                   if q[1] not in q[0].setdefault('c7n.metrics', {})]
+
+        # with a datapoint store, only the periods missing from it are
+        # retrieved, resources are grouped by where their retrieval starts.
+        windows = {}
+        stored = {}
+        for q in pending:
+            if self.store is None:
+                windows.setdefault(self.start, []).append(q)
+                continue
+            stored[id(q)], start = self.store.get(
+                self.get_store_key(q[2]), self.start, self.period)
+            windows.setdefault(start, []).append(q)
+
+        for start, window in windows.items():
+            if self.batched:
+                results = self.get_metric_data(client, window, start)
+            else:
+                results = [
+                    self.get_metric_statistics(client, w[2], start)
+                    for w in window]
+            for q, datapoints in zip(window, results):
+                r, key, dimensions = q
+                if datapoints is None:
+                    continue
+                if self.store is not None:
+                    datapoints = self.store.update(
+                        self.get_store_key(dimensions), self.start, self.end,
+                        self.period, stored[id(q)], datapoints)
+                else:
+                    datapoints.sort(key=lambda d: d['Timestamp'])
+                r['c7n.metrics'][key] = datapoints
+
+        matched = []
+        for r, key, dimensions in queries:
+            datapoints = r['c7n.metrics'].get(key)
+            if not datapoints:
                 continue
             if self.data.get('percent-attr'):
                 rvalue = r[self.data.get('percent-attr')]
                 if self.data.get('attr-multiplier'):
                     rvalue = rvalue * self.data['attr-multiplier']
-                percent = (collected_metrics[key][0][self.statistics] /
-                           rvalue * 100)
+                percent = (datapoints[0][self.statistics] / rvalue * 100)
                 if self.op(percent, self.value):
                     matched.append(r)
-            elif self.op(collected_metrics[key][0][self.statistics], self.value):
+            elif self.op(datapoints[0][self.statistics], self.value):
                 matched.append(r)
         return matched
+
+    def get_metric_statistics(self, client, dimensions, start):
+        return client.get_metric_statistics(
+            Namespace=self.namespace,
+            MetricName=self.metric,
+            Statistics=[self.statistics],
+            StartTime=start,
+            EndTime=self.end,
+            Period=self.period,
+            Dimensions=dimensions)['Datapoints']
+
+    def get_metric_data(self, client, pending, start):
+        """Retrieve the datapoints of resources with GetMetricData.
+
+        Datapoints are converted to the GetMetricStatistics form, ordered
+        by timestamp. Results are paginated, with a query's datapoints
+        possibly spanning pages. Queries which error have None for their
+        datapoints, so their resources don't match.
+        """
+        queries = []
+        for idx, (r, key, dimensions) in enumerate(pending):
+            queries.append({
+                'Id': 'm%d' % idx,
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': self.namespace,
+                        'MetricName': self.metric,
+                        'Dimensions': dimensions},
+                    'Period': self.period,
+                    'Stat': self.statistics},
+                'ReturnData': True})
+
+        results = {}
+        failed = set()
+        params = dict(
+            MetricDataQueries=queries, StartTime=start, EndTime=self.end)
+        while True:
+            response = client.get_metric_data(**params)
+            for result in response.get('MetricDataResults', ()):
+                results.setdefault(result['Id'], []).extend(
+                    zip(result.get('Timestamps', ()),
+                        result.get('Values', ())))
+                if result.get('StatusCode') == 'InternalError':
+                    failed.add(result['Id'])
+            if not response.get('NextToken'):
+                break
+            params['NextToken'] = response['NextToken']
+
+        if failed:
+            self.log.warning(
+                "CW Retrieval error for %d resources" % len(failed))
+        datapoints = []
+        for q in queries:
+            if q['Id'] in failed:
+                datapoints.append(None)
+                continue
+            datapoints.append([
+                {'Timestamp': t, self.statistics: v}
+                for t, v in sorted(results.get(q['Id'], ()))])
+        return datapoints
+
+
+def get_datapoints(client, start, end, period, store=None, key=None, **params):
+    """Datapoints of a GetMetricStatistics query, ordered by timestamp.
+
+    Given a :class:`c7n.cache.DatapointStore` and the query's key in it,
+    only the periods missing from the store are retrieved.
+    """
+    stored = ()
+    fetch_start = start
+    if store is not None:
+        stored, fetch_start = store.get(key, start, period)
+    datapoints = client.get_metric_statistics(
+        StartTime=fetch_start, EndTime=end, Period=period,
+        **params)['Datapoints']
+    if store is not None:
+        return store.update(key, start, end, period, stored, datapoints)
+    return sorted(datapoints, key=lambda d: d['Timestamp'])
@@ -143,19 +143,27 @@ Options
 
 # note we have to module import for our testing mocks
 import datetime
+import json
 import logging
 from os.path import join
+import time
 
 from dateutil import zoneinfo
+from botocore.exceptions import ClientError
+from dateutil.tz import tzutc
 
-from c7n.filters import Filter, FilterValidationError
-from c7n.utils import type_schema, dumps
+from c7n.cache import open_store
+from c7n.filters import Filter, FilterValidationError, COST_MEMORY
+from c7n.utils import (
+    type_schema, dumps, get_tag_value, index_tags, local_session)
 
 log = logging.getLogger('custodian.offhours')
 
 
 class Time(Filter):
 
+    cost = COST_MEMORY
+
     schema = {
         'type': 'object',
         'properties': {
@@ -173,6 +181,13 @@ class Time(Filter):
     DEFAULT_TAG = "maid_offhours"
     DEFAULT_TZ = 'et'
 
+    # Listings of a resource type's tags, by resource model service and type
+    tag_queries = {
+        ('ec2', 'instance'): ('describe_tags', {'Filters': [
+            {'Name': 'resource-type', 'Values': ['instance']}]}),
+        ('autoscaling', 'autoScalingGroup'): ('describe_tags', {}),
+    }
+
     TZ_ALIASES = {
         'pdt': 'America/Los_Angeles',
         'pt': 'America/Los_Angeles',
@@ -214,6 +229,11 @@ class Time(Filter):
         self.parse_errors = []
         self.enabled_count = 0
 
+        # Verdicts by schedule value and the current hour by timezone,
+        # computed once per distinct value while processing resources.
+        self.verdicts = None
+        self.nows = None
+
     def validate(self):
         if self.get_tz(self.default_tz) is None:
             raise FilterValidationError(
@@ -224,7 +244,12 @@ class Time(Filter):
         return self
 
     def process(self, resources, event=None):
-        resources = super(Time, self).process(resources)
+        self.verdicts = {}
+        self.nows = {}
+        try:
+            resources = super(Time, self).process(resources)
+        finally:
+            self.verdicts = self.nows = None
         if self.parse_errors and self.manager and self.manager.log_dir:
             self.log.warning("parse errors %d", len(self.parse_errors))
             with open(join(
@@ -276,6 +301,31 @@ class Time(Filter):
         # dateutil.parser.parse to process: value='off=(m-f,1);' properly.
         # before this normalization, some cases would silently fail.
         value = ';'.join(filter(None, value.split(';')))
+        if self.verdicts is None:
+            matched, error = self.evaluate_schedule(value, time_type)
+        elif value in self.verdicts:
+            matched, error = self.verdicts[value]
+        else:
+            matched, error = self.verdicts[value] = self.evaluate_schedule(
+                value, time_type)
+
+        if error:
+            log.warning("%s on resource:%s value:%s", error, rid, value)
+            self.parse_errors.append((rid, value))
+        return matched
+
+    def evaluate_schedule(self, value, time_type):
+        """Whether a schedule matches the current time, and any error
+        parsing it.
+        """
+        schedule, tz, error = self.parse_schedule(value, time_type)
+        if error:
+            return False, error
+        return self.match(self.get_now(schedule['tz'], tz), schedule), None
+
+    def parse_schedule(self, value, time_type):
+        """The schedule and timezone of a normalized tag value, or an error.
+        """
         if self.parser.has_resource_schedule(value, time_type):
             schedule = self.parser.parse(value)
         elif self.parser.keys_are_valid(value):
@@ -290,21 +340,133 @@ class Time(Filter):
             schedule = None
 
         if schedule is None:
-            log.warning(
-                "Invalid schedule on resource:%s value:%s", rid, value)
-            self.parse_errors.append((rid, value))
-            return False
+            return None, None, "Invalid schedule"
 
         tz = self.get_tz(schedule['tz'])
         if not tz:
-            log.warning(
-                "Could not resolve tz on resource:%s value:%s", rid, value)
-            self.parse_errors.append((rid, value))
-            return False
+            return None, None, "Could not resolve tz"
+        return schedule, tz, None
 
+    def get_now(self, name, tz):
+        """The current hour in a timezone."""
+        if self.nows is not None and name in self.nows:
+            return self.nows[name]
         now = datetime.datetime.now(tz).replace(
             minute=0, second=0, microsecond=0)
-        return self.match(now, schedule)
+        if self.nows is not None:
+            self.nows[name] = now
+        return now
+
+    def get_resource_schedule(self, i):
+        """The resource's normalized schedule value, or None if it's not
+        scheduled, ie. untagged when opting in or opted out.
+        """
+        value = self.get_tag_value(i)
+        if value is False:
+            if not self.opt_out:
+                return None
+            value = ""
+        if value == 'off':
+            return None
+        return ';'.join(filter(None, value.split(';')))
+
+    def get_slots(self, value):
+        """The weekly (timezone, weekday, hour) slots a schedule matches."""
+        schedule, tz, error = self.parse_schedule(value, self.time_type)
+        if error:
+            return []
+        slots = set()
+        for item in schedule.get(self.time_type, ()):
+            for day in item.get('days') or ():
+                slots.add((schedule['tz'], day, item.get('hour')))
+        return sorted(slots)
+
+    def get_index(self):
+        """The transition index configured with ``offhours_index``, if any.
+        """
+        path = self.manager and getattr(
+            self.manager.config, 'offhours_index', None)
+        if not path:
+            return None
+        index = TransitionIndex(self, open_store(path))
+        index.load()
+        return index
+
+    def get_tag_values(self):
+        """Tags by resource id, from a listing of the resource type's tags.
+
+        None if the resource type has no such listing.
+        """
+        m = self.manager.get_model()
+        spec = self.tag_queries.get(
+            (getattr(m, 'service', None), getattr(m, 'type', None)))
+        if spec is None:
+            return None
+        op, params = spec
+        client = local_session(self.manager.session_factory).client(m.service)
+        tags = {}
+        for page in client.get_paginator(op).paginate(**params):
+            for t in page['Tags']:
+                tags.setdefault(t['ResourceId'], []).append(
+                    {'Key': t['Key'], 'Value': t['Value']})
+        return tags
+
+    def get_due_resources(self, ids):
+        """The resources of the given ids matching the policy's query.
+
+        None if they couldn't be retrieved.
+        """
+        manager = self.manager
+        query = manager.get_resource_query()
+        if not query:
+            return manager.get_resources(list(ids)) or None
+        m = manager.get_model()
+        if getattr(m, 'filter_name', None) and m.filter_type == 'list':
+            query = dict(query)
+            query[m.filter_name] = list(ids)
+            try:
+                resources = index_tags(
+                    manager.augment(manager.source.resources(query)))
+            except ClientError as e:
+                log.warning("offhours index resources not resolved: %s", e)
+                return None
+        else:
+            resources = manager.fetch_resources(query)
+        return [r for r in resources if r[m.id] in ids]
+
+    def scope_resources(self):
+        """Resources due a transition this hour, per the transition index.
+
+        Between rebuilds of the index from a complete listing, the index
+        is updated from a listing of the resource type's tags where there
+        is one, and only the resources due are retrieved, by id.
+        """
+        index = self.get_index()
+        if index is None:
+            return None
+        now = datetime.datetime.now(tzutc())
+        manager = self.manager
+        if not index.is_stale():
+            tags = self.get_tag_values()
+            if tags is not None:
+                index.update_tags(tags)
+                index.save()
+            ids = index.due(now)
+            if not ids:
+                return []
+            resources = self.get_due_resources(ids)
+            if resources is not None:
+                index.update(resources)
+                index.save()
+                return resources
+            log.warning(
+                "offhours index resources not found, rebuilding index")
+        resources = manager.fetch_resources(manager.get_resource_query())
+        index.update(resources, complete=True)
+        index.save()
+        ids = index.due(now)
+        id_key = manager.get_model().id
+        return [r for r in resources if r[id_key] in ids]
 
     def match(self, now, schedule):
         time = schedule.get(self.time_type, ())
@@ -317,12 +479,8 @@ class Time(Filter):
     def get_tag_value(self, i):
         """Get the resource's tag value specifying its schedule."""
         # Look for the tag, Normalize tag key and tag value
-        found = False
-        for t in i.get('Tags', ()):
-            if t['Key'].lower() == self.tag_key:
-                found = t['Value']
-                break
-        if found is False:
+        found = get_tag_value(i, self.tag_key, lower=True)
+        if found is None:
             return False
         # utf8, or do translate tables via unicode ord mapping
         value = found.lower().encode('utf8')
@@ -384,6 +542,117 @@ class OnHour(Time):
         return default
 
 
+class TransitionIndex(object):
+    """The weekly transition slots of a time filter's resources.
+
+    A slot is a (timezone, weekday, hour) a resource's schedule matches,
+    schedules repeat weekly so slots don't expire. The index is persisted
+    per account, region, resource type and filter, and rebuilt from a
+    complete listing every ``rebuild_period`` seconds, recomputing the
+    slots of resources whose schedule changed. In between it's updated
+    from listings of the resources' tags, and only the resources with a
+    slot in the current hour need to be retrieved.
+    """
+
+    rebuild_period = 60 * 60 * 24
+
+    def __init__(self, f, cache):
+        self.filter = f
+        self.cache = cache
+        self.built = None
+        self.values = {}
+        self.slots = {}
+        self.lookup = {}
+
+    def get_key(self):
+        manager = self.filter.manager
+        return {'resource': 'offhours',
+                'region': manager.config.region,
+                'account_id': manager.config.account_id,
+                'type': manager.type,
+                'filter': json.dumps(self.filter.data, sort_keys=True),
+                'query': json.dumps(
+                    manager.get_resource_query(), sort_keys=True)}
+
+    def load(self):
+        entry = self.cache.get(self.get_key())
+        if entry is None:
+            return
+        self.built = entry['built']
+        self.values = entry['values']
+        for rid, slots in entry['slots'].items():
+            self.set_slots(rid, slots)
+
+    def save(self):
+        self.cache.save(self.get_key(), {
+            'built': self.built, 'values': self.values, 'slots': self.slots},
+            ttl=self.rebuild_period * 7)
+
+    def is_stale(self):
+        return self.built is None or (
+            time.time() - self.built > self.rebuild_period)
+
+    def set_slots(self, rid, slots):
+        for slot in self.slots.pop(rid, ()):
+            self.lookup[slot].discard(rid)
+        slots = [tuple(slot) for slot in slots]
+        if slots:
+            self.slots[rid] = slots
+        for slot in slots:
+            self.lookup.setdefault(slot, set()).add(rid)
+
+    def update(self, resources, complete=False):
+        """Index resources, with a complete listing dropping any others."""
+        id_key = self.filter.manager.get_model().id
+        seen = set()
+        slots = {}
+        for r in resources:
+            rid = r[id_key]
+            seen.add(rid)
+            value = self.filter.get_resource_schedule(r)
+            if rid in self.values and self.values[rid] == value:
+                continue
+            self.values[rid] = value
+            if value is not None and value not in slots:
+                slots[value] = self.filter.get_slots(value)
+            self.set_slots(rid, value is not None and slots[value] or [])
+        if complete:
+            for rid in set(self.values).difference(seen):
+                del self.values[rid]
+                self.set_slots(rid, ())
+            self.built = time.time()
+
+    def update_tags(self, tags):
+        """Index resources from a listing of their tags by id.
+
+        Resources no longer listed are untagged, resources never tagged
+        aren't listed at all, so when opting out those not yet indexed
+        are only picked up by the next rebuild.
+        """
+        id_key = self.filter.manager.get_model().id
+        self.update([{id_key: rid, 'Tags': tags.get(rid, [])}
+                     for rid in set(tags).union(self.values)])
+
+    def due(self, now):
+        """Ids of the resources with a slot in the hour of a utc time."""
+        ids = set()
+        for name in set([slot[0] for slot in self.lookup]):
+            local = now.astimezone(self.filter.get_tz(name))
+            ids.update(self.lookup.get(
+                (name, local.weekday(), local.hour), ()))
+        return ids
+
+    def forecast(self, start, hours):
+        """Resources due by hour, for the hours from a utc time."""
+        results = []
+        for h in range(hours):
+            t = start + datetime.timedelta(hours=h)
+            ids = self.due(t)
+            if ids:
+                results.append((t, sorted(ids)))
+        return results
+
+
 class ScheduleParser(object):
     """Parses tag values for custom on/off hours schedules.
 
@@ -12,10 +12,106 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import importlib
+import threading
 
-import jmespath
+from c7n.utils import jmespath_search
 
-from .core import ValueFilter
+from .core import ValueFilter, COST_BATCH_API
+
+
+class RelatedResources(object):
+    """Related resources fetched by the filters of a run.
+
+    Filters matching on related resources, ie. the security groups or
+    subnets of a resource, look them up through this registry, keyed by
+    account, region, related resource type and source. Resources already
+    fetched for another filter or policy are reused, only ids not yet
+    seen are fetched, and a listing of all the resources of a type is
+    fetched once.
+
+    Only retained while enabled, ie. for the duration of ``custodian run``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.data = {}
+        self.hits = self.misses = 0
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        with self.lock:
+            self.enabled = False
+            self.data = {}
+            self.hits = self.misses = 0
+
+    def get_key(self, manager):
+        return (getattr(manager.config, 'account_id', None),
+                getattr(manager.config, 'region', None),
+                manager.type,
+                manager.data.get('source', 'describe'))
+
+    def get_entry(self, manager):
+        entry = {'resources': {}, 'missing': set(), 'complete': False}
+        if not self.enabled:
+            return entry
+        with self.lock:
+            return self.data.setdefault(self.get_key(manager), entry)
+
+    def get(self, manager, ids=None, fetch_threshold=None):
+        """Related resources by id.
+
+        Without ids all the resources of the manager's type are returned.
+        When the ids not yet seen number at least ``fetch_threshold``,
+        all the resources are listed rather than fetching those ids. Ids
+        not found are remembered as missing, unless none of the ids
+        fetched with them were found, as the fetch may have failed.
+        """
+        entry = self.get_entry(manager)
+        rid = manager.get_model().id
+        with self.lock:
+            if ids is None:
+                listing = not entry['complete']
+                unknown = ()
+            else:
+                ids = set(ids)
+                seen = entry['resources'].viewkeys() | entry['missing']
+                unknown = not entry['complete'] and list(ids - seen) or []
+                self.hits += len(ids) - len(unknown)
+                self.misses += len(unknown)
+                listing = bool(unknown) and fetch_threshold is not None and (
+                    len(unknown) >= fetch_threshold)
+
+        if listing:
+            fetched = manager.resources()
+            with self.lock:
+                entry['resources'].update([(r[rid], r) for r in fetched])
+                entry['missing'].clear()
+                entry['complete'] = True
+        elif unknown:
+            fetched = manager.get_resources(unknown)
+            with self.lock:
+                entry['resources'].update([(r[rid], r) for r in fetched])
+                # get_resources returns nothing on errors, ids are only
+                # known missing if the fetch returned any of the others.
+                if fetched:
+                    entry['missing'].update(
+                        set(unknown).difference(entry['resources']))
+
+        with self.lock:
+            if ids is None:
+                return dict(entry['resources'])
+            return {i: entry['resources'][i] for i in ids
+                    if i in entry['resources']}
+
+    def summary(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+RELATED_RESOURCES = RelatedResources()
 
 
 class RelatedResourceFilter(ValueFilter):
@@ -25,6 +121,10 @@ class RelatedResourceFilter(ValueFilter):
     AnnotationKey = None
     FetchThreshold = 10
 
+    cost = COST_BATCH_API
+
+    related_manager = None
+
     def get_permissions(self):
         return self.get_resource_manager().get_permissions()
 
@@ -43,25 +143,21 @@ class RelatedResourceFilter(ValueFilter):
         return super(RelatedResourceFilter, self).validate()
 
     def get_related_ids(self, resources):
-        return set(jmespath.search(
+        return set(jmespath_search(
             "[].%s" % self.RelatedIdsExpression, resources))
 
     def get_related(self, resources):
-        resource_manager = self.get_resource_manager()
-        related_ids = self.get_related_ids(resources)
-        model = resource_manager.get_model()
-        if len(related_ids) < self.FetchThreshold:
-            related = resource_manager.get_resources(list(related_ids))
-        else:
-            related = resource_manager.resources()
-        return {r[model.id]: r for r in related
-                if r[model.id] in related_ids}
+        return RELATED_RESOURCES.get(
+            self.get_resource_manager(), self.get_related_ids(resources),
+            self.FetchThreshold)
 
     def get_resource_manager(self):
-        mod_path, class_name = self.RelatedResource.rsplit('.', 1)
-        module = importlib.import_module(mod_path)
-        manager_class = getattr(module, class_name)
-        return manager_class(self.manager.ctx, {})
+        if self.related_manager is None:
+            mod_path, class_name = self.RelatedResource.rsplit('.', 1)
+            module = importlib.import_module(mod_path)
+            manager_class = getattr(module, class_name)
+            self.related_manager = manager_class(self.manager.ctx, {})
+        return self.related_manager
 
     def process_resource(self, resource, related):
         related_ids = self.get_related_ids([resource])
@@ -71,6 +167,7 @@ class RelatedResourceFilter(ValueFilter):
         if self.data.get('match-resource') is True:
             self.data['value'] = self.get_resource_value(
                 self.data['key'], resource)
+            self.compile()
         for rid in related_ids:
             robj = related.get(rid, None)
             if robj is None:
@@ -0,0 +1,116 @@
+# Copyright 2017 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+
+from .core import Filter
+
+
+class ResourceUsage(object):
+    """References between resources found by the usage filters of a run.
+
+    Usage filters, ie. the ``used`` and ``unused`` filters of iam roles
+    and security groups, find the resources referencing the ones they
+    match by scanning other resources, ie. the roles of lambda functions.
+    Each scan maps referenced ids to the ids of the resources referencing
+    them. Scans are keyed by account, region and name, so each runs once
+    and is reused by every filter needing it, with the scans a filter is
+    missing run concurrently.
+
+    Only retained while enabled, ie. for the duration of ``custodian run``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.data = {}
+        self.hits = self.misses = 0
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        with self.lock:
+            self.enabled = False
+            self.data = {}
+            self.hits = self.misses = 0
+
+    def get_key(self, manager, name):
+        return (getattr(manager.config, 'account_id', None),
+                getattr(manager.config, 'region', None),
+                name)
+
+    def scan(self, scanner):
+        refs = {}
+        for ref, referrer in scanner():
+            refs.setdefault(ref, set()).add(referrer)
+        return refs
+
+    def get(self, manager, scanners, executor_factory):
+        """Referencing resource ids by referenced id, merged over scans.
+
+        Scanners are (name, callable) pairs, the callable yielding
+        (referenced id, referencing id) pairs.
+        """
+        results = {}
+        with self.lock:
+            for name, scanner in scanners:
+                key = self.get_key(manager, name)
+                if self.enabled and key in self.data:
+                    self.hits += 1
+                    results[name] = self.data[key]
+                else:
+                    self.misses += 1
+
+        pending = [(name, scanner) for name, scanner in scanners
+                   if name not in results]
+        with executor_factory(max_workers=len(pending) or 1) as w:
+            futures = [(name, w.submit(self.scan, scanner))
+                       for name, scanner in pending]
+            for name, f in futures:
+                results[name] = f.result()
+
+        if self.enabled:
+            with self.lock:
+                for name, refs in results.items():
+                    self.data.setdefault(self.get_key(manager, name), refs)
+
+        usage = {}
+        for name, scanner in scanners:
+            for ref, referrers in results[name].items():
+                usage.setdefault(ref, set()).update(referrers)
+        return usage
+
+    def summary(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+RESOURCE_USAGE = ResourceUsage()
+
+
+class UsageFilter(Filter):
+    """Base class for filters matching resources by their references.
+
+    Subclasses name the scans they need in ``scanners``, each a method
+    yielding (referenced id, referencing id) pairs.
+    """
+
+    scanners = ()
+
+    def get_usage(self):
+        """Referencing resource ids by referenced id."""
+        return RESOURCE_USAGE.get(
+            self.manager,
+            [(name, getattr(self, name)) for name in self.scanners],
+            self.executor_factory)
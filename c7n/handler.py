@@ -25,7 +25,7 @@ import json
 
 from c7n.policy import PolicyCollection
 from c7n.resources import load_resources
-from c7n.utils import format_event, get_account_id_from_sts
+from c7n.utils import API_LIMITS, format_event, get_account_id_from_sts
 
 
 logging.root.setLevel(logging.DEBUG)
@@ -93,7 +93,9 @@ def dispatch_event(event, context):
     options = Config.empty(**options_overrides)
 
     load_resources()
-    policies = PolicyCollection(policy_config, options)
+    policies = PolicyCollection.from_data(policy_config, options)
+    API_LIMITS.configure(*[
+        p.execution_options.get('rate_limits') for p in policies])
     if policies:
         for p in policies:
             p.push(event, context)
@@ -11,10 +11,14 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import copy
+import json
 import logging
+import threading
 
 from c7n import cache
-from c7n.executor import ThreadPoolExecutor
+from c7n.filters import columnar
+from c7n.executor import ThreadPoolExecutor, get_controller
 from c7n.registry import PluginRegistry
 from c7n.utils import dumps
 
@@ -22,6 +26,113 @@ from c7n.utils import dumps
 resources = PluginRegistry('resources')
 
 
+def _filter_name(f):
+    if isinstance(f.data, dict) and len(f.data) == 1 and 'type' not in f.data:
+        return f.data.keys()[0]
+    return getattr(f, 'type', f.__class__.__name__.lower())
+
+
+def _snapshot(r):
+    return dict((k, (v, isinstance(v, list) and len(v) or None))
+                for k, v in r.items())
+
+
+def _changes(before, r):
+    """Top level keys of a resource set or extended since the snapshot."""
+    changes = []
+    for k, v in r.items():
+        if k not in before:
+            changes.append((k, False, v))
+            continue
+        ov, olen = before[k]
+        if v is not ov:
+            changes.append((k, False, v))
+        elif olen is not None and len(v) > olen:
+            changes.append((k, True, v[olen:]))
+    return copy.deepcopy(changes)
+
+
+class FilterMemo(object):
+    """Filter results shared by the policies of a run.
+
+    Policies often repeat the same filters against a resource type, a
+    shareable filter (see :meth:`c7n.filters.Filter.is_shareable`) is
+    evaluated once per resource, keyed by account, region, resource type
+    and filter data. The match and any annotations the filter made are
+    replayed onto each later policy's copy of the resource.
+
+    Only active while enabled, ie. for the duration of ``custodian run``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.data = {}
+        self.hits = self.misses = 0
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        with self.lock:
+            self.enabled = False
+            self.data = {}
+            self.hits = self.misses = 0
+
+    def get_key(self, manager, f):
+        return (getattr(manager.config, 'account_id', None),
+                getattr(manager.config, 'region', None),
+                getattr(manager, 'type', manager.__class__.__name__),
+                json.dumps(f.data, sort_keys=True, default=str))
+
+    def process(self, manager, f, resources, event=None):
+        if not self.enabled or event is not None or not f.is_shareable():
+            return f.process(resources, event)
+        try:
+            rid = manager.get_model().id
+            ids = [r[rid] for r in resources]
+        except (AttributeError, KeyError, TypeError):
+            return f.process(resources, event)
+
+        key = self.get_key(manager, f)
+        with self.lock:
+            results = self.data.setdefault(key, {})
+            known = dict((i, results[i]) for i in ids if i in results)
+            self.hits += len(known)
+            self.misses += len(ids) - len(known)
+
+        unknown = [r for r, i in zip(resources, ids) if i not in known]
+        matched = set()
+        if unknown:
+            before = [_snapshot(r) for r in unknown]
+            matched = set(map(id, f.process(unknown, event)))
+            evaluated = {}
+            for r, snapshot in zip(unknown, before):
+                evaluated[r[rid]] = (id(r) in matched, _changes(snapshot, r))
+            with self.lock:
+                results.update(evaluated)
+
+        for r, i in zip(resources, ids):
+            if i not in known:
+                continue
+            match, changes = known[i]
+            if match:
+                matched.add(id(r))
+            for k, extend, v in copy.deepcopy(changes):
+                if extend and isinstance(r.get(k), list):
+                    r[k].extend(v)
+                else:
+                    r[k] = v
+        return [r for r in resources if id(r) in matched]
+
+    def summary(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+FILTER_MEMO = FilterMemo()
+
+
 class ResourceManager(object):
 
     filter_registry = None
@@ -64,6 +175,37 @@ class ResourceManager(object):
     def resources(self):
         raise NotImplementedError("")
 
+    def get_cache_period(self):
+        """Cache period in minutes for this resource type.
+
+        Resource types may override the default ``cache_period`` via
+        the ``cache_periods`` option, a mapping of resource type to minutes.
+        """
+        periods = dict(getattr(self.config, 'cache_periods', None) or ())
+        resource_type = getattr(self, 'type', None)
+        if resource_type in periods:
+            return periods[resource_type]
+        return getattr(self.config, 'cache_period', 0)
+
+    def get_controller(self, service=None, initial=None, max_workers=None):
+        """Concurrency controller for api calls to a service, by default
+        the service of this resource type, in the current account and region.
+
+        With ``max_workers`` the caller's concurrent calls are capped at it.
+        """
+        if service is None:
+            service = self.get_model().service
+        return get_controller(
+            (getattr(self.config, 'account_id', None),
+             getattr(self.config, 'region', None), service),
+            initial or getattr(self, 'max_workers', 2),
+            max_workers=max_workers,
+            maximum=getattr(self.config, 'max_concurrency', None) or 16)
+
+    def get_query_key(self):
+        """Key for sharing describe results across policies, None if unsupported."""
+        return None
+
     def get_resource_manager(self, resource_type, data=None):
         klass = resources.get(resource_type)
         if klass is None:
@@ -74,16 +216,46 @@ class ResourceManager(object):
             return klass(self.ctx, {'source': self.config_type})
         return klass(self.ctx, data or {})
 
-    def filter_resources(self, resources, event=None):
+    def get_filter_order(self, filters):
+        """Order and-ed filters by cost, cheapest first.
+
+        Filters are stably sorted by cost class between the filters that
+        have to keep their position, barriers and filters that aren't
+        reorderable. Disabled by the ``preserve_filter_order`` option.
+        """
+        if len(filters) < 2 or getattr(
+                self.config, 'preserve_filter_order', False):
+            return filters
+        ordered = []
+        movable = []
+        for f in filters:
+            if f.is_barrier() or not f.is_reorderable():
+                ordered.extend(sorted(movable, key=lambda f: f.get_cost()))
+                ordered.append(f)
+                movable = []
+            else:
+                movable.append(f)
+        ordered.extend(sorted(movable, key=lambda f: f.get_cost()))
+        if ordered != filters:
+            self.log.debug("Reordered filters by cost: %s" % (
+                ", ".join(map(_filter_name, ordered))))
+        return ordered
+
+    def filter_resources(self, resources, event=None, filters=None):
         original = len(resources)
+        if filters is None:
+            filters = self.get_filter_order(self.filters)
         if event and event.get('debug', False):
             self.log.info(
-                "Filtering resources with %s", self.filters)
-        for f in self.filters:
+                "Filtering resources with %s", filters)
+        for f in filters:
             if not resources:
                 break
             rcount = len(resources)
-            resources = f.process(resources, event)
+            if event is None and self.is_columnar(f, resources):
+                resources = columnar.process(f, resources)
+            else:
+                resources = FILTER_MEMO.process(self, f, resources, event)
             if event and event.get('debug', False):
                 self.log.debug(
                     "applied filter %s %d->%d", f, rcount, len(resources))
@@ -91,6 +263,14 @@ class ResourceManager(object):
             original, len(resources), self.__class__.__name__.lower()))
         return resources
 
+    def is_columnar(self, f, resources):
+        """Whether to evaluate a filter over columns, see
+        :mod:`c7n.filters.columnar`.
+        """
+        return (getattr(self.config, 'columnar', False) and
+                len(resources) >= columnar.MIN_RESOURCES and
+                columnar.supported(f))
+
     def get_model(self):
         """Returns the resource meta-model.
         """
@@ -28,6 +28,7 @@ import tempfile
 import os
 
 from boto3.s3.transfer import S3Transfer
+from c7n.executor import get_policy_context
 from c7n.utils import local_session, parse_s3
 from c7n.log import CloudWatchLogHandler
 
@@ -128,6 +129,11 @@ class LogOutput(object):
         self.handler = self.get_handler()
         self.handler.setLevel(logging.DEBUG)
         self.handler.setFormatter(logging.Formatter(self.log_format))
+        # When policies execute concurrently on threads, only capture
+        # the records of the threads executing this policy.
+        if (getattr(self.ctx.options, 'jobs', 1) > 1 and
+                getattr(self.ctx.options, 'executor', 'thread') == 'thread'):
+            self.handler.addFilter(PolicyFilter(self.ctx.policy))
         mlog = logging.getLogger('custodian')
         mlog.addHandler(self.handler)
 
@@ -138,6 +144,21 @@ class LogOutput(object):
         self.handler.close()
 
 
+class PolicyFilter(logging.Filter):
+    """Log filter matching records emitted in a policy's context.
+
+    That is by the thread executing the policy, and the worker threads of
+    the executors it submits to.
+    """
+
+    def __init__(self, policy):
+        super(PolicyFilter, self).__init__()
+        self.policy = policy
+
+    def filter(self, record):
+        return get_policy_context() is self.policy
+
+
 class CloudWatchLogOutput(LogOutput):
 
     log_format = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
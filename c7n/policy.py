@@ -11,6 +11,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from collections import OrderedDict
 import copy
 import json
 import fnmatch
@@ -23,11 +24,14 @@ import boto3
 from botocore.client import ClientError
 
 from c7n.actions import EventAction
+from c7n.cache import get_datapoint_store
 from c7n.cwe import CloudWatchEvents
 from c7n.ctx import ExecutionContext
 from c7n.credentials import SessionFactory
+from c7n.filters.metrics import get_datapoints
 from c7n.manager import resources
 from c7n.output import DEFAULT_NAMESPACE
+from c7n.query import SharedQuery
 from c7n import mu
 from c7n import utils
 from c7n.logs_support import (
@@ -148,6 +152,36 @@ class PolicyCollection(object):
             results.append(policy)
         return PolicyCollection(results, self.options)
 
+    def plan(self):
+        """Group policies by the describe query they execute.
+
+        Pull mode policies with the same region, resource type, source
+        and query are grouped together and share a single describe and
+        augment of their resources, each policy filtering its own copy.
+        Other policies are placed in a group of their own.
+
+        Returns a list of policy groups, ordered by first appearance.
+        """
+        groups = OrderedDict()
+        for p in self.policies:
+            key = None
+            if p.execution_mode == 'pull' or p.options.dryrun:
+                key = p.resource_manager.get_query_key()
+            if key is None:
+                key = id(p)
+            groups.setdefault(key, []).append(p)
+
+        for key, group in groups.items():
+            if len(group) < 2:
+                continue
+            shared = SharedQuery(key)
+            for p in group:
+                p.resource_manager.shared_query = shared
+        self.log.debug(
+            "Planned %d policies into %d resource queries",
+            len(self.policies), len(groups))
+        return groups.values()
+
     def __iter__(self):
         return iter(self.policies)
 
@@ -211,6 +245,8 @@ class PolicyExecutionMode(object):
 
         session = utils.local_session(self.policy.session_factory)
         client = session.client('cloudwatch')
+        store = get_datapoint_store(self.policy.options)
+        statistics = ['Sum', 'Average']
 
         for m in metrics:
             if isinstance(m, basestring):
@@ -219,17 +255,17 @@ class PolicyExecutionMode(object):
                 m, m_dimensions = m
                 dimensions = dict(default_dimensions)
                 dimensions.update(m_dimensions)
-            results = client.get_metric_statistics(
+            dimensions = [
+                {'Name': k, 'Value': v} for k, v in dimensions.items()]
+            key = store and store.get_key(
+                self.policy.options.account_id, self.policy.options.region,
+                DEFAULT_NAMESPACE, m, dimensions, statistics, period)
+            values[m] = get_datapoints(
+                client, start, end, period, store, key,
                 Namespace=DEFAULT_NAMESPACE,
-                Dimensions=[
-                    {'Name': k, 'Value': v} for k, v
-                    in dimensions.items()],
-                Statistics=['Sum', 'Average'],
-                StartTime=start,
-                EndTime=end,
-                Period=period,
+                Dimensions=dimensions,
+                Statistics=statistics,
                 MetricName=m)
-            values[m] = results['Datapoints']
         return values
 
 
@@ -562,9 +598,16 @@ class Policy(object):
     def tags(self):
         return self.data.get('tags', ())
 
+    @property
+    def execution_mode(self):
+        return self.data.get('mode', {'type': 'pull'}).get('type')
+
     def get_execution_mode(self):
-        exec_mode_type = self.data.get('mode', {'type': 'pull'}).get('type')
-        return self.EXEC_MODE_MAP[exec_mode_type](self)
+        return self.EXEC_MODE_MAP[self.execution_mode](self)
+
+    @property
+    def execution_options(self):
+        return self.data.get('mode', {}).get('execution-options', {})
 
     @property
     def is_lambda(self):
@@ -16,21 +16,23 @@ Query capability built on skew metamodel
 
 tags_spec -> s3, elb, rds
 """
+import copy
 import functools
 import itertools
-import jmespath
 import json
 
 from botocore.client import ClientError
+from botocore.paginate import PageIterator
 from concurrent.futures import as_completed
 
 from c7n.actions import ActionRegistry
-from c7n.filters import FilterRegistry, MetricsFilter
+from c7n.filters import FilterRegistry, MetricsFilter, ValueFilter
 from c7n.tags import register_tags
 from c7n.utils import (
-    local_session, get_retry, chunks, camelResource)
+    local_session, get_retry, chunks, camelResource, index_tags,
+    jmespath_compile)
 from c7n.registry import PluginRegistry
-from c7n.manager import ResourceManager
+from c7n.manager import ResourceManager, FILTER_MEMO
 
 
 class ResourceQuery(object):
@@ -63,12 +65,41 @@ class ResourceQuery(object):
             op = getattr(client, enum_op)
             data = op(**params)
         if path:
-            path = jmespath.compile(path)
+            path = jmespath_compile(path)
             data = path.search(data)
         if data is None:
             data = []
         return data
 
+    def filter_pages(self, resource_type, retry=None, **params):
+        """Query a set of resources, yielding them a page at a time.
+
+        With ``retry``, each page's api call is made through it.
+        """
+        m = self.resolve(resource_type)
+        client = local_session(self.session_factory).client(
+            m.service)
+        enum_op, path, extra_args = m.enum_spec
+        if extra_args:
+            params.update(extra_args)
+
+        if client.can_paginate(enum_op):
+            paginator = client.get_paginator(enum_op)
+            if retry is not None:
+                paginator.PAGE_ITERATOR_CLS = functools.partial(
+                    RetryPageIterator, retry)
+            pages = paginator.paginate(**params)
+        elif retry is not None:
+            pages = [retry(getattr(client, enum_op), **params)]
+        else:
+            pages = [getattr(client, enum_op)(**params)]
+        if path:
+            path = jmespath_compile(path)
+        for page in pages:
+            if path:
+                page = path.search(page)
+            yield page or []
+
     def get(self, resource_type, identities):
         """Get resources by identities
         """
@@ -93,6 +124,17 @@ class ResourceQuery(object):
         return resources
 
 
+class RetryPageIterator(PageIterator):
+    """Page iterator making each page's api call through a retry."""
+
+    def __init__(self, retry, *args, **kw):
+        super(RetryPageIterator, self).__init__(*args, **kw)
+        self.retry = retry
+
+    def _make_request(self, current_kwargs):
+        return self.retry(self._method, **current_kwargs)
+
+
 class QueryMeta(type):
 
     def __new__(cls, name, parents, attrs):
@@ -151,6 +193,10 @@ class DescribeSource(Source):
             resources = self.query.filter(self.manager.resource_type, **query)
         return resources
 
+    def resource_pages(self, query):
+        return self.query.filter_pages(
+            self.manager.resource_type, retry=self.manager.retry, **query)
+
     def get_permissions(self):
         m = self.manager.get_model()
         perms = ['%s:%s' % (m.service, _napi(m.enum_spec[0]))]
@@ -168,10 +214,11 @@ class DescribeSource(Source):
             _augment = _batch_augment
         else:
             return resources
+        controller = self.manager.get_controller()
         _augment = functools.partial(
-            _augment, self.manager, model, detail_spec)
+            controller.run, _augment, self.manager, model, detail_spec)
         with self.manager.executor_factory(
-                max_workers=self.manager.max_workers) as w:
+                max_workers=controller.maximum) as w:
             results = list(w.map(
                 _augment, chunks(resources, self.manager.chunk_size)))
             return list(itertools.chain(*results))
@@ -229,6 +276,27 @@ class ConfigSource(Source):
         return resources
 
 
+class SharedQuery(object):
+    """Describe results shared by a group of policies.
+
+    The first policy of the group to run fetches and augments the
+    resources, every policy is handed its own copy so that filter
+    annotations don't bleed between policies.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.results = None
+
+    def resources(self, manager, query):
+        if self.results is None:
+            self.results = manager.fetch_resources(query)
+        return index_tags(copy.deepcopy(self.results))
+
+    def release(self):
+        self.results = None
+
+
 class QueryResourceManager(ResourceManager):
 
     __metaclass__ = QueryMeta
@@ -243,6 +311,10 @@ class QueryResourceManager(ResourceManager):
 
     permissions = ()
 
+    # Set by the policy collection planner when describe results are
+    # shared with other policies.
+    shared_query = None
+
     def __init__(self, data, options):
         super(QueryResourceManager, self).__init__(data, options)
         self.source = sources.get(self.source_type)(self)
@@ -269,25 +341,140 @@ class QueryResourceManager(ResourceManager):
             perms.extend(self.permissions)
         return perms
 
+    def get_resource_query(self):
+        """Return the server side query for describing the policy's resources.
+
+        Subclasses that support a `query` block in the policy override this.
+        """
+        return None
+
+    def get_cache_key(self, query):
+        return {'region': self.config.region,
+                'resource': str(self.__class__.__name__),
+                'q': query}
+
+    def get_query_key(self):
+        """Key identifying the describe results this manager would fetch.
+
+        Policies whose managers have the same query key can share a single
+        describe and augment of their resources, see
+        :meth:`c7n.policy.PolicyCollection.plan`.
+        """
+        return (self.config.region,
+                str(self.__class__.__name__),
+                self.source_type,
+                json.dumps(self.get_resource_query(), sort_keys=True))
+
+    def get_query(self):
+        """Server side query for the policy's resources.
+
+        The resource query, with the policy's value filters that the
+        describe api can evaluate pushed down into its ``Filters``. Policies
+        sharing a describe (see :meth:`get_query_key`) use the resource
+        query alone, as their filters differ.
+        """
+        query = self.get_resource_query()
+        if self.source_type != 'describe':
+            return query
+        pushed = pushdown_filters(self.get_model(), self.filters, query)
+        if not pushed:
+            return query
+        self.log.debug("Pushing down filters %s" % (pushed,))
+        query = dict(query or {})
+        query['Filters'] = list(query.get('Filters', ())) + pushed
+        return query
+
     def resources(self, query=None):
-        key = {'region': self.config.region,
-               'resource': str(self.__class__.__name__),
-               'q': query}
+        if query is None:
+            scoped = self.get_scoped_resources()
+            if scoped is not None:
+                return self.filter_resources(scoped)
+        if self.shared_query is not None:
+            resources = self.shared_query.resources(
+                self, query or self.get_resource_query())
+            return self.filter_resources(resources)
+        if query is None:
+            query = self.get_query()
+        if self.is_streaming(query):
+            return self.stream_resources(query)
+        else:
+            resources = self.fetch_resources(query)
+        return self.filter_resources(resources)
+
+    def get_scoped_resources(self):
+        """Resources a filter restricts the policy to, see
+        :meth:`c7n.filters.Filter.scope_resources`, or None.
+        """
+        for f in self.filters:
+            resources = f.scope_resources()
+            if resources is not None:
+                return index_tags(resources)
+        return None
+
+    def is_streaming(self, query):
+        """Whether resources should be streamed a page at a time.
 
+        Streaming is enabled by the ``stream`` option, for sources that
+        support paging and when there are no cached results to use.
+        """
+        if not getattr(self.config, 'stream', False):
+            return False
+        if not hasattr(self.source, 'resource_pages'):
+            return False
+        if self._cache.load() and self._cache.get(
+                self.get_cache_key(query)) is not None:
+            return False
+        return True
+
+    def stream_resources(self, query=None):
+        """Filter resources a page at a time as they're described.
+
+        Pages flow through augment and the leading filters that can
+        process a partial set. Starting at the first filter that needs the
+        complete set (a barrier, ie. resource_count or a filter grouping
+        resources like the rds-snapshot latest filter) the remaining
+        filters are applied to the accumulated results. Streamed results
+        are not cached.
+        """
+        filters = self.get_filter_order(self.filters)
+        for idx, f in enumerate(filters):
+            if f.is_barrier():
+                filters, barriers = filters[:idx], filters[idx:]
+                break
+        else:
+            barriers = []
+
+        count = 0
+        results = []
+        for page in self.source.resource_pages(query or {}):
+            count += len(page)
+            page = index_tags(self.augment(page))
+            for f in filters:
+                if not page:
+                    break
+                page = FILTER_MEMO.process(self, f, page)
+            results.extend(page)
+        self.log.debug("Streamed %d %s, %d matched streaming filters" % (
+            count, self.__class__.__name__.lower(), len(results)))
+        return self.filter_resources(results, filters=barriers)
+
+    def fetch_resources(self, query=None):
+        """Describe and augment resources, without filtering."""
+        key = self.get_cache_key(query)
         if self._cache.load():
             resources = self._cache.get(key)
             if resources is not None:
                 self.log.debug("Using cached %s: %d" % (
                     "%s.%s" % (self.__class__.__module__, self.__class__.__name__),
                     len(resources)))
-                return self.filter_resources(resources)
+                return index_tags(resources)
 
         if query is None:
             query = {}
 
         resources = self.augment(self.source.resources(query))
-        self._cache.save(key, resources)
-        return self.filter_resources(resources)
+        self._cache.save(key, resources, ttl=self.get_cache_period() * 60)
+        return index_tags(resources)
 
     def get_resources(self, ids, cache=True):
         key = {'region': self.config.region,
@@ -299,10 +486,11 @@ class QueryResourceManager(ResourceManager):
                 self.log.debug("Using cached results for get_resources")
                 m = self.get_model()
                 id_set = set(ids)
-                return [r for r in resources if r[m.id] in id_set]
+                return index_tags(
+                    [r for r in resources if r[m.id] in id_set])
         try:
             resources = self.augment(self.source.get_resources(ids))
-            return resources
+            return index_tags(resources)
         except ClientError as e:
             self.log.warning("event ids not resolved: %s error:%s" % (ids, e))
             return []
@@ -326,6 +514,83 @@ class QueryResourceManager(ResourceManager):
         return self.config.account_id
 
 
+def pushdown_filters(model, filters, query=None):
+    """Translate value filters into describe api ``Filters``.
+
+    Resource types declare the value filter keys their describe api can
+    filter on server side via ``filter_pushdown``, a mapping of key to
+    api filter name, and ``filter_pushdown_tags`` for apis which
+    support ``tag:`` filters. Policy filters are and-ed together so the
+    leading top level value filters comparing a key for equality or
+    membership can narrow the listing, up to the first filter that can't
+    be pushed down, as later ones may follow a barrier (ie. resource_count)
+    which has to see the resources before they're narrowed. Filters are
+    still evaluated client side, the api filters only need to return a
+    superset of the matches, which also keeps value matching semantics
+    intact.
+    """
+    mapping = getattr(model, 'filter_pushdown', None) or {}
+    tags = getattr(model, 'filter_pushdown_tags', False)
+    if not mapping and not tags:
+        return []
+    names = set([f['Name'] for f in (query or {}).get('Filters', ())])
+    pushed = []
+    for f in filters:
+        if type(f) is not ValueFilter or f.is_barrier():
+            break
+        api_filter = _pushdown_value_filter(f.data, mapping, tags)
+        if api_filter is None:
+            break
+        if api_filter['Name'] in names:
+            continue
+        names.add(api_filter['Name'])
+        pushed.append(api_filter)
+    return pushed
+
+
+def _pushdown_value_filter(data, mapping, tags):
+    if len(data) == 1:
+        [(key, value)] = data.items()
+        op = None
+    elif 'value_type' in data or 'value_from' in data:
+        return None
+    else:
+        key, value, op = data.get('key'), data.get('value'), data.get('op')
+
+    if not key or key == 'type':
+        return None
+    if tags and key.startswith('tag:') and value == 'present':
+        return {'Name': 'tag-key', 'Values': [key.split(':', 1)[1]]}
+    if value in ('absent', 'present', 'not-null', 'empty'):
+        return None
+
+    if tags and key.startswith('tag:'):
+        name = key
+    elif key in mapping:
+        name = mapping[key]
+    else:
+        return None
+
+    if op in (None, 'eq', 'equal'):
+        values = [value]
+    elif op == 'in' and isinstance(value, list):
+        values = value
+    else:
+        return None
+
+    api_values = []
+    for v in values:
+        if isinstance(v, bool):
+            api_values.append(v and 'true' or 'false')
+        elif isinstance(v, (int, long, basestring)):
+            api_values.append(unicode(v))
+        else:
+            return None
+    if not api_values:
+        return None
+    return {'Name': name, 'Values': api_values}
+
+
 def _batch_augment(manager, model, detail_spec, resource_set):
     detail_op, param_name, param_key, detail_path = detail_spec
     client = local_session(manager.session_factory).client(model.service)
@@ -47,16 +47,15 @@ import csv
 from datetime import datetime
 import gzip
 import json
-import jmespath
 import logging
 import os
 from tabulate import tabulate
 
 from botocore.compat import OrderedDict
-from dateutil.parser import parse as date_parse
 
 from c7n.executor import ThreadPoolExecutor
-from c7n.utils import local_session, dumps
+from c7n.utils import (
+    local_session, dumps, jmespath_search, parse_date, tag_map)
 
 
 log = logging.getLogger('custodian.reports')
@@ -105,20 +104,20 @@ def _get_values(record, field_list, tag_map):
             value = tag_map.get(tag_field, '')
         elif field.startswith(list_prefix):
             list_field = field.replace(list_prefix, '', 1)
-            value = jmespath.search(list_field, record)
+            value = jmespath_search(list_field, record)
             if value is None:
                 value = ''
             else:
                 value = ', '.join([str(v) for v in value])
         elif field.startswith(count_prefix):
             count_field = field.replace(count_prefix, '', 1)
-            value = jmespath.search(count_field, record)
+            value = jmespath_search(count_field, record)
             if value is None:
                 value = ''
             else:
                 value = str(len(value))
         else:
-            value = jmespath.search(field, record)
+            value = jmespath_search(field, record)
             if value is None:
                 value = ''
             if not isinstance(value, basestring):
@@ -161,8 +160,7 @@ class Formatter(object):
         return self.fields.keys()
 
     def extract_csv(self, record):
-        tag_map = {t['Key']: t['Value'] for t in record.get('Tags', ())}
-        return _get_values(record, self.fields.values(), tag_map)
+        return _get_values(record, self.fields.values(), tag_map(record))
 
     def uniq_by_id(self, records):
         """Only the first record for each id"""
@@ -253,7 +251,7 @@ def get_records(bucket, key, session_factory):
     # key ends with 'YYYY/mm/dd/HH/resources.json.gz'
     # so take the date parts only
     date_str = '-'.join(key['Key'].rsplit('/', 5)[-5:-1])
-    custodian_date = date_parse(date_str)
+    custodian_date = parse_date(date_str)
     s3 = local_session(session_factory).client('s3')
     result = s3.get_object(Bucket=bucket, Key=key['Key'])
     blob = StringIO(result['Body'].read())
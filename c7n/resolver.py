@@ -18,7 +18,7 @@ from StringIO import StringIO
 import urllib2
 import urlparse
 
-import jmespath
+from c7n.utils import jmespath_search
 
 
 class URIResolver(object):
@@ -126,7 +126,7 @@ class ValuesFrom(object):
         if format == 'json':
             data = json.loads(contents)
             if 'expr' in self.data:
-                return jmespath.search(self.data['expr'], data)
+                return jmespath_search(self.data['expr'], data)
         elif format == 'csv' or format == 'csv2dict':
             data = csv.reader(StringIO(contents))
             if format == 'csv2dict':
@@ -136,7 +136,7 @@ class ValuesFrom(object):
                     return [d[self.data['expr']] for d in data]
                 data = list(data)
             if 'expr' in self.data:
-                return jmespath.search(self.data['expr'], data)
+                return jmespath_search(self.data['expr'], data)
             return data
         elif format == 'txt':
             return [s.strip() for s in StringIO(contents).readlines()]
@@ -22,7 +22,7 @@ from dateutil.parser import parse as parse_date
 from dateutil.tz import tzutc
 
 from c7n.actions import ActionRegistry, BaseAction
-from c7n.filters import Filter, FilterRegistry, ValueFilter
+from c7n.filters import Filter, FilterRegistry, ValueFilter, COST_BATCH_API
 from c7n.manager import ResourceManager, resources
 from c7n.utils import local_session, type_schema
 
@@ -273,6 +273,7 @@ class IAMSummary(ValueFilter):
               value_type: swap
     """
     schema = type_schema('iam-summary', rinherit=ValueFilter.schema)
+    cost = COST_BATCH_API
 
     permissions = ('iam:GetAccountSummary',)
 
@@ -313,6 +314,7 @@ class AccountPasswordPolicy(ValueFilter):
                     value: true
     """
     schema = type_schema('password-policy', rinherit=ValueFilter.schema)
+    cost = COST_BATCH_API
     permissions = ('iam:GetAccountPasswordPolicy',)
 
     def process(self, resources, event=None):
@@ -19,7 +19,8 @@ import logging
 from collections import defaultdict
 from c7n.actions import ActionRegistry, BaseAction
 from c7n.filters import (
-    Filter, FilterRegistry, FilterValidationError, DefaultVpcBase, ValueFilter)
+    Filter, FilterRegistry, FilterValidationError, DefaultVpcBase, ValueFilter,
+    COST_BATCH_API, COST_RESOURCE_API)
 import c7n.filters.vpc as net_filters
 from c7n import tags
 from c7n.manager import resources
@@ -306,6 +307,7 @@ class AppELBListenerFilter(ValueFilter, AppELBListenerFilterBase):
 
     schema = type_schema('listener', rinherit=ValueFilter.schema)
     permissions = ("elasticloadbalancing:DescribeLoadBalancerAttributes",)
+    cost = COST_RESOURCE_API
 
     def process(self, albs, event=None):
         self.initialize(albs)
@@ -424,6 +426,7 @@ class AppELBTargetGroupFilter(ValueFilter, AppELBTargetGroupFilterBase):
 
     schema = type_schema('target-group', rinherit=ValueFilter.schema)
     permissions = ("elasticloadbalancing:DescribeTargetGroups",)
+    cost = COST_BATCH_API
 
     def process(self, albs, event=None):
         self.initialize(albs)
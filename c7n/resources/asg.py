@@ -17,7 +17,6 @@ from collections import Counter
 from concurrent.futures import as_completed
 
 from datetime import datetime, timedelta
-from dateutil.parser import parse
 from dateutil.tz import tzutc
 
 import logging
@@ -27,15 +26,16 @@ import time
 from c7n.actions import Action, ActionRegistry, AutoTagUser
 from c7n.filters import (
     FilterRegistry, ValueFilter, AgeFilter, Filter, FilterValidationError,
-    OPERATORS)
+    OPERATORS, COST_BATCH_API)
 from c7n.filters.offhours import OffHour, OnHour
+from c7n.filters.related import RELATED_RESOURCES
 import c7n.filters.vpc as net_filters
 
 from c7n.manager import resources
 from c7n.query import QueryResourceManager
 from c7n.tags import TagActionFilter, DEFAULT_TAG, TagCountFilter, TagTrim
 from c7n.utils import (
-    local_session, type_schema, chunks, get_retry, worker)
+    local_session, type_schema, chunks, get_retry, worker, parse_date)
 
 log = logging.getLogger('custodian.asg')
 
@@ -83,6 +83,10 @@ class LaunchConfigFilterBase(object):
     permissions = ("autoscaling:DescribeLaunchConfigurations",)
     configs = None
 
+    # Launch configs are listed rather than fetched by name, when at
+    # least this many of them haven't been seen before.
+    FetchThreshold = 10
+
     def initialize(self, asgs):
         """Get launch configs for the set of asgs"""
         config_names = set()
@@ -98,14 +102,12 @@ class LaunchConfigFilterBase(object):
         for a in skip:
             asgs.remove(a)
 
-        self.configs = {}
         self.log.debug(
             "Querying launch configs for filter %s",
             self.__class__.__name__)
-        configs = self.manager.get_resource_manager(
-            'launch-config').resources()
-        self.configs = {
-            cfg['LaunchConfigurationName']: cfg for cfg in configs}
+        self.configs = RELATED_RESOURCES.get(
+            self.manager.get_resource_manager('launch-config'),
+            config_names, self.FetchThreshold)
 
 
 @filters.register('security-group')
@@ -162,6 +164,7 @@ class LaunchConfigFilter(ValueFilter, LaunchConfigFilterBase):
     schema = type_schema(
         'launch-config', rinherit=ValueFilter.schema)
     permissions = ("autoscaling:DescribeLaunchConfigurations",)
+    cost = COST_BATCH_API
 
     def process(self, asgs, event=None):
         self.initialize(asgs)
@@ -533,16 +536,13 @@ class ImageAgeFilter(AgeFilter, LaunchConfigFilterBase):
 
     def initialize(self, asgs):
         super(ImageAgeFilter, self).initialize(asgs)
-        image_ids = set()
-        for cfg in self.configs.values():
-            image_ids.add(cfg['ImageId'])
-        results = self.manager.get_resource_manager('ami').resources()
-        self.images = {i['ImageId']: i for i in results}
+        self.images = RELATED_RESOURCES.get(
+            self.manager.get_resource_manager('ami'))
 
     def get_resource_date(self, i):
         cfg = self.configs[i['LaunchConfigurationName']]
         ami = self.images.get(cfg['ImageId'], {})
-        return parse(ami.get(
+        return parse_date(ami.get(
             self.date_attribute, "2000-01-01T01:01:01.000Z"))
 
 
@@ -568,6 +568,7 @@ class VpcIdFilter(ValueFilter):
     schema = type_schema(
         'vpc-id', rinherit=ValueFilter.schema)
     schema['properties'].pop('key')
+    cost = COST_BATCH_API
     permissions = ('ec2:DescribeSubnets',)
 
     # TODO: annotation
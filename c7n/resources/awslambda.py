@@ -15,7 +15,8 @@ import json
 from botocore.exceptions import ClientError
 
 from c7n.actions import ActionRegistry, AutoTagUser, BaseAction
-from c7n.filters import CrossAccountAccessFilter, FilterRegistry, ValueFilter
+from c7n.filters import (
+    CrossAccountAccessFilter, FilterRegistry, ValueFilter, COST_RESOURCE_API)
 import c7n.filters.vpc as net_filters
 from c7n.manager import resources
 from c7n.query import QueryResourceManager
@@ -113,8 +114,13 @@ class LambdaEventSource(ValueFilter):
 
     annotation_key = "c7n.EventSources"
     schema = type_schema('event-source', rinherit=ValueFilter.schema)
+    cost = COST_RESOURCE_API
     permissions = ('lambda:GetPolicy',)
 
+    def __init__(self, data, manager=None):
+        super(LambdaEventSource, self).__init__(data, manager)
+        self.data['key'] = self.annotation_key
+
     def process(self, resources, event=None):
         def _augment(r):
             if 'c7n.Policy' in r:
@@ -132,7 +138,6 @@ class LambdaEventSource(ValueFilter):
                         r['FunctionName'])
 
         self.log.debug("fetching policy for %d lambdas" % len(resources))
-        self.data['key'] = self.annotation_key
 
         with self.executor_factory(max_workers=3) as w:
             resources = filter(None, w.map(_augment, resources))
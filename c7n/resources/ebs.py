@@ -22,7 +22,7 @@ from concurrent.futures import as_completed
 from c7n.actions import ActionRegistry, BaseAction
 from c7n.filters import (
     CrossAccountAccessFilter, Filter, FilterRegistry, AgeFilter, ValueFilter,
-    ANNOTATION_KEY, FilterValidationError, OPERATORS)
+    ANNOTATION_KEY, FilterValidationError, OPERATORS, COST_BATCH_API)
 from c7n.filters.health import HealthEventFilter
 
 from c7n.manager import resources
@@ -60,6 +60,14 @@ class Snapshot(QueryResourceManager):
         name = 'SnapshotId'
         date = 'StartTime'
         dimension = None
+        filter_pushdown = {
+            'SnapshotId': 'snapshot-id',
+            'VolumeId': 'volume-id',
+            'State': 'status',
+            'Encrypted': 'encrypted',
+            'OwnerId': 'owner-id',
+            'VolumeSize': 'volume-size'}
+        filter_pushdown_tags = True
 
         default_report_fields = (
             'SnapshotId',
@@ -359,6 +367,16 @@ class EBS(QueryResourceManager):
         dimension = 'VolumeId'
         metrics_namespace = 'AWS/EBS'
         config_type = "AWS::EC2::Volume"
+        filter_pushdown = {
+            'VolumeId': 'volume-id',
+            'VolumeType': 'volume-type',
+            'State': 'status',
+            'Encrypted': 'encrypted',
+            'Size': 'size',
+            'SnapshotId': 'snapshot-id',
+            'AvailabilityZone': 'availability-zone',
+            'KmsKeyId': 'kms-key-id'}
+        filter_pushdown_tags = True
         default_report_fields = (
             'VolumeId',
             'Attachments[0].InstanceId',
@@ -387,6 +405,7 @@ class AttachedInstanceFilter(ValueFilter):
     """
 
     schema = type_schema('instance', rinherit=ValueFilter.schema)
+    cost = COST_BATCH_API
 
     def get_permissions(self):
         return self.manager.get_resource_manager('ec2').get_permissions()
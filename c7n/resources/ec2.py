@@ -17,24 +17,25 @@ import random
 import re
 
 from botocore.exceptions import ClientError
-from dateutil.parser import parse
 from concurrent.futures import as_completed
 
 from c7n.actions import (
     ActionRegistry, BaseAction, AutoTagUser, ModifyVpcSecurityGroupsAction
 )
 from c7n.filters import (
-    FilterRegistry, AgeFilter, ValueFilter, Filter, OPERATORS, DefaultVpcBase
+    FilterRegistry, AgeFilter, ValueFilter, Filter, OPERATORS, DefaultVpcBase,
+    COST_BATCH_API
 )
 from c7n.filters.offhours import OffHour, OnHour
 from c7n.filters.health import HealthEventFilter
+from c7n.filters.related import RELATED_RESOURCES
 import c7n.filters.vpc as net_filters
 
 from c7n.manager import resources
 from c7n.query import QueryResourceManager
 
 from c7n import utils
-from c7n.utils import type_schema
+from c7n.utils import type_schema, parse_date
 
 
 filters = FilterRegistry('ec2.filters')
@@ -60,6 +61,22 @@ class EC2(QueryResourceManager):
         dimension = 'InstanceId'
         config_type = "AWS::EC2::Instance"
         shape = "Instance"
+        filter_pushdown = {
+            'State.Name': 'instance-state-name',
+            'InstanceId': 'instance-id',
+            'InstanceType': 'instance-type',
+            'ImageId': 'image-id',
+            'KeyName': 'key-name',
+            'VpcId': 'vpc-id',
+            'SubnetId': 'subnet-id',
+            'Placement.AvailabilityZone': 'availability-zone',
+            'Platform': 'platform',
+            'Architecture': 'architecture',
+            'RootDeviceType': 'root-device-type',
+            'PrivateIpAddress': 'private-ip-address',
+            'PublicIpAddress': 'ip-address',
+            'IamInstanceProfile.Arn': 'iam-instance-profile.arn'}
+        filter_pushdown_tags = True
 
         default_report_fields = (
             'CustodianDate',
@@ -81,12 +98,10 @@ class EC2(QueryResourceManager):
         super(EC2, self).__init__(ctx, data)
         self.queries = QueryFilter.parse(self.data.get('query', []))
 
-    def resources(self, query=None):
+    def get_resource_query(self):
         q = self.resource_query()
         if q is not None:
-            query = query or {}
-            query['Filters'] = q
-        return super(EC2, self).resources(query=query)
+            return {'Filters': q}
 
     def resource_query(self):
         qf = []
@@ -199,7 +214,7 @@ class StateTransitionAge(AgeFilter):
             return None
         dates = self.RE_PARSE_AGE.findall(v)
         if dates:
-            return parse(dates[0][1:-1])
+            return parse_date(dates[0][1:-1])
         return None
 
 
@@ -247,6 +262,7 @@ class AttachedVolume(ValueFilter):
         'ebs', rinherit=ValueFilter.schema,
         **{'operator': {'enum': ['and', 'or']},
            'skip-devices': {'type': 'array', 'items': {'type': 'string'}}})
+    cost = COST_BATCH_API
 
     def get_permissions(self):
         return self.manager.get_resource_manager('ebs').get_permissions()
@@ -268,7 +284,7 @@ class AttachedVolume(ValueFilter):
                     if 'Ebs' not in bd:
                         continue
                     volume_ids.append(bd['Ebs']['VolumeId'])
-            for v in manager.get_resources(volume_ids):
+            for v in RELATED_RESOURCES.get(manager, volume_ids).values():
                 if not v['Attachments']:
                     continue
                 volume_map.setdefault(
@@ -290,8 +306,7 @@ class AttachedVolume(ValueFilter):
 class InstanceImageBase(object):
 
     def get_image_mapping(self, resources):
-        return {i['ImageId']: i for i in
-                self.manager.get_resource_manager('ami').resources()}
+        return RELATED_RESOURCES.get(self.manager.get_resource_manager('ami'))
 
 
 @filters.register('image-age')
@@ -330,15 +345,16 @@ class ImageAge(AgeFilter, InstanceImageBase):
     def get_resource_date(self, i):
         if i['ImageId'] not in self.image_map:
             # our image is no longer available
-            return parse("2000-01-01T01:01:01.000Z")
+            return parse_date("2000-01-01T01:01:01.000Z")
         image = self.image_map[i['ImageId']]
-        return parse(image['CreationDate'])
+        return parse_date(image['CreationDate'])
 
 
 @filters.register('image')
 class InstanceImage(ValueFilter, InstanceImageBase):
 
     schema = type_schema('image', rinherit=ValueFilter.schema)
+    cost = COST_BATCH_API
 
     def get_permissions(self):
         return self.manager.get_resource_manager('ami').get_permissions()
@@ -20,7 +20,6 @@ from datetime import datetime
 
 from concurrent.futures import as_completed
 from dateutil.tz import tzutc
-from dateutil.parser import parse
 
 from c7n.actions import (
     ActionRegistry, BaseAction, ModifyVpcSecurityGroupsAction)
@@ -31,7 +30,7 @@ from c7n.query import QueryResourceManager
 from c7n import tags
 from c7n.utils import (
     local_session, generate_arn,
-    get_retry, chunks, snapshot_identifier, type_schema)
+    get_retry, chunks, snapshot_identifier, type_schema, parse_date)
 
 log = logging.getLogger('custodian.elasticache')
 
@@ -422,7 +421,7 @@ class ElastiCacheSnapshotAge(AgeFilter):
         """
         def to_datetime(v):
             if not isinstance(v, datetime):
-                v = parse(v)
+                v = parse_date(v)
             if not v.tzinfo:
                 v = v.replace(tzinfo=tzutc())
             return v
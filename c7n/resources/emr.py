@@ -68,13 +68,13 @@ class EMRCluster(QueryResourceManager):
                 client.describe_cluster(ClusterId=jid)['Cluster'])
         return results
 
-    def resources(self, query=None):
+    def get_resource_query(self):
         q = self.consolidate_query_filter()
         if q is not None:
-            query = query or {}
+            query = {}
             for i in range(0, len(q)):
                 query[q[i]['Name']] = q[i]['Values']
-        return super(EMRCluster, self).resources(query=query)
+            return query
 
     def consolidate_query_filter(self):
         result = []
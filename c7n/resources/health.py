@@ -61,12 +61,10 @@ class HealthEvents(QueryResourceManager):
                     qf[qd['Name']].append(qv)
         return qf
 
-    def resources(self, query=None):
+    def get_resource_query(self):
         q = self.resource_query()
         if q is not None:
-            query = query or {}
-            query['filter'] = q
-        return super(HealthEvents, self).resources(query=query)
+            return {'filter': q}
 
     def augment(self, resources):
         client = local_session(self.session_factory).client('health')
@@ -15,17 +15,19 @@ from cStringIO import StringIO
 import csv
 import datetime
 from datetime import timedelta
-from dateutil.parser import parse
 from dateutil.tz import tzutc
 import itertools
+import threading
 import time
 from botocore.exceptions import ClientError
 
 from c7n.actions import BaseAction
-from c7n.filters import ValueFilter, Filter, OPERATORS
+from c7n.filters import ValueFilter, Filter, OPERATORS, COST_RESOURCE_API
+from c7n.filters.related import RELATED_RESOURCES
+from c7n.filters.usage import UsageFilter
 from c7n.manager import resources
 from c7n.query import QueryResourceManager
-from c7n.utils import local_session, type_schema, chunks
+from c7n.utils import local_session, type_schema, chunks, parse_date
 
 
 @resources.register('iam-group')
@@ -132,63 +134,175 @@ class ServerCertificate(QueryResourceManager):
         dimension = None
 
 
-class IamRoleUsage(Filter):
+class IamInventory(object):
+    """An account's iam users, groups, roles and managed policies.
+
+    Retrieved in bulk with GetAccountAuthorizationDetails, a page of
+    entities at a time, rather than with per entity calls which iam
+    heavily throttles. Cached with the account's resources, and shared
+    by the filters of a run through :data:`IAM_INVENTORY`.
+    """
+
+    permissions = ('iam:GetAccountAuthorizationDetails',)
+
+    def __init__(self, details):
+        self.users = dict([
+            (u['UserName'], u) for u in details['UserDetailList']])
+        self.groups = dict([
+            (g['GroupName'], g) for g in details['GroupDetailList']])
+        self.roles = dict([
+            (r['RoleName'], r) for r in details['RoleDetailList']])
+        self.policies = dict([(p['Arn'], p) for p in details['Policies']])
+        self.group_users = {}
+        for u in self.users.values():
+            for g in u.get('GroupList', ()):
+                self.group_users.setdefault(g, []).append(u['UserName'])
+
+    @classmethod
+    def get(cls, manager):
+        key = {'resource': 'iam-inventory',
+               'account_id': manager.config.account_id}
+        details = manager._cache.get(key)
+        if details is None:
+            details = cls.fetch_details(manager)
+            manager._cache.save(key, details)
+        return cls(details)
+
+    @staticmethod
+    def fetch_details(manager):
+        client = local_session(manager.session_factory).client('iam')
+        paginator = client.get_paginator('get_account_authorization_details')
+        details = {'UserDetailList': [], 'GroupDetailList': [],
+                   'RoleDetailList': [], 'Policies': []}
+        for page in paginator.paginate(Filter=[
+                'User', 'Group', 'Role',
+                'LocalManagedPolicy', 'AWSManagedPolicy']):
+            for k in details:
+                details[k].extend(page.get(k, ()))
+        return details
+
+    def get_policy(self, arn):
+        """A managed policy, as described by GetPolicy."""
+        if arn not in self.policies:
+            return None
+        policy = dict(self.policies[arn])
+        policy.pop('PolicyVersionList', None)
+        return policy
+
+    def get_policy_document(self, arn, version_id):
+        for v in self.policies.get(arn, {}).get('PolicyVersionList', ()):
+            if v['VersionId'] == version_id:
+                return v['Document']
+
+
+class IamInventories(object):
+    """Iam inventories retrieved by the filters of a run, by account.
+
+    Only retained while enabled, ie. for the duration of ``custodian run``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.data = {}
+        self.hits = self.misses = 0
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        with self.lock:
+            self.enabled = False
+            self.data = {}
+            self.hits = self.misses = 0
+
+    def get(self, manager):
+        if not self.enabled:
+            return IamInventory.get(manager)
+        # retrieved under the lock, so concurrent policies don't each
+        # retrieve the same account's inventory.
+        key = getattr(manager.config, 'account_id', None)
+        with self.lock:
+            if key in self.data:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.data[key] = IamInventory.get(manager)
+            return self.data[key]
+
+    def summary(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+IAM_INVENTORY = IamInventories()
+
+
+class IamInventoryBase(object):
+    """Mixin base class for filters served from the iam inventory."""
+
+    permissions = IamInventory.permissions
+    inventory = None
+
+    # Filters over fewer resources than this use per entity calls.
+    InventoryThreshold = 50
+
+    def get_inventory(self, resources):
+        if len(resources) < self.InventoryThreshold:
+            return None
+        if self.inventory is None:
+            self.log.debug(
+                "Getting iam inventory for filter %s",
+                self.__class__.__name__)
+            self.inventory = IAM_INVENTORY.get(self.manager)
+        return self.inventory
+
+
+class IamRoleUsage(UsageFilter):
+
+    scanners = ('scan_lambda_roles', 'scan_ecs_roles',
+                'scan_asg_roles', 'scan_ec2_roles')
 
     def get_permissions(self):
         perms = list(itertools.chain([
             self.manager.get_resource_manager(m).get_permissions()
             for m in ['lambda', 'launch-config', 'ec2']]))
-        perms.extend(['ecs:DescribeClusters', 'ecs:DescribeServices'])
+        perms.extend(['ecs:ListClusters', 'ecs:ListServices',
+                      'ecs:DescribeServices'])
         return perms
 
-    def service_role_usage(self):
-        results = set()
-        results.update(self.scan_lambda_roles())
-        results.update(self.scan_ecs_roles())
-        results.update(self.scan_asg_roles())
-        results.update(self.scan_ec2_roles())
-        return results
-
-    def instance_profile_usage(self):
-        results = set()
-        results.update(self.scan_asg_roles())
-        results.update(self.scan_ec2_roles())
-        return results
+    def get_related(self, resource_type):
+        return RELATED_RESOURCES.get(
+            self.manager.get_resource_manager(resource_type)).values()
 
     def scan_lambda_roles(self):
-        manager = self.manager.get_resource_manager('lambda')
-        return [r['Role'] for r in manager.resources() if 'Role' in r]
+        for r in self.get_related('lambda'):
+            if 'Role' in r:
+                yield r['Role'], r['FunctionName']
 
     def scan_ecs_roles(self):
-        results = []
         client = local_session(self.manager.session_factory).client('ecs')
-        for cluster in client.describe_clusters()['clusters']:
-            services = client.list_services(
-                cluster=cluster['clusterName'])['serviceArns']
-            if services:
-                for service in client.describe_services(
-                        cluster=cluster['clusterName'],
-                        services=services)['services']:
-                    if 'roleArn' in service:
-                        results.append(service['roleArn'])
-        return results
+        for page in client.get_paginator('list_clusters').paginate():
+            for cluster in page['clusterArns']:
+                services = client.get_paginator('list_services').paginate(
+                    cluster=cluster)
+                for service_set in chunks(itertools.chain(*[
+                        p['serviceArns'] for p in services]), 10):
+                    for service in client.describe_services(
+                            cluster=cluster,
+                            services=service_set)['services']:
+                        if 'roleArn' in service:
+                            yield service['roleArn'], service['serviceArn']
 
     def scan_asg_roles(self):
-        manager = self.manager.get_resource_manager('launch-config')
-        return [r['IamInstanceProfile'] for r in manager.resources()
-                if 'IamInstanceProfile' in r]
+        for r in self.get_related('launch-config'):
+            if 'IamInstanceProfile' in r:
+                yield r['IamInstanceProfile'], r['LaunchConfigurationName']
 
     def scan_ec2_roles(self):
-        manager = self.manager.get_resource_manager('ec2')
-        results = []
-        for e in manager.resources():
-            if 'Instances' not in e:
-                continue
-            for i in e['Instances']:
-                if 'IamInstanceProfile' not in i:
-                    continue
-                results.append(i['IamInstanceProfile']['Arn'])
-        return results
+        for i in self.get_related('ec2'):
+            if 'IamInstanceProfile' in i:
+                yield i['IamInstanceProfile']['Arn'], i['InstanceId']
 
 
 ###################
@@ -202,7 +316,7 @@ class UsedIamRole(IamRoleUsage):
     schema = type_schema('used')
 
     def process(self, resources, event=None):
-        roles = self.service_role_usage()
+        roles = self.get_usage()
         results = []
         for r in resources:
             if r['Arn'] in roles or r['RoleName'] in roles:
@@ -218,7 +332,7 @@ class UnusedIamRole(IamRoleUsage):
     schema = type_schema('unused')
 
     def process(self, resources, event=None):
-        roles = self.service_role_usage()
+        roles = self.get_usage()
         results = []
         for r in resources:
             if r['Arn'] not in roles and r['RoleName'] not in roles:
@@ -229,7 +343,7 @@ class UnusedIamRole(IamRoleUsage):
 
 
 @Role.filter_registry.register('has-inline-policy')
-class IamRoleInlinePolicy(Filter):
+class IamRoleInlinePolicy(IamInventoryBase, Filter):
     """
         Filter IAM roles that have an inline-policy attached
 
@@ -238,21 +352,25 @@ class IamRoleInlinePolicy(Filter):
     """
 
     schema = type_schema('has-inline-policy', value={'type': 'boolean'})
-    permissions = ('iam:ListRolePolicies',)
+    permissions = ('iam:ListRolePolicies',) + IamInventory.permissions
 
     def _inline_policies(self, client, resource):
+        if self.inventory and resource['RoleName'] in self.inventory.roles:
+            return len(
+                self.inventory.roles[resource['RoleName']]['RolePolicyList'])
         return len(client.list_role_policies(
             RoleName=resource['RoleName'])['PolicyNames'])
 
     def process(self, resources, event=None):
         c = local_session(self.manager.session_factory).client('iam')
+        self.get_inventory(resources)
         if self.data.get('value', True):
             return [r for r in resources if self._inline_policies(c, r) > 0]
         return [r for r in resources if self._inline_policies(c, r) == 0]
 
 
 @Role.filter_registry.register('has-specific-managed-policy')
-class SpecificIamRoleManagedPolicy(Filter):
+class SpecificIamRoleManagedPolicy(IamInventoryBase, Filter):
     """Filter IAM roles that has a specific policy attached
 
     For example, if the user wants to check all roles with 'admin-policy':
@@ -268,21 +386,25 @@ class SpecificIamRoleManagedPolicy(Filter):
     """
 
     schema = type_schema('has-specific-managed-policy', value={'type': 'string'})
-    permissions = ('iam:ListAttachedRolePolicies',)
+    permissions = ('iam:ListAttachedRolePolicies',) + IamInventory.permissions
 
     def _managed_policies(self, client, resource):
+        if self.inventory and resource['RoleName'] in self.inventory.roles:
+            return [p['PolicyName'] for p in self.inventory.roles[
+                resource['RoleName']]['AttachedManagedPolicies']]
         return [r['PolicyName'] for r in client.list_attached_role_policies(
             RoleName=resource['RoleName'])['AttachedPolicies']]
 
     def process(self, resources, event=None):
         c = local_session(self.manager.session_factory).client('iam')
+        self.get_inventory(resources)
         if self.data.get('value'):
             return [r for r in resources if self.data.get('value') in self._managed_policies(c, r)]
         return []
 
 
 @Role.filter_registry.register('no-specific-managed-policy')
-class NoSpecificIamRoleManagedPolicy(Filter):
+class NoSpecificIamRoleManagedPolicy(SpecificIamRoleManagedPolicy):
     """Filter IAM roles that do not have a specific policy attached
 
     For example, if the user wants to check all roles without 'ip-restriction':
@@ -298,14 +420,10 @@ class NoSpecificIamRoleManagedPolicy(Filter):
     """
 
     schema = type_schema('no-specific-managed-policy', value={'type': 'string'})
-    permissions = ('iam:ListAttachedRolePolicies',)
-
-    def _managed_policies(self, client, resource):
-        return [r['PolicyName'] for r in client.list_attached_role_policies(
-            RoleName=resource['RoleName'])['AttachedPolicies']]
 
     def process(self, resources, event=None):
         c = local_session(self.manager.session_factory).client('iam')
+        self.get_inventory(resources)
         if self.data.get('value'):
             return [r for r in resources if not self.data.get('value') in
             self._managed_policies(c, r)]
@@ -338,7 +456,7 @@ class UnusedIamPolicies(Filter):
 
 
 @Policy.filter_registry.register('has-allow-all')
-class AllowAllIamPolicies(Filter):
+class AllowAllIamPolicies(IamInventoryBase, Filter):
     """Check if IAM policy resource(s) have allow-all IAM policy statement block.
 
     This allows users to implement CIS AWS check 1.24 which states that no
@@ -379,13 +497,18 @@ class AllowAllIamPolicies(Filter):
 
     """
     schema = type_schema('has-allow-all')
-    permissions = ('iam:ListPolicies', 'iam:ListPolicyVersions')
+    permissions = ('iam:ListPolicies', 'iam:ListPolicyVersions') + (
+        IamInventory.permissions)
 
     def has_allow_all_policy(self, client, resource):
-        statements = client.get_policy_version(
-            PolicyArn=resource['Arn'],
-            VersionId=resource['DefaultVersionId']
-        )['PolicyVersion']['Document']['Statement']
+        document = self.inventory and self.inventory.get_policy_document(
+            resource['Arn'], resource['DefaultVersionId'])
+        if not document:
+            document = client.get_policy_version(
+                PolicyArn=resource['Arn'],
+                VersionId=resource['DefaultVersionId']
+            )['PolicyVersion']['Document']
+        statements = document['Statement']
         if isinstance(statements, dict):
             statements = [statements]
 
@@ -402,6 +525,7 @@ class AllowAllIamPolicies(Filter):
 
     def process(self, resources, event=None):
         c = local_session(self.manager.session_factory).client('iam')
+        self.get_inventory(resources)
         results = [r for r in resources if self.has_allow_all_policy(c, r)]
         self.log.info(
             "%d of %d iam policies have allow all.",
@@ -417,10 +541,11 @@ class AllowAllIamPolicies(Filter):
 class UsedInstanceProfiles(IamRoleUsage):
 
     schema = type_schema('used')
+    scanners = ('scan_asg_roles', 'scan_ec2_roles')
 
     def process(self, resources, event=None):
         results = []
-        profiles = self.instance_profile_usage()
+        profiles = self.get_usage()
         for r in resources:
             if r['Arn'] in profiles or r['InstanceProfileName'] in profiles:
                 results.append(r)
@@ -434,12 +559,13 @@ class UsedInstanceProfiles(IamRoleUsage):
 class UnusedInstanceProfiles(IamRoleUsage):
 
     schema = type_schema('unused')
+    scanners = ('scan_asg_roles', 'scan_ec2_roles')
 
     def process(self, resources, event=None):
         results = []
-        profiles = self.instance_profile_usage()
+        profiles = self.get_usage()
         for r in resources:
-            if (r['Arn'] not in profiles or r['InstanceProfileName'] not in profiles):
+            if (r['Arn'] not in profiles and r['InstanceProfileName'] not in profiles):
                 results.append(r)
         self.log.info(
             "%d of %d instance profiles currently not in use." % (
@@ -650,7 +776,7 @@ class UserCredentialReport(CredentialReport):
 
 
 @User.filter_registry.register('policy')
-class UserPolicy(ValueFilter):
+class UserPolicy(IamInventoryBase, ValueFilter):
     """Filter IAM users based on attached policy values
 
     :example:
@@ -667,20 +793,29 @@ class UserPolicy(ValueFilter):
     """
 
     schema = type_schema('policy', rinherit=ValueFilter.schema)
-    permissions = ('iam:ListAttachedUserPolicies',)
+    cost = COST_RESOURCE_API
+    permissions = ('iam:ListAttachedUserPolicies',) + IamInventory.permissions
 
     def user_policies(self, user_set):
         client = local_session(self.manager.session_factory).client('iam')
+        inventory = self.inventory
         for u in user_set:
             if 'c7n:Policies' not in u:
                 u['c7n:Policies'] = []
-            aps = client.list_attached_user_policies(
-                UserName=u['UserName'])['AttachedPolicies']
+            if inventory and u['UserName'] in inventory.users:
+                aps = inventory.users[u['UserName']]['AttachedManagedPolicies']
+            else:
+                aps = client.list_attached_user_policies(
+                    UserName=u['UserName'])['AttachedPolicies']
             for ap in aps:
-                u['c7n:Policies'].append(
-                    client.get_policy(PolicyArn=ap['PolicyArn'])['Policy'])
+                policy = inventory and inventory.get_policy(ap['PolicyArn'])
+                if policy is None:
+                    policy = client.get_policy(
+                        PolicyArn=ap['PolicyArn'])['Policy']
+                u['c7n:Policies'].append(policy)
 
     def process(self, resources, event=None):
+        self.get_inventory(resources)
         user_set = chunks(resources, size=50)
         with self.executor_factory(max_workers=2) as w:
             self.log.debug(
@@ -690,7 +825,6 @@ class UserPolicy(ValueFilter):
         matched = []
         for r in resources:
             for p in r['c7n:Policies']:
-                print p
                 if self.match(p) and r not in matched:
                     matched.append(r)
         return matched
@@ -714,6 +848,7 @@ class UserAccessKey(ValueFilter):
     """
 
     schema = type_schema('access-key', rinherit=ValueFilter.schema)
+    cost = COST_RESOURCE_API
     permissions = ('iam:ListAccessKeys',)
 
     def user_keys(self, user_set):
@@ -742,6 +877,7 @@ class UserAccessKey(ValueFilter):
 class UserMfaDevice(ValueFilter):
 
     schema = type_schema('mfa-device', rinherit=ValueFilter.schema)
+    cost = COST_RESOURCE_API
     permissions = ('iam:ListMfaDevices',)
 
     def __init__(self, *args, **kw):
@@ -794,7 +930,7 @@ class UserRemoveAccessKey(BaseAction):
             keys = r['AccessKeys']
             for k in keys:
                 if age:
-                    if not parse(k['CreateDate']) < threshold_date:
+                    if not parse_date(k['CreateDate']) < threshold_date:
                         continue
                 if disable:
                     client.update_access_key(
@@ -813,7 +949,7 @@ class UserRemoveAccessKey(BaseAction):
 
 
 @Group.filter_registry.register('has-users')
-class IamGroupUsers(Filter):
+class IamGroupUsers(IamInventoryBase, Filter):
     """
         Filter IAM groups that have users attached based on True/False value:
 
@@ -821,20 +957,24 @@ class IamGroupUsers(Filter):
         False: Filter all IAM groups without any users assigned to it
     """
     schema = type_schema('has-users', value={'type': 'boolean'})
-    permissions = ('iam:GetGroup',)
+    permissions = ('iam:GetGroup',) + IamInventory.permissions
 
     def _user_count(self, client, resource):
+        if self.inventory and resource['GroupName'] in self.inventory.groups:
+            return len(self.inventory.group_users.get(
+                resource['GroupName'], ()))
         return len(client.get_group(GroupName=resource['GroupName'])['Users'])
 
     def process(self, resources, events=None):
         c = local_session(self.manager.session_factory).client('iam')
+        self.get_inventory(resources)
         if self.data.get('value', True):
             return [r for r in resources if self._user_count(c, r) > 0]
         return [r for r in resources if self._user_count(c, r) == 0]
 
 
 @Group.filter_registry.register('has-inline-policy')
-class IamGroupInlinePolicy(Filter):
+class IamGroupInlinePolicy(IamInventoryBase, Filter):
     """
         Filter IAM groups that have an inline-policy based on boolean value:
 
@@ -842,14 +982,18 @@ class IamGroupInlinePolicy(Filter):
         False: Filter all groups that do not have an inline-policy attached
     """
     schema = type_schema('has-inline-policy', value={'type': 'boolean'})
-    permissions = ('iam:ListGroupPolicies',)
+    permissions = ('iam:ListGroupPolicies',) + IamInventory.permissions
 
     def _inline_policies(self, client, resource):
+        if self.inventory and resource['GroupName'] in self.inventory.groups:
+            return len(self.inventory.groups[
+                resource['GroupName']]['GroupPolicyList'])
         return len(client.list_group_policies(
             GroupName=resource['GroupName'])['PolicyNames'])
 
     def process(self, resources, events=None):
         c = local_session(self.manager.session_factory).client('iam')
+        self.get_inventory(resources)
         if self.data.get('value', True):
             return [r for r in resources if self._inline_policies(c, r) > 0]
         return [r for r in resources if self._inline_policies(c, r) == 0]
@@ -13,7 +13,9 @@
 # limitations under the License.
 import logging
 
-from c7n.filters import Filter, CrossAccountAccessFilter, ValueFilter
+from c7n.filters import (
+    Filter, CrossAccountAccessFilter, ValueFilter, COST_BATCH_API,
+    COST_RESOURCE_API)
 from c7n.manager import resources
 from c7n.query import QueryResourceManager
 from c7n.utils import local_session, type_schema
@@ -78,6 +80,7 @@ class KeyRotationStatus(ValueFilter):
     """
 
     schema = type_schema('key-rotation-status', rinherit=ValueFilter.schema)
+    cost = COST_RESOURCE_API
     permissions = ('kms:GetKeyRotationStatus',)
 
     def process(self, resources, event=None):
@@ -180,6 +183,7 @@ class GrantCount(Filter):
 class ResourceKmsKeyAlias(ValueFilter):
 
     schema = type_schema('kms-alias', rinherit=ValueFilter.schema)
+    cost = COST_BATCH_API
 
     def get_permissions(self):
         return KeyAlias(self.manager.ctx, {}).get_permissions()
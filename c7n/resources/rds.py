@@ -96,6 +96,9 @@ class RDS(QueryResourceManager):
         date = 'InstanceCreateTime'
         dimension = 'DBInstanceIdentifier'
         config_type = 'AWS::RDS::DBInstance'
+        filter_pushdown = {
+            'DBInstanceIdentifier': 'db-instance-id',
+            'DBClusterIdentifier': 'db-cluster-id'}
 
         default_report_fields = (
             'DBInstanceIdentifier',
@@ -130,12 +133,14 @@ class RDS(QueryResourceManager):
         filter(None, _rds_tags(
             self.get_model(),
             dbs, self.session_factory, self.executor_factory,
-            self.generate_arn, self.retry))
+            self.generate_arn, self.retry,
+            self.get_controller(initial=1, max_workers=1)))
         return dbs
 
 
 def _rds_tags(
-        model, dbs, session_factory, executor_factory, generator, retry):
+        model, dbs, session_factory, executor_factory, generator, retry,
+        controller):
     """Augment rds instances with their respective tags."""
 
     def process_tags(db):
@@ -153,8 +158,9 @@ def _rds_tags(
         return db
 
     # Rds maintains a low api call limit, so this can take some time :-(
-    with executor_factory(max_workers=1) as w:
-        return list(w.map(process_tags, dbs))
+    with executor_factory(max_workers=controller.maximum) as w:
+        return list(w.map(
+            functools.partial(controller.run, process_tags), dbs))
 
 
 def _db_instance_eligible_for_backup(resource):
@@ -837,12 +843,14 @@ class RDSSnapshot(QueryResourceManager):
         filter(None, _rds_snap_tags(
             self.get_model(),
             snaps, self.session_factory, self.executor_factory,
-            self.generate_arn, self.retry))
+            self.generate_arn, self.retry,
+            self.get_controller(initial=1, max_workers=1)))
         return snaps
 
 
 def _rds_snap_tags(
-        model, snaps, session_factory, executor_factory, generator, retry):
+        model, snaps, session_factory, executor_factory, generator, retry,
+        controller):
     """Augment rds snapshots with their respective tags."""
 
     def process_tags(snap):
@@ -861,8 +869,9 @@ def _rds_snap_tags(
         snap['Tags'] = tag_list or []
         return snap
 
-    with executor_factory(max_workers=1) as w:
-        return filter(None, (w.map(process_tags, snaps)))
+    with executor_factory(max_workers=controller.maximum) as w:
+        return filter(None, (w.map(
+            functools.partial(controller.run, process_tags), snaps)))
 
 
 @RDSSnapshot.filter_registry.register('latest')
@@ -871,6 +880,7 @@ class LatestSnapshot(Filter):
     """
     schema = type_schema('latest', automatic={'type': 'boolean'})
     permissions = ('rds:DescribeDBSnapshots',)
+    barrier = True
 
     def process(self, resources, event=None):
         results = []
@@ -20,7 +20,7 @@ from concurrent.futures import as_completed
 
 from c7n.actions import ActionRegistry, BaseAction, ModifyVpcSecurityGroupsAction
 from c7n.filters import (
-    FilterRegistry, ValueFilter, DefaultVpcBase, AgeFilter, OPERATORS)
+    FilterRegistry, ValueFilter, DefaultVpcBase, AgeFilter, OPERATORS, COST_BATCH_API)
 import c7n.filters.vpc as net_filters
 
 from c7n.manager import resources
@@ -138,6 +138,7 @@ class Parameter(ValueFilter):
     """
 
     schema = type_schema('param', rinherit=ValueFilter.schema)
+    cost = COST_BATCH_API
     group_params = ()
 
     permissions = ("redshift:DescribeClusterParameters",)
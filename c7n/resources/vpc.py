@@ -23,7 +23,9 @@ from c7n.actions import BaseAction, ModifyVpcSecurityGroupsAction
 from c7n.filters import (
     DefaultVpcBase, Filter, FilterValidationError, ValueFilter)
 import c7n.filters.vpc as net_filters
+from c7n.filters.related import RELATED_RESOURCES
 from c7n.filters.revisions import Diff
+from c7n.filters.usage import UsageFilter
 from c7n.query import QueryResourceManager
 from c7n.manager import resources
 from c7n.utils import (
@@ -189,6 +191,13 @@ class SecurityGroup(QueryResourceManager):
         dimension = None
         config_type = "AWS::EC2::SecurityGroup"
         id_prefix = "sg-"
+        filter_pushdown = {
+            'GroupId': 'group-id',
+            'GroupName': 'group-name',
+            'VpcId': 'vpc-id',
+            'OwnerId': 'owner-id',
+            'Description': 'description'}
+        filter_pushdown_tags = True
 
 
 @SecurityGroup.filter_registry.register('diff')
@@ -381,7 +390,10 @@ class SecurityGroupPatch(object):
                        IpPermissions=[r for r in delta['added']])
 
 
-class SGUsage(Filter):
+class SGUsage(UsageFilter):
+
+    scanners = ('get_eni_sgs', 'get_sg_refs',
+                'get_lambda_sgs', 'get_launch_config_sgs')
 
     def get_permissions(self):
         return list(itertools.chain(
@@ -405,57 +417,42 @@ class SGUsage(Filter):
         return [r for r in resources if r['GroupId'] not in peered_ids]
 
     def scan_groups(self):
-        used = set()
-        for kind, scanner in (
-                ("nics", self.get_eni_sgs),
-                ("sg-perm-refs", self.get_sg_refs),
-                ('lambdas', self.get_lambda_sgs),
-                ("launch-configs", self.get_launch_config_sgs),
-        ):
-            sg_ids = scanner()
-            new_refs = sg_ids.difference(used)
-            used = used.union(sg_ids)
-            self.log.debug(
-                "%s using %d sgs, new refs %s total %s",
-                kind, len(sg_ids), len(new_refs), len(used))
-
+        used = self.get_usage()
+        self.log.debug("%d sgs in use", len(used))
         return used
 
+    def get_related(self, resource_type):
+        return RELATED_RESOURCES.get(
+            self.manager.get_resource_manager(resource_type)).values()
+
     def get_launch_config_sgs(self):
         # Note assuming we also have launch config garbage collection
         # enabled.
-        sg_ids = set()
-        for cfg in self.manager.get_resource_manager('launch-config').resources():
+        for cfg in self.get_related('launch-config'):
+            name = cfg['LaunchConfigurationName']
             for g in cfg['SecurityGroups']:
-                sg_ids.add(g)
+                yield g, name
             for g in cfg['ClassicLinkVPCSecurityGroups']:
-                sg_ids.add(g)
-        return sg_ids
+                yield g, name
 
     def get_lambda_sgs(self):
-        sg_ids = set()
-        for func in self.manager.get_resource_manager('lambda').resources():
+        for func in self.get_related('lambda'):
             if 'VpcConfig' not in func:
                 continue
             for g in func['VpcConfig']['SecurityGroupIds']:
-                sg_ids.add(g)
-        return sg_ids
+                yield g, func['FunctionName']
 
     def get_eni_sgs(self):
-        sg_ids = set()
-        for nic in self.manager.get_resource_manager('eni').resources():
+        for nic in self.get_related('eni'):
             for g in nic['Groups']:
-                sg_ids.add(g['GroupId'])
-        return sg_ids
+                yield g['GroupId'], nic['NetworkInterfaceId']
 
     def get_sg_refs(self):
-        sg_ids = set()
-        for sg in self.manager.get_resource_manager('security-group').resources():
+        for sg in self.get_related('security-group'):
             for perm_type in ('IpPermissions', 'IpPermissionsEgress'):
                 for p in sg.get(perm_type, []):
                     for g in p.get('UserIdGroupPairs', ()):
-                        sg_ids.add(g['GroupId'])
-        return sg_ids
+                        yield g['GroupId'], sg['GroupId']
 
 
 @SecurityGroup.filter_registry.register('unused')
@@ -946,6 +943,16 @@ class NetworkInterface(QueryResourceManager):
         date = None
         config_type = "AWS::EC2::NetworkInterface"
         id_prefix = "eni-"
+        filter_pushdown = {
+            'NetworkInterfaceId': 'network-interface-id',
+            'Status': 'status',
+            'VpcId': 'vpc-id',
+            'SubnetId': 'subnet-id',
+            'AvailabilityZone': 'availability-zone',
+            'Description': 'description',
+            'RequesterManaged': 'requester-managed',
+            'SourceDestCheck': 'source-dest-check'}
+        filter_pushdown_tags = True
 
 
 NetworkInterface.filter_registry.register('flow-logs', FlowLogFilter)
@@ -22,11 +22,10 @@ snapshots).
 from concurrent.futures import as_completed
 
 from datetime import datetime, timedelta
-from dateutil.parser import parse
 from dateutil.tz import tzutc
 
 from c7n.actions import BaseAction as Action
-from c7n.filters import Filter, OPERATORS, FilterValidationError
+from c7n.filters import Filter, OPERATORS, FilterValidationError, COST_MEMORY
 from c7n import utils
 
 DEFAULT_TAG = "maid_status"
@@ -107,8 +106,8 @@ class TagTrim(Action):
         # without some more complex matching wrt to grouping resources
         # by common tags populations.
         tag_map = {
-            t['Key']:t['Value'] for t in i.get('Tags', [])
-            if not t['Key'].startswith('aws:')}
+            k: v for k, v in utils.tag_map(i).items()
+            if not k.startswith('aws:')}
 
         # Space == 0 means remove all but specified
         if self.space and len(tag_map) + self.space <= self.max_tag_count:
@@ -172,6 +171,9 @@ class TagActionFilter(Filter):
             - stop
 
     """
+    cost = COST_MEMORY
+    shareable = True
+
     schema = utils.type_schema(
         'marked-for-op',
         tag={'type': 'string'},
@@ -191,12 +193,7 @@ class TagActionFilter(Filter):
         op = self.data.get('op', 'stop')
         skew = self.data.get('skew', 0)
 
-        v = None
-        for n in i.get('Tags', ()):
-            if n['Key'] == tag:
-                v = n['Value']
-                break
-
+        v = utils.get_tag_value(i, tag)
         if v is None:
             return False
         if ':' not in v or '@' not in v:
@@ -209,7 +206,7 @@ class TagActionFilter(Filter):
             return False
 
         try:
-            action_date = parse(action_date_str)
+            action_date = utils.parse_date(action_date_str)
         except:
             self.log.warning("could not parse tag:%s value:%s on %s" % (
                 tag, v, i['InstanceId']))
@@ -237,6 +234,9 @@ class TagCountFilter(Filter):
            - type: tag-count
              value: 8
     """
+    cost = COST_MEMORY
+    shareable = True
+
     schema = utils.type_schema(
         'tag-count',
         count={'type': 'integer', 'minimum': 0},
@@ -247,8 +247,7 @@ class TagCountFilter(Filter):
         op_name = self.data.get('op', 'gte')
         op = OPERATORS.get(op_name)
         tag_count = len([
-            t['Key'] for t in i.get('Tags', [])
-            if not t['Key'].startswith('aws:')])
+            k for k in utils.tag_map(i) if not k.startswith('aws:')])
         return op(tag_count, count)
 
 
@@ -297,12 +296,14 @@ class Tag(Action):
             tags.append({'Key': tag, 'Value': msg})
 
         batch_size = self.data.get('batch_size', self.batch_size)
+        controller = self.manager.get_controller(initial=self.concurrency)
 
-        with self.executor_factory(max_workers=self.concurrency) as w:
+        with self.executor_factory(max_workers=controller.maximum) as w:
             futures = {}
             for resource_set in utils.chunks(resources, size=batch_size):
                 futures[
                     w.submit(
+                        controller.run,
                         self.process_resource_set, resource_set, tags)
                 ] = resource_set
 
@@ -343,12 +344,14 @@ class RemoveTag(Action):
 
         tags = self.data.get('tags', [DEFAULT_TAG])
         batch_size = self.data.get('batch_size', self.batch_size)
+        controller = self.manager.get_controller(initial=self.concurrency)
 
-        with self.executor_factory(max_workers=self.concurrency) as w:
+        with self.executor_factory(max_workers=controller.maximum) as w:
             futures = {}
             for resource_set in utils.chunks(resources, size=batch_size):
                 futures[
                     w.submit(
+                        controller.run,
                         self.process_resource_set, resource_set, tags)
                 ] = resource_set
 
@@ -427,7 +430,7 @@ class RenameTag(Action):
         old_key = self.data.get('old_key', None)
         resource_set = {}
         for r in instances:
-            tags = {t['Key']: t['Value'] for t in r.get('Tags', [])}
+            tags = utils.tag_map(r)
             if tags[old_key] not in resource_set:
                 resource_set[tags[old_key]] = []
             resource_set[tags[old_key]].append(r)
@@ -437,7 +440,7 @@ class RenameTag(Action):
         old_key = self.data.get('old_key', None)
         res = 0
         for r in resources:
-            tags = {t['Key']: t['Value'] for t in r.get('Tags', [])}
+            tags = utils.tag_map(r)
             if old_key not in tags.keys():
                 resources.pop(res)
             res += 1
@@ -525,11 +528,13 @@ class TagDelayedAction(Action):
 
         tags = [{'Key': tag, 'Value': msg}]
 
-        with self.executor_factory(max_workers=2) as w:
+        controller = self.manager.get_controller(initial=2)
+        with self.executor_factory(max_workers=controller.maximum) as w:
             futures = []
             for resource_set in utils.chunks(resources, size=self.batch_size):
                 futures.append(
-                    w.submit(self.process_resource_set, resource_set, tags))
+                    w.submit(controller.run,
+                             self.process_resource_set, resource_set, tags))
 
             for f in as_completed(futures):
                 if f.exception():
@@ -625,7 +630,7 @@ class NormalizeTag(Action):
         key = self.data.get('key', None)
         resource_set = {}
         for r in instances:
-            tags = {t['Key']: t['Value'] for t in r.get('Tags', [])}
+            tags = utils.tag_map(r)
             if tags[key] not in resource_set:
                 resource_set[tags[key]] = []
             resource_set[tags[key]].append(r)
@@ -635,7 +640,7 @@ class NormalizeTag(Action):
         key = self.data.get('key', None)
         res = 0
         for r in resources:
-            tags = {t['Key']: t['Value'] for t in r.get('Tags', [])}
+            tags = utils.tag_map(r)
             if key not in tags.keys():
                 resources.pop(res)
             res += 1
@@ -11,9 +11,13 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 import boto3
+from collections import OrderedDict
+from dateutil.parser import parse as date_parse
+from dateutil.tz import tzoffset, tzutc
 import copy
 from datetime import datetime
 import functools
@@ -22,9 +26,11 @@ import itertools
 import logging
 import os
 import random
+import re
 import threading
 import time
 import ipaddress
+import jmespath
 
 # Try to place nice in lambda exec environment
 # where we don't require yaml
@@ -45,6 +51,8 @@ else:
 
 from StringIO import StringIO
 
+from c7n.executor import THROTTLE_CODES, notify_throttle
+
 
 class VarsSubstitutionError(Exception):
     pass
@@ -218,23 +226,137 @@ def query_instances(session, client=None, **query):
 
 CONN_CACHE = threading.local()
 
+# Sessions and pooled clients are renewed after this many seconds.
+SESSION_TTL = 60 * 45
+
 
 def local_session(factory):
-    """Cache a session thread local for up to 45m"""
-    s = getattr(CONN_CACHE, 'session', None)
-    t = getattr(CONN_CACHE, 'time', 0)
+    """Cache a session thread local for up to 45m, per session factory.
+
+    Clients created from the returned session are served from the
+    process wide :data:`CLIENT_POOL`.
+    """
+    sessions = getattr(CONN_CACHE, 'sessions', None)
+    if sessions is None:
+        sessions = CONN_CACHE.sessions = {}
     n = time.time()
-    if s is not None and t + (60 * 45) > n:
+    f, s, t = sessions.get(id(factory), (None, None, 0))
+    if f is factory and t + SESSION_TTL > n:
         return s
-    s = factory()
-    CONN_CACHE.session = s
-    CONN_CACHE.time = n
+    s = PooledSession(factory, factory())
+    sessions[id(factory)] = (factory, s, n)
     return s
 
 
-def reset_session_cache():
-    setattr(CONN_CACHE, 'session', None)
-    setattr(CONN_CACHE, 'time', 0)
+def reset_session_cache(factory=None):
+    """Drop the thread's sessions and the pooled clients.
+
+    Given a session factory, only its pooled clients are dropped.
+    """
+    setattr(CONN_CACHE, 'sessions', {})
+    CLIENT_POOL.clear(factory)
+
+
+class PooledSession(object):
+    """A boto3 session proxy whose clients come from the client pool."""
+
+    def __init__(self, factory, session):
+        self.factory = factory
+        self.session = session
+
+    def client(self, service_name, region_name=None, config=None, **kw):
+        if kw:
+            return self.session.client(
+                service_name, region_name=region_name, config=config, **kw)
+        return CLIENT_POOL.client(
+            self.factory, self.session, service_name, region_name, config)
+
+    def __getattr__(self, k):
+        return getattr(self.session, k)
+
+
+class ClientPool(object):
+    """Process wide pool of boto3 clients.
+
+    Client construction loads the service model and sets up the endpoint,
+    which is expensive relative to most api calls, while clients are
+    safe to share across threads. Clients are keyed by session factory,
+    region, service and client config, and are recreated after
+    SESSION_TTL, by which time sts assumed role credentials would have
+    been renewed. The pool is bounded, evicting the least recently used
+    clients.
+
+    Each client's http connection pool is sized via `max_connections`,
+    to match the number of threads that may share it, clients with a
+    smaller pool are recreated after a resize.
+    """
+
+    max_size = 256
+    max_connections = 10
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = OrderedDict()
+
+    def resize(self, workers):
+        """Size client connection pools for the given executor width."""
+        self.max_connections = max(ClientPool.max_connections, workers)
+
+    def get_entry(self, key, factory):
+        """The pooled client entry for key if still valid, under the lock."""
+        entry = self.clients.pop(key, None)
+        if entry is None or entry[0] is not factory or (
+                entry[2] + SESSION_TTL < time.time()) or (
+                entry[3] < self.max_connections):
+            return None
+        # most recently used clients go to the end
+        self.clients[key] = entry
+        return entry
+
+    def client(self, factory, session, service_name,
+               region_name=None, config=None):
+        region_name = region_name or session.region_name
+        key = (id(factory), region_name, service_name, config_key(config))
+        with self.lock:
+            entry = self.get_entry(key, factory)
+        if entry is not None:
+            return entry[1]
+
+        # built outside the lock, the session is the calling thread's own
+        max_connections = self.max_connections
+        pool_config = Config(max_pool_connections=max_connections)
+        if config is not None:
+            pool_config = pool_config.merge(config)
+        client = session.client(
+            service_name, region_name=region_name, config=pool_config)
+
+        with self.lock:
+            # another thread may have pooled one meanwhile
+            entry = self.get_entry(key, factory)
+            if entry is None:
+                entry = self.clients[key] = (
+                    factory, client, time.time(), max_connections)
+                while len(self.clients) > self.max_size:
+                    self.clients.popitem(last=False)
+        return entry[1]
+
+    def clear(self, factory=None):
+        with self.lock:
+            if factory is None:
+                self.clients.clear()
+                return
+            for key, entry in self.clients.items():
+                if entry[0] is factory:
+                    del self.clients[key]
+
+
+def config_key(config):
+    if config is None:
+        return None
+    return repr(sorted(config._user_provided_options.items()))
+
+
+CLIENT_POOL = ClientPool()
 
 
 def annotation(i, k):
@@ -262,6 +384,88 @@ def set_annotation(i, k, v):
         i[k] = v
 
 
+def _invalidates(method):
+    def wrapper(self, *args, **kw):
+        self._maps = None
+        return method(self, *args, **kw)
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
+class TagIndex(list):
+    """A resource's ``Tags`` list along with key lookup maps.
+
+    The maps are built on first use, and dropped whenever the list is
+    modified. They're a side structure, the index serializes (json,
+    pickle, copy) as a plain list so they never land in resources.json
+    or the cache.
+    """
+
+    __slots__ = ('_maps',)
+
+    def __init__(self, tags=()):
+        super(TagIndex, self).__init__(tags)
+        self._maps = None
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+    def get_maps(self):
+        maps = self._maps
+        if maps is None:
+            exact, lower = {}, {}
+            for t in self:
+                k = t.get('Key')
+                if k is None:
+                    continue
+                # first occurrence wins, as with a linear scan
+                exact.setdefault(k, t.get('Value'))
+                lower.setdefault(k.lower(), t.get('Value'))
+            maps = self._maps = (exact, lower)
+        return maps
+
+
+for _name in ('append', 'extend', 'insert', 'remove', 'pop', 'sort',
+              'reverse', '__setitem__', '__delitem__', '__setslice__',
+              '__delslice__', '__iadd__', '__imul__'):
+    setattr(TagIndex, _name, _invalidates(getattr(list, _name)))
+del _name
+
+
+def index_tags(resources):
+    """Attach a :class:`TagIndex` to each resource's ``Tags``."""
+    for r in resources:
+        tags = r.get('Tags')
+        if isinstance(tags, (list, tuple)) and not isinstance(
+                tags, TagIndex):
+            r['Tags'] = TagIndex(tags)
+    return resources
+
+
+def tag_map(i, lower=False):
+    """Map of a resource's tag keys to values.
+
+    With ``lower`` keys are lower cased. The map is shared, callers
+    must not modify it.
+    """
+    tags = i.get('Tags')
+    if not isinstance(tags, TagIndex):
+        if not isinstance(tags, (list, tuple)):
+            return {}
+        tags = i['Tags'] = TagIndex(tags)
+    return tags.get_maps()[lower and 1 or 0]
+
+
+def get_tag_value(i, key, lower=False):
+    """Value of the resource's tag ``key``, or None.
+
+    With ``lower`` the key is matched case insensitively.
+    """
+    if lower:
+        return tag_map(i, True).get(key.lower())
+    return tag_map(i).get(key)
+
+
 def parse_s3(s3_path):
     if not s3_path.startswith('s3://'):
         raise ValueError("invalid s3 path")
@@ -320,15 +524,27 @@ def get_retry(codes=(), max_attempts=8, min_delay=1, log_retries=False):
     max_delay = max(min_delay, 2) ** max_attempts
 
     def _retry(func, *args, **kw):
+        endpoint = api_endpoint(func)
+        limiter = endpoint and API_LIMITS.limiter(*endpoint)
         for idx, delay in enumerate(
                 backoff_delays(min_delay, max_delay, jitter=True)):
+            if limiter:
+                limiter.acquire()
             try:
                 return func(*args, **kw)
             except ClientError as e:
-                if e.response['Error']['Code'] not in codes:
+                code = e.response['Error']['Code']
+                if code not in codes:
                     raise
                 elif idx == max_attempts - 1:
                     raise
+                throttled = code in THROTTLE_CODES
+                if endpoint:
+                    API_LIMITS.record(endpoint[0], func.__name__, throttled)
+                if throttled:
+                    notify_throttle(code)
+                    if limiter:
+                        limiter.trip(delay)
                 if log_retries:
                     worker_log.log(
                         log_retries,
@@ -338,6 +554,170 @@ def get_retry(codes=(), max_attempts=8, min_delay=1, log_retries=False):
     return _retry
 
 
+def api_endpoint(func):
+    """Return the (service, region) of a boto3 client method, or None."""
+    meta = getattr(getattr(func, '__self__', None), 'meta', None)
+    if meta is None or not hasattr(meta, 'service_model'):
+        return None
+    return meta.service_model.service_name, meta.region_name
+
+
+class RateLimiter(object):
+    """Token bucket for calls to an api endpoint, with a circuit breaker.
+
+    When ``rate`` (calls per second) is set, callers block until a token is
+    available, bursts of up to ``burst`` calls are allowed. A throttled call
+    trips the breaker, pausing every caller of the endpoint until the
+    throttled call's backoff has elapsed, rather than having each thread
+    retry into the throttle on its own schedule.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self.lock = threading.Lock()
+        self.open_until = 0
+        self.configure(rate, burst)
+
+    def configure(self, rate=None, burst=None):
+        with self.lock:
+            self.rate = rate
+            self.burst = burst or max(1, rate or 1)
+            self.tokens = self.burst
+            self.updated = time.time()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                n = time.time()
+                wait = self.open_until - n
+                if wait > 0:
+                    # spread callers out as the breaker closes
+                    wait += wait * 0.1 * random.random()
+                elif not self.rate:
+                    return
+                else:
+                    self.tokens = min(
+                        self.burst,
+                        self.tokens + (n - self.updated) * self.rate)
+                    self.updated = n
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def trip(self, delay):
+        """Open the breaker for delay seconds."""
+        with self.lock:
+            self.open_until = max(self.open_until, time.time() + delay)
+
+
+class ApiLimits(object):
+    """Process wide rate limiters by api endpoint, and retry statistics.
+
+    Rates are configured per service name, ie. ``{'rds': 5}``, services
+    without a configured rate are only subject to the circuit breaker.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rates = {}
+        self.limiters = {}
+        self.stats = {}
+
+    def configure(self, *rates):
+        """Set the rates, from mappings or sequences of (service, rate).
+
+        Where several set a service's rate, the lowest applies.
+        """
+        merged = {}
+        for r in rates:
+            for service, rate in dict(r or ()).items():
+                merged[service] = min(rate, merged.get(service, rate))
+        with self.lock:
+            self.rates = merged
+            for (service, region), limiter in self.limiters.items():
+                limiter.configure(self.rates.get(service))
+
+    def limiter(self, service, region):
+        with self.lock:
+            limiter = self.limiters.get((service, region))
+            if limiter is None:
+                limiter = self.limiters[(service, region)] = RateLimiter(
+                    self.rates.get(service))
+            return limiter
+
+    def record(self, service, operation, throttled=False):
+        with self.lock:
+            s = self.stats.setdefault(
+                "%s.%s" % (service, operation), {'retries': 0, 'throttles': 0})
+            s['retries'] += 1
+            if throttled:
+                s['throttles'] += 1
+
+    def summary(self):
+        with self.lock:
+            return {k: dict(v) for k, v in self.stats.items()}
+
+    def reset(self):
+        with self.lock:
+            self.rates = {}
+            self.limiters = {}
+            self.stats = {}
+
+
+API_LIMITS = ApiLimits()
+
+
+class JmespathCache(object):
+    """Process wide least recently used cache of compiled jmespath
+    expressions, with hit statistics.
+    """
+
+    max_size = 512
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or self.max_size
+        self.lock = threading.Lock()
+        self.expressions = OrderedDict()
+        self.hits = self.misses = 0
+
+    def compile(self, expression):
+        with self.lock:
+            parsed = self.expressions.pop(expression, None)
+            if parsed is not None:
+                self.hits += 1
+                self.expressions[expression] = parsed
+                return parsed
+            self.misses += 1
+        parsed = jmespath.compile(expression)
+        with self.lock:
+            self.expressions[expression] = parsed
+            while len(self.expressions) > self.max_size:
+                self.expressions.popitem(last=False)
+        return parsed
+
+    def summary(self):
+        with self.lock:
+            return {'size': len(self.expressions),
+                    'hits': self.hits, 'misses': self.misses}
+
+    def reset(self):
+        with self.lock:
+            self.expressions.clear()
+            self.hits = self.misses = 0
+
+
+JMESPATH_CACHE = JmespathCache()
+
+
+def jmespath_compile(expression):
+    return JMESPATH_CACHE.compile(expression)
+
+
+def jmespath_search(expression, data):
+    return JMESPATH_CACHE.compile(expression).search(data)
+
+
 def backoff_delays(start, stop, factor=2.0, jitter=False):
     """Geometric backoff sequence w/ jitter
     """
@@ -350,6 +730,74 @@ def backoff_delays(start, stop, factor=2.0, jitter=False):
         cur = cur * factor
 
 
+# Timestamp formats aws apis return, ie. 2016-04-14T05:17:29.000Z
+ISO_8601 = re.compile(
+    r'^(\d{4})[-/](\d{2})[-/](\d{2})'
+    r'(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d+))?)?'
+    r'(Z|[+-]\d{2}:?\d{2})?)?$')
+
+UTC = tzutc()
+
+_date_fields = {}
+_date_fields_max = 10000
+_tz_offsets = {}
+
+
+def _parse_iso_8601(value):
+    m = ISO_8601.match(value)
+    if m is None:
+        return None
+    year, month, day, hour, minute, second, fraction, zone = m.groups()
+    fields = {'year': int(year), 'month': int(month), 'day': int(day)}
+    if hour is not None:
+        fields['hour'] = int(hour)
+        fields['minute'] = int(minute)
+    if second is not None:
+        fields['second'] = int(second)
+        fields['microsecond'] = fraction and int(
+            fraction[:6].ljust(6, '0')) or 0
+    if zone == 'Z':
+        fields['tzinfo'] = UTC
+    elif zone:
+        offset = (int(zone[1:3]) * 60 + int(zone[-2:])) * 60
+        offset = zone[0] == '-' and -offset or offset
+        if not offset:
+            fields['tzinfo'] = UTC
+        else:
+            fields['tzinfo'] = _tz_offsets.setdefault(
+                offset, tzoffset(None, offset))
+    return fields
+
+
+def parse_date(value, default=None):
+    """Parse a timestamp, as dateutil.parser.parse.
+
+    The iso 8601 formats aws returns are parsed directly, with the parsed
+    fields of recently seen values memoized, anything else is left to
+    dateutil. As with dateutil, fields missing from the value are taken
+    from ``default``, which is otherwise today at midnight.
+    """
+    fields = None
+    if isinstance(value, basestring):
+        fields = _date_fields.get(value)
+        if fields is None:
+            fields = _parse_iso_8601(value)
+            if fields is not None:
+                if len(_date_fields) >= _date_fields_max:
+                    _date_fields.clear()
+                _date_fields[value] = fields
+    if fields is None:
+        return date_parse(value, default=default)
+    if default is None:
+        default = datetime.now().replace(
+            hour=0, minute=0, second=0, microsecond=0)
+    try:
+        return default.replace(**fields)
+    except ValueError:
+        # out of range fields, raise as dateutil would.
+        return date_parse(value, default=default)
+
+
 def parse_cidr(value):
     """Process cidr ranges."""
     klass = IPv4Network
@@ -24,7 +24,13 @@ from c7n import policy
 from c7n.schema import generate, validate as schema_validate
 from c7n.ctx import ExecutionContext
 from c7n.resources import load_resources
-from c7n.utils import CONN_CACHE
+from c7n.executor import reset_controllers
+from c7n.filters.iamaccess import POLICY_CHECKS
+from c7n.filters.related import RELATED_RESOURCES
+from c7n.filters.usage import RESOURCE_USAGE
+from c7n.manager import FILTER_MEMO
+from c7n.resources.iam import IAM_INVENTORY
+from c7n.utils import API_LIMITS, reset_session_cache
 
 from zpill import PillTest
 
@@ -51,7 +57,14 @@ class BaseTest(PillTest):
 
     def cleanUp(self):
         # Clear out thread local session cache
-        CONN_CACHE.session = None
+        reset_session_cache()
+        reset_controllers()
+        FILTER_MEMO.reset()
+        RELATED_RESOURCES.reset()
+        RESOURCE_USAGE.reset()
+        IAM_INVENTORY.reset()
+        API_LIMITS.reset()
+        POLICY_CHECKS.reset()
 
     def write_policy_file(self, policy, format='yaml'):
         """ Write a policy file to disk in the specified format.
@@ -15,8 +15,13 @@
 
 from unittest import TestCase
 from c7n import cache
+from c7n.filters.metrics import get_datapoints
 from argparse import Namespace
+from datetime import datetime, timedelta
+from dateutil.tz import tzutc
 import cPickle
+import os
+import shutil
 import tempfile
 import mock
 
@@ -141,3 +146,226 @@ class FileCacheManagerTest(TestCase):
         self.assertEquals(mock_mkdir.call_count, 1)
         self.assertEquals(mock_dump.call_count, 1)
         self.assertEquals(mock_dumps.call_count, 1)
+
+
+class DirectoryCacheManagerTest(TestCase):
+
+    def get_cache(self, **kw):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        config = dict(cache_period=60, cache=cache_dir)
+        config.update(kw)
+        return cache.DirectoryCacheManager(Namespace(**config))
+
+    def test_factory(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.assertIsInstance(
+            cache.factory(Namespace(cache_period=60, cache=cache_dir)),
+            cache.DirectoryCacheManager)
+        self.assertIsInstance(
+            cache.factory(Namespace(
+                cache_period=60, cache=os.path.join(cache_dir, 'shards/'))),
+            cache.DirectoryCacheManager)
+
+    def test_get_set(self):
+        c = self.get_cache()
+        self.assertTrue(c.load())
+        k1 = {'region': 'us-west-2', 'resource': 'EC2', 'q': None}
+        k2 = {'region': 'us-west-2', 'resource': 'EC2', 'q': {'Filters': []}}
+        self.assertEqual(c.get(k1), None)
+        c.save(k1, range(5))
+        c.save(k2, range(2))
+        c.save('iam-credential-report', {'a': 1})
+        self.assertEqual(c.get(k1), range(5))
+        self.assertEqual(c.get(k2), range(2))
+        self.assertEqual(c.get('iam-credential-report'), {'a': 1})
+        self.assertTrue(
+            c.get_path(k1).startswith(
+                os.path.join(c.cache_dir, 'us-west-2', 'EC2')))
+
+        c2 = cache.DirectoryCacheManager(
+            Namespace(cache_period=60, cache=c.cache_dir))
+        self.assertEqual(c2.get(k1), range(5))
+
+    def test_ttl(self):
+        c = self.get_cache()
+        c.save('short', [1], ttl=-1)
+        c.save('long', [2])
+        self.assertEqual(c.get('short'), None)
+        self.assertEqual(c.get('long'), [2])
+
+    def test_invalid_entry(self):
+        c = self.get_cache()
+        c.save('key', [1])
+        with open(c.get_path('key'), 'w') as fh:
+            fh.write('garbage')
+        self.assertEqual(c.get('key'), None)
+
+    def test_evict_lru(self):
+        c = self.get_cache()
+        # random data, so entries don't compress
+        value = os.urandom(1024)
+        c.save('a', value)
+        c.save('b', value)
+        os.utime(c.get_path('a'), (1, 1))
+        c.max_size = 1500
+        c.save('c', 'x')
+        self.assertEqual(c.get('a'), None)
+        self.assertEqual(c.get('b'), value)
+        self.assertEqual(c.get('c'), 'x')
+
+    def test_evict_walks(self):
+        c = self.get_cache()
+        walks = []
+        walk = os.walk
+
+        def counted_walk(path):
+            walks.append(path)
+            return walk(path)
+
+        with mock.patch.object(cache.os, 'walk', counted_walk):
+            for i in range(50):
+                c.save('key-%d' % i, range(10))
+            # the size is read once, then tracked across saves
+            self.assertEqual(len(walks), 1)
+            c.save('key-0', range(20))
+            self.assertEqual(len(walks), 1)
+            # only walked again when going over the bound
+            c.max_size = c.size
+            c.save('key-50', range(10))
+            self.assertEqual(len(walks), 2)
+        self.assertEqual(c.size, sum([e[2] for e in c.entries()]))
+        self.assertTrue(c.size <= c.max_size)
+
+
+class CacheBackendTest(TestCase):
+
+    def setUp(self):
+        cache.stats.reset()
+        self.addCleanup(cache.stats.reset)
+        self.addCleanup(cache.MemoryCacheManager.clear)
+
+    def test_factory_types(self):
+        self.assertEqual(cache.infer_cache_type('memory'), 'memory')
+        self.assertEqual(cache.infer_cache_type('c7n.sqlite'), 'sqlite')
+        self.assertEqual(cache.infer_cache_type('c7n.cache'), 'file')
+        self.assertIsInstance(
+            cache.factory(Namespace(
+                cache_period=60, cache='c7n.cache', cache_type='memory')),
+            cache.MemoryCacheManager)
+        self.assertRaises(
+            ValueError, cache.factory,
+            Namespace(cache_period=60, cache='c7n.cache', cache_type='xyz'))
+
+    def test_sqlite_get_set(self):
+        t = tempfile.NamedTemporaryFile(suffix='.sqlite')
+        self.addCleanup(t.close)
+        config = Namespace(cache_period=60, cache=t.name)
+        c = cache.factory(config)
+        self.assertIsInstance(c, cache.SqliteCacheManager)
+        self.assertTrue(c.load())
+        k1 = {'region': 'us-west-2', 'resource': 'EC2', 'q': None}
+        self.assertEqual(c.get(k1), None)
+        c.save(k1, range(5))
+        c.save('expired', [1], ttl=-1)
+        self.assertEqual(c.get(k1), range(5))
+        self.assertEqual(c.get('expired'), None)
+
+        # shared by other processes through the database file
+        c2 = cache.SqliteCacheManager(config)
+        self.assertEqual(c2.get(k1), range(5))
+
+        summary = cache.stats.summary()
+        self.assertEqual(summary['EC2']['hits'], 2)
+        self.assertEqual(summary['EC2']['misses'], 1)
+        self.assertTrue(summary['EC2']['bytes'] > 0)
+
+    def test_memory_lru(self):
+        config = Namespace(cache_period=60, cache='memory')
+        c = cache.factory(config)
+        c.save('a', range(5))
+        value = c.get('a')
+        value.append(5)
+        # callers get their own copy of the entry
+        self.assertEqual(cache.MemoryCacheManager(config).get('a'), range(5))
+
+        c.save('b', range(3))
+        c.get('a')
+        c.max_size = cache.MemoryCacheManager.size - 1
+        c.save('c', [])
+        self.assertEqual(c.get('b'), None)
+        self.assertEqual(c.get('a'), range(5))
+        self.assertEqual(c.get('c'), [])
+
+        c.save('expired', [1], ttl=-1)
+        self.assertEqual(c.get('expired'), None)
+
+
+class DatapointStoreTest(TestCase):
+
+    def setUp(self):
+        self.addCleanup(cache.stores.clear)
+        self.addCleanup(cache.MemoryCacheManager.clear)
+
+    def test_get_datapoint_store(self):
+        self.assertEqual(cache.get_datapoint_store(Namespace()), None)
+        store = cache.get_datapoint_store(Namespace(metrics_cache='memory'))
+        self.assertIsInstance(store.cache, cache.MemoryCacheManager)
+        self.assertTrue(
+            cache.get_datapoint_store(Namespace(
+                metrics_cache='memory')).cache is store.cache)
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.assertIsInstance(
+            cache.get_datapoint_store(Namespace(
+                metrics_cache=os.path.join(cache_dir, 'metrics'))).cache,
+            cache.DirectoryCacheManager)
+
+    def test_window_reuse(self):
+        calls = []
+
+        class CloudWatch(object):
+
+            def get_metric_statistics(self, StartTime, EndTime, Period, **kw):
+                calls.append(StartTime)
+                t = cache.epoch(StartTime)
+                points = []
+                while t < cache.epoch(EndTime):
+                    points.append({
+                        'Timestamp': datetime.fromtimestamp(t, tzutc()),
+                        'Average': float(t)})
+                    t += Period
+                return {'Datapoints': points}
+
+        store = cache.get_datapoint_store(Namespace(metrics_cache='memory'))
+        key = store.get_key(
+            '644160558196', 'us-east-1', 'AWS/EC2', 'CPUUtilization',
+            [{'Name': 'InstanceId', 'Value': 'i-1'}], ['Average'], 3600)
+        end = datetime(2017, 1, 2, 0, 30)
+
+        points = get_datapoints(
+            CloudWatch(), end - timedelta(1), end, 3600, store, key)
+        self.assertEqual(calls, [datetime(2017, 1, 1)])
+        self.assertEqual(len(points), 25)
+
+        # an hour later only the periods since the last complete one
+        # are retrieved.
+        end += timedelta(hours=1)
+        points = get_datapoints(
+            CloudWatch(), end - timedelta(1), end, 3600, store, key)
+        self.assertEqual(calls[1:], [datetime(2017, 1, 2)])
+        self.assertEqual(
+            [p['Timestamp'] for p in points],
+            [datetime(2017, 1, 1, h, tzinfo=tzutc()) for h in range(1, 24)] +
+            [datetime(2017, 1, 2, h, tzinfo=tzutc()) for h in range(2)])
+        self.assertEqual(
+            [p['Average'] for p in points],
+            [float(cache.epoch(p['Timestamp'])) for p in points])
+
+        # windows beyond the stored entry are retrieved in full
+        end += timedelta(7)
+        points = get_datapoints(
+            CloudWatch(), end - timedelta(1), end, 3600, store, key)
+        self.assertEqual(calls[2:], [datetime(2017, 1, 8, 1)])
+        self.assertEqual(len(points), 25)
@@ -393,6 +393,60 @@ class RunTest(CliTest):
             ['custodian', 'run', '-s', temp_dir, yaml_file],
         )
 
+    def test_ec2_jobs(self):
+        session_factory = self.replay_flight_data(
+            'test_ec2_state_transition_age_filter'
+        )
+
+        # the placebo session is shared across worker threads, resolve
+        # botocore's lazy components before the workers race on them.
+        session_factory().client('ec2')
+
+        from c7n.policy import PolicyCollection
+        self.patch(PolicyCollection, 'test_session_factory',
+                   staticmethod(lambda x=None: session_factory))
+
+        temp_dir = self.get_temp_dir()
+        yaml_file = self.write_policy_file({
+            'policies': [{
+                'name': 'ec2-running',
+                'resource': 'ec2',
+                'query': [{'instance-state-name': 'running'}],
+            }, {
+                'name': 'ec2-stopped',
+                'resource': 'ec2',
+                'query': [{'instance-state-name': 'stopped'}],
+            }]
+        })
+
+        self.run_and_expect_success(
+            ['custodian', 'run', '-s', temp_dir, '--jobs', '2', yaml_file],
+        )
+        for name in ('ec2-running', 'ec2-stopped'):
+            with open(os.path.join(
+                    temp_dir, name, 'custodian-run.log')) as fh:
+                output = fh.read()
+            self.assertIn('policy: %s' % name, output)
+            self.assertNotIn(
+                ({'ec2-running', 'ec2-stopped'} - {name}).pop(), output)
+
+    def test_schedule(self):
+        from c7n.policy import PolicyCollection
+        from common import Config
+        collection = PolicyCollection.from_data(
+            {'policies': [
+                {'name': 'ec2-a', 'resource': 'ec2',
+                 'query': [{'instance-state-name': 'running'}]},
+                {'name': 'ec2-b', 'resource': 'ec2',
+                 'query': [{'instance-state-name': 'stopped'}]},
+                {'name': 'rds-a', 'resource': 'rds'},
+                {'name': 's3-a', 'resource': 's3'}]},
+            Config.empty())
+        groups = commands._schedule(collection.plan())
+        self.assertEqual(
+            [g[0].name for g in groups],
+            ['ec2-a', 'rds-a', 's3-a', 'ec2-b'])
+
     def test_error(self):
         from c7n.policy import Policy
         self.patch(Policy, '__call__', lambda x: (_ for _ in ()).throw(Exception('foobar')))
@@ -516,6 +570,35 @@ class MetricsTest(CliTest):
         )
 
 
+class ForecastTest(CliTest):
+
+    def test_forecast(self):
+        from c7n.query import QueryResourceManager
+        self.patch(
+            QueryResourceManager, 'fetch_resources',
+            lambda self, query=None: [
+                {'InstanceId': 'i-%d' % n, 'Tags': [
+                    {'Key': 'maid_offhours', 'Value': 'off=(m-u,%d);tz=gmt' % n}]}
+                for n in range(2)])
+
+        yaml_file = self.write_policy_file({
+            'policies': [{
+                'name': 'offhours',
+                'resource': 'ec2',
+                'filters': [
+                    {'type': 'offhour', 'default_tz': 'et', 'offhour': 19}]}]})
+
+        out = json.loads(self.get_output(
+            ['custodian', 'forecast', '--days', '1', yaml_file]))
+        transitions = out['offhours']
+        self.assertEqual(len(transitions), 2)
+        self.assertEqual(
+            sorted([(t['Type'], t['Resources'],
+                     datetime.strptime(t['Time'][:13], '%Y-%m-%dT%H').hour)
+                    for t in transitions]),
+            [('off', ['i-0'], 0), ('off', ['i-1'], 1)])
+
+
 class MiscTest(CliTest):
     
     def test_empty_policy_file(self):
@@ -0,0 +1,113 @@
+# Copyright 2017 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from datetime import datetime, timedelta
+import copy
+import random
+import unittest
+
+from dateutil.tz import tzutc
+
+from c7n.filters import columnar
+from c7n.resources.ec2 import filters
+
+from common import BaseTest, Config
+
+
+def synthetic(count, seed=42):
+    rand = random.Random(seed)
+    now = datetime.now(tz=tzutc())
+    resources = []
+    for idx in range(count):
+        r = {'InstanceId': 'i-%08d' % idx,
+             'InstanceType': rand.choice(['m3.medium', 't2.micro', 'c4.large']),
+             'CpuOptions': {'CoreCount': rand.choice([1, 2, 4, 8, 2.0])},
+             'EbsOptimized': rand.choice([True, False, None]),
+             'LaunchTime': rand.choice([
+                 now - timedelta(rand.randint(0, 90)),
+                 (now - timedelta(rand.randint(0, 90))).isoformat(),
+                 None]),
+             'ExpireTime': rand.choice([
+                 now + timedelta(hours=rand.randint(0, 48)),
+                 (now + timedelta(hours=rand.randint(0, 48))).isoformat()]),
+             'SecurityGroups': [{}] * rand.randint(0, 3),
+             'Tags': [{'Key': 'Env',
+                       'Value': rand.choice(['dev', 'prod', 'Dev'])}]}
+        if idx % 7 == 0:
+            r['CpuOptions']['CoreCount'] = rand.choice(['4', None, [4]])
+        if idx % 5 == 0:
+            del r['Tags']
+        resources.append(r)
+    return resources
+
+
+FILTERS = [
+    {'InstanceType': 't2.micro'},
+    {'tag:Env': 'absent'},
+    {'tag:Env': 'present'},
+    {'type': 'value', 'key': 'tag:Env', 'value': 'dev',
+     'value_type': 'normalize'},
+    {'type': 'value', 'key': 'tag:Env', 'op': 'in',
+     'value': ['dev', 'Dev']},
+    {'type': 'value', 'key': 'tag:Env', 'op': 'regex', 'value': '^d'},
+    {'type': 'value', 'key': 'CpuOptions.CoreCount', 'op': 'gte',
+     'value': 2},
+    {'type': 'value', 'key': 'CpuOptions.CoreCount', 'op': 'ne',
+     'value': 2},
+    {'type': 'value', 'key': 'CpuOptions.CoreCount', 'op': 'in',
+     'value': [4, 8]},
+    {'type': 'value', 'key': 'EbsOptimized', 'value': True},
+    {'type': 'value', 'key': 'EbsOptimized', 'value': 'not-null'},
+    {'type': 'value', 'key': 'LaunchTime', 'op': 'gt',
+     'value_type': 'age', 'value': 30},
+    {'type': 'value', 'key': 'ExpireTime', 'op': 'lt',
+     'value_type': 'expiration', 'value': 1},
+    {'type': 'value', 'key': 'SecurityGroups', 'op': 'gte',
+     'value_type': 'size', 'value': 2},
+    {'type': 'value', 'key': 'SecurityGroups[0]', 'value': 'present'}]
+
+
+@unittest.skipIf(columnar.numpy is None, "numpy not installed")
+class ColumnarTest(BaseTest):
+
+    def test_matches_row_evaluation(self):
+        resources = synthetic(500)
+        for data in FILTERS:
+            f = filters.factory(data)
+            rows = copy.deepcopy(resources)
+            columns = copy.deepcopy(resources)
+            self.assertEqual(
+                columnar.process(f, columns), f.process(rows), data)
+            self.assertEqual(columns, rows)
+
+    def test_manager(self):
+        p = self.load_policy({
+            'name': 'columnar',
+            'resource': 'ec2',
+            'filters': [
+                {'InstanceType': 't2.micro'},
+                {'type': 'value', 'value_type': 'resource_count',
+                 'op': 'gt', 'value': 10},
+                {'type': 'tag-count', 'count': 1}]},
+            config=Config.empty(columnar=True))
+        manager = p.resource_manager
+        resources = synthetic(columnar.MIN_RESOURCES)
+        self.assertTrue(manager.is_columnar(manager.filters[0], resources))
+        self.assertFalse(manager.is_columnar(manager.filters[2], resources))
+        self.assertFalse(manager.is_columnar(
+            manager.filters[0], resources[:10]))
+        for r in resources:
+            r['Tags'] = [{'Key': 'Env', 'Value': 'dev'}]
+        self.assertEqual(
+            len(manager.filter_resources(resources)),
+            len([r for r in resources if r['InstanceType'] == 't2.micro']))
@@ -20,9 +20,10 @@ from jsonschema.exceptions import ValidationError
 from c7n.filters import FilterValidationError
 from c7n.resources import ec2
 from c7n.resources.ec2 import actions, QueryFilter
-from c7n import tags, utils
+from c7n import cache, tags, utils
+from c7n.executor import MainThreadExecutor
 
-from common import BaseTest
+from common import BaseTest, instance
 
 
 class TestTagAugmentation(BaseTest):
@@ -73,6 +74,127 @@ class TestMetricFilter(BaseTest):
         resources = policy.run()
         self.assertEqual(len(resources), 1)
 
+    def test_metric_data_batched(self):
+        calls = []
+
+        class CloudWatch(object):
+
+            def get_metric_data(self, **params):
+                calls.append(params)
+                results = []
+                for q in params['MetricDataQueries']:
+                    value = q['MetricStat']['Metric']['Dimensions'][0]['Value']
+                    result = {'Id': q['Id'], 'StatusCode': 'Complete',
+                              'Timestamps': [], 'Values': []}
+                    if value == 'i-7':
+                        result['StatusCode'] = 'InternalError'
+                    elif 'NextToken' not in params:
+                        result['StatusCode'] = 'PartialData'
+                    else:
+                        result['Timestamps'] = [datetime(2017, 1, 1)]
+                        result['Values'] = [float(value[2:])]
+                    results.append(result)
+                response = {'MetricDataResults': results}
+                if 'NextToken' not in params:
+                    response['NextToken'] = 'page'
+                return response
+
+        class Session(object):
+            region_name = 'us-east-1'
+
+            def client(self, service_name, region_name=None, config=None):
+                return CloudWatch()
+
+        factory = lambda region=None, assume=None: Session()
+        policy = self.load_policy({
+            'name': 'ec2-utilization',
+            'resource': 'ec2',
+            'filters': [
+                {'type': 'metrics',
+                 'name': 'CPUUtilization',
+                 'days': 3,
+                 'value': 50}
+            ]},
+            session_factory=factory)
+        f = policy.resource_manager.filters[0]
+        f.executor_factory = MainThreadExecutor
+        resources = [instance(InstanceId='i-%d' % n) for n in range(150)]
+        matched = f.process(resources)
+
+        self.assertEqual(
+            sorted([r['InstanceId'] for r in matched]),
+            sorted(['i-%d' % n for n in range(50) if n != 7]))
+        # two batches of up to 100 queries, each two pages
+        self.assertEqual(
+            [len(c['MetricDataQueries']) for c in calls], [100, 100, 50, 50])
+        self.assertEqual(
+            len(set([q['Id'] for q in calls[0]['MetricDataQueries']])), 100)
+        key = 'AWS/EC2.CPUUtilization.Average.259200.3.InstanceId=i-1'
+        self.assertEqual(
+            resources[1]['c7n.metrics'],
+            {key: [{'Timestamp': datetime(2017, 1, 1), 'Average': 1.0}]})
+        self.assertEqual(resources[7]['c7n.metrics'], {})
+
+        # annotated metrics aren't retrieved again
+        del calls[:]
+        f.process(resources[:10])
+        self.assertEqual(len(calls[0]['MetricDataQueries']), 1)
+
+    def test_metric_data_store(self):
+        calls = []
+
+        class CloudWatch(object):
+
+            def get_metric_data(self, **params):
+                calls.append(params)
+                start = cache.epoch(params['StartTime'])
+                end = cache.epoch(params['EndTime'])
+                timestamps = [
+                    datetime.fromtimestamp(t, tz.tzutc())
+                    for t in range(start, end, 3600)]
+                return {'MetricDataResults': [
+                    {'Id': q['Id'], 'StatusCode': 'Complete',
+                     'Timestamps': timestamps,
+                     'Values': [1.0] * len(timestamps)}
+                    for q in params['MetricDataQueries']]}
+
+        class Session(object):
+            region_name = 'us-east-1'
+
+            def client(self, service_name, region_name=None, config=None):
+                return CloudWatch()
+
+        self.addCleanup(cache.stores.clear)
+        self.addCleanup(cache.MemoryCacheManager.clear)
+        factory = lambda region=None, assume=None: Session()
+        policy = self.load_policy({
+            'name': 'ec2-utilization',
+            'resource': 'ec2',
+            'filters': [
+                {'type': 'metrics',
+                 'name': 'CPUUtilization',
+                 'days': 1,
+                 'period': 3600,
+                 'value': 2}
+            ]},
+            config={'metrics_cache': 'memory'},
+            session_factory=factory)
+        f = policy.resource_manager.filters[0]
+        f.executor_factory = MainThreadExecutor
+
+        self.assertEqual(len(f.process([instance(InstanceId='i-1')])), 1)
+        start = cache.epoch(calls[0]['StartTime'])
+        self.assertEqual(start % 3600, 0)
+
+        # a later run only retrieves the periods since the last complete
+        # one, with the stored datapoints filling the rest of the window.
+        resources = [instance(InstanceId='i-1')]
+        self.assertEqual(len(f.process(resources)), 1)
+        self.assertTrue(
+            cache.epoch(calls[1]['StartTime']) >= start + 22 * 3600)
+        datapoints = resources[0]['c7n.metrics'].values()[0]
+        self.assertTrue(len(datapoints) >= 24)
+
 
 class TestHealthEventsFilter(BaseTest):
     def test_ec2_health_events_filter(self):
@@ -181,6 +181,8 @@ class SSLPolicyTest(BaseTest):
                  'name': 'testpolicy',
                  'attributes': ['AES128-SHA256','Protocol-TLSv1']}
             ]},
+            # flight data was recorded with filters run in policy order
+            config={'preserve_filter_order': True},
             session_factory=session_factory)
         resources = policy.run()
         response_pol = client.describe_load_balancers(
@@ -12,8 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from botocore.exceptions import ClientError
+
 from c7n import executor
+from c7n.utils import get_retry
 
+import threading
+import time
 import unittest
 
 
@@ -58,6 +63,122 @@ class MainExecutorTest(ExecutorBase, unittest.TestCase):
     executor_factory = executor.MainThreadExecutor
 
 
+def throttle_error(code='Throttling'):
+    return ClientError({'Error': {'Code': code, 'Message': ''}}, 'Describe')
+
+
+class ConcurrencyControllerTest(unittest.TestCase):
+
+    def test_additive_increase(self):
+        controller = executor.ConcurrencyController(
+            initial=2, maximum=4)
+        for i in range(20):
+            controller.run(lambda: None)
+        self.assertEqual(controller.limit, 4)
+        self.assertEqual(controller.active, 0)
+
+    def test_multiplicative_decrease(self):
+        controller = executor.ConcurrencyController(
+            initial=8, maximum=8, cooldown=0)
+
+        def throttled():
+            raise throttle_error()
+
+        self.assertRaises(ClientError, controller.run, throttled)
+        self.assertEqual(controller.limit, 4)
+        self.assertRaises(ClientError, controller.run, throttled)
+        self.assertRaises(ClientError, controller.run, throttled)
+        self.assertRaises(ClientError, controller.run, throttled)
+        self.assertEqual(controller.limit, 1)
+        self.assertEqual(controller.throttles, 4)
+        self.assertEqual(controller.active, 0)
+
+    def test_throttle_cooldown(self):
+        controller = executor.ConcurrencyController(initial=8, cooldown=60)
+        controller.throttled()
+        controller.throttled()
+        self.assertEqual(controller.limit, 4)
+        self.assertEqual(controller.throttles, 2)
+
+    def test_other_errors_ignored(self):
+        controller = executor.ConcurrencyController(initial=4, maximum=4)
+
+        def failed():
+            raise throttle_error('InvalidInstanceID.NotFound')
+
+        self.assertRaises(ClientError, controller.run, failed)
+        self.assertEqual(controller.limit, 4)
+
+    def test_retry_signals_controller(self):
+        controller = executor.ConcurrencyController(
+            initial=8, maximum=8, cooldown=0)
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise throttle_error('RequestLimitExceeded')
+            return True
+
+        retry = get_retry(('RequestLimitExceeded',), min_delay=0)
+        self.assertTrue(controller.run(retry, flaky))
+        self.assertEqual(controller.throttles, 2)
+        self.assertEqual(controller.limit, 2.5)
+
+    def test_bounded_concurrency(self):
+        controller = executor.ConcurrencyController(initial=2, maximum=2)
+        peak = []
+
+        def task(i):
+            peak.append(controller.active)
+
+        with executor.ThreadPoolExecutor(max_workers=8) as w:
+            list(w.map(lambda i: controller.run(task, i), range(50)))
+        self.assertTrue(max(peak) <= 2)
+
+    def test_get_controller(self):
+        executor.reset_controllers()
+        self.addCleanup(executor.reset_controllers)
+        key = ('123', 'us-east-1', 'rds')
+        controller = executor.get_controller(key, 1)
+        self.assertTrue(executor.get_controller(key, 1) is controller)
+        self.assertEqual(controller.limit, 1)
+        self.assertFalse(
+            executor.get_controller(('123', 'us-east-1', 'ec2')) is controller)
+
+        # a caller's initial concurrency applies until the api throttles
+        self.assertTrue(executor.get_controller(key, 5) is controller)
+        self.assertEqual(controller.limit, 5)
+        controller.throttled()
+        executor.get_controller(key, 8)
+        self.assertEqual(controller.limit, 2.5)
+
+    def test_caller_max_workers(self):
+        executor.reset_controllers()
+        self.addCleanup(executor.reset_controllers)
+        key = ('123', 'us-east-1', 'rds')
+        controller = executor.get_controller(key, 8)
+        bounded = executor.get_controller(key, 1, max_workers=1)
+        self.assertEqual(bounded.maximum, 1)
+        self.assertTrue(bounded.controller is controller)
+        peak = []
+        active = []
+        lock = threading.Lock()
+
+        def task(i):
+            with lock:
+                active.append(i)
+                peak.append(len(active))
+            time.sleep(0.001)
+            with lock:
+                active.remove(i)
+
+        with executor.ThreadPoolExecutor(max_workers=8) as w:
+            list(w.map(lambda i: bounded.run(task, i), range(20)))
+        self.assertEqual(max(peak), 1)
+        self.assertEqual(controller.active, 0)
+
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -17,9 +17,14 @@ from datetime import datetime, timedelta
 import unittest
 
 from c7n import filters as base_filters
+from c7n.executor import MainThreadExecutor
+from c7n.filters import core
+from c7n.filters.related import RelatedResources
+from c7n.filters.usage import ResourceUsage
 from c7n.resources.ec2 import filters
 from c7n.utils import annotation
 from common import instance, event_data, Bag
+from test_offhours import mock_datetime_now
 
 
 class BaseFilterTest(unittest.TestCase):
@@ -70,6 +75,37 @@ class TestOrFilter(unittest.TestCase):
             f.process([instance(Architecture='amd64')]),
             [])
 
+    def test_or_barrier(self):
+        f = filters.factory({
+            'or': [
+                {'Architecture': 'x86_64'},
+                {'Architecture': 'armv8'}]})
+        self.assertFalse(f.is_barrier())
+        f = filters.factory({
+            'or': [
+                {'Architecture': 'x86_64'},
+                {'type': 'value', 'value_type': 'resource_count',
+                 'op': 'lt', 'value': 2}]})
+        self.assertTrue(f.is_barrier())
+
+    def test_or_remaining(self):
+        f = filters.factory({
+            'or': [
+                {'Architecture': 'x86_64'},
+                {'Color': 'green'}]})
+        seen = []
+        color = f.filters[1]
+        process = color.process
+        color.process = lambda resources, event=None: (
+            seen.extend(resources) or process(resources, event))
+        # ids aren't unique, ie. the same resource in different regions
+        results = [
+            instance(InstanceId='i-1', Architecture='x86_64'),
+            instance(InstanceId='i-1', Architecture='arm', Color='green'),
+            instance(InstanceId='i-1', Architecture='arm', Color='blue')]
+        self.assertEqual(f.process_set(results, None), results[:2])
+        self.assertEqual(seen, results[1:])
+
 
 class TestAndFilter(unittest.TestCase):
 
@@ -110,7 +146,8 @@ class TestNotFilter(unittest.TestCase):
                 {'Architecture': 'x86_64'},
                 {'Color': 'green'}]})
         self.assertEqual(len(f.process(results)), 2)
-        
+        self.assertEqual(f.process_set(results, None), results[1:])
+
         """
         f = filters.factory({
             'not': [
@@ -739,6 +776,72 @@ class TestNotInList(unittest.TestCase):
             False)
 
 
+class TestCompiledValue(unittest.TestCase):
+
+    def test_compiled_at_validate(self):
+        f = filters.factory(
+            {'type': 'value', 'key': 'Thing', 'value': '^f.*', 'op': 'regex'})
+        self.assertTrue(f._matcher is not None)
+        self.assertEqual(f.k, 'Thing')
+        self.assertTrue(f(instance(Thing='Foo')))
+        self.assertFalse(f(instance(Thing=42)))
+
+    def test_in_unhashable(self):
+        f = filters.factory(
+            {'type': 'value', 'key': 'Thing', 'op': 'in',
+             'value': ['Foo', ['a', 'b']]})
+        self.assertTrue(f(instance(Thing=['a', 'b'])))
+        self.assertFalse(f(instance(Thing={'a': 'b'})))
+        self.assertTrue(f(instance(Thing='Foo')))
+        f = filters.factory(
+            {'type': 'value', 'key': 'Thing', 'op': 'not-in',
+             'value': ['Foo']})
+        self.assertTrue(f(instance()))
+        self.assertTrue(f(instance(Thing=['Foo'])))
+
+    def test_age_sentinel(self):
+        f = filters.factory(
+            {'type': 'value', 'key': 'LaunchTime', 'value_type': 'age',
+             'op': 'gt', 'value': 1})
+        self.assertTrue(f(instance(
+            LaunchTime=datetime.now(tz=tz.tzutc()) - timedelta(2))))
+        self.assertFalse(f(instance(LaunchTime=datetime.now().isoformat())))
+
+    def test_age_evaluated_now(self):
+        compiled = datetime(2017, 1, 10, tzinfo=tz.tzutc())
+        resources = [
+            instance(LaunchTime=datetime(2017, 1, 5, tzinfo=tz.tzutc())),
+            instance(LaunchTime='2017-01-18T00:00:00+00:00')]
+        with mock_datetime_now(compiled, core):
+            age = filters.factory(
+                {'type': 'value', 'key': 'LaunchTime', 'value_type': 'age',
+                 'op': 'gt', 'value': 7})
+            expiration = filters.factory(
+                {'type': 'value', 'key': 'LaunchTime', 'op': 'gt',
+                 'value_type': 'expiration', 'value': 7})
+            self.assertEqual(age.process(resources), [])
+            self.assertEqual(expiration.process(resources), resources[1:])
+
+        # sentinels are relative to when the filter is evaluated
+        with mock_datetime_now(compiled + timedelta(10), core):
+            self.assertEqual(age.process(resources), resources[:1])
+            self.assertTrue(age(resources[0]))
+            self.assertEqual(expiration.process(resources), [])
+        self.assertEqual(age._now, None)
+
+    def test_recompile(self):
+        f = base_filters.ValueFilter({'key': 'Thing', 'value': 'Foo'})
+        self.assertTrue(f(instance(Thing='Foo')))
+        f.data['value'] = 'Bar'
+        self.assertTrue(f(instance(Thing='Foo')))
+        f.compile()
+        self.assertTrue(f(instance(Thing='Bar')))
+
+    def test_key_not_expression(self):
+        f = filters.factory({'tag-key': 'present'})
+        self.assertTrue(f({'tag-key': 'abc'}))
+
+
 class TestFilterRegistry(unittest.TestCase):
 
     def test_filter_registry(self):
@@ -750,5 +853,122 @@ class TestFilterRegistry(unittest.TestCase):
         )
 
 
+class TestRelatedResources(unittest.TestCase):
+
+    def get_manager(self, region='us-east-1'):
+        calls = []
+
+        class Manager(object):
+            type = 'security-group'
+            config = Bag(account_id='644160558196', region=region)
+            data = {}
+
+            def get_model(self):
+                return Bag(id='GroupId')
+
+            def resources(self):
+                calls.append(None)
+                return [{'GroupId': 'sg-%d' % n} for n in range(20)]
+
+            def get_resources(self, ids):
+                calls.append(sorted(ids))
+                return [{'GroupId': i} for i in ids if i != 'sg-99']
+
+        return Manager(), calls
+
+    def test_incremental_fetch(self):
+        related = RelatedResources()
+        related.enable()
+        manager, calls = self.get_manager()
+        self.assertEqual(
+            sorted(related.get(manager, ['sg-1', 'sg-2'], 10)),
+            ['sg-1', 'sg-2'])
+        # only ids not yet seen are fetched, including missing ones once.
+        self.assertEqual(
+            sorted(related.get(manager, ['sg-2', 'sg-3', 'sg-99'], 10)),
+            ['sg-2', 'sg-3'])
+        self.assertEqual(related.get(manager, ['sg-1', 'sg-99'], 10).keys(),
+                         ['sg-1'])
+        self.assertEqual(calls, [['sg-1', 'sg-2'], ['sg-3', 'sg-99']])
+        self.assertEqual(related.summary(), {'hits': 3, 'misses': 4})
+
+        # beyond the threshold resources are listed, once.
+        ids = ['sg-%d' % n for n in range(4, 16)]
+        self.assertEqual(len(related.get(manager, ids, 10)), 12)
+        self.assertEqual(len(related.get(manager)), 20)
+        self.assertEqual(calls[2:], [None])
+
+        # other regions aren't shared
+        other, other_calls = self.get_manager('us-west-2')
+        related.get(other, ['sg-1'], 10)
+        self.assertEqual(other_calls, [['sg-1']])
+
+    def test_failed_fetch(self):
+        related = RelatedResources()
+        related.enable()
+        manager, calls = self.get_manager()
+        # a fetch finding none of the ids may have failed, its ids are
+        # fetched again rather than remembered as missing.
+        self.assertEqual(related.get(manager, ['sg-99'], 10), {})
+        self.assertEqual(related.get(manager, ['sg-99', 'sg-1'], 10).keys(),
+                         ['sg-1'])
+        self.assertEqual(related.get(manager, ['sg-99'], 10), {})
+        self.assertEqual(calls, [['sg-99'], ['sg-1', 'sg-99']])
+
+    def test_disabled(self):
+        related = RelatedResources()
+        manager, calls = self.get_manager()
+        related.get(manager, ['sg-1'], 10)
+        related.get(manager, ['sg-1'], 10)
+        related.get(manager)
+        related.get(manager)
+        self.assertEqual(calls, [['sg-1'], ['sg-1'], None, None])
+
+
+class TestResourceUsage(unittest.TestCase):
+
+    def get_scanners(self, calls):
+        def lambda_roles():
+            calls.append('lambda')
+            return [('role-a', 'fn-1'), ('role-a', 'fn-2'), ('role-b', 'fn-3')]
+
+        def ec2_roles():
+            calls.append('ec2')
+            return iter([('role-c', 'i-1'), ('role-a', 'i-2')])
+
+        return [('lambda', lambda_roles), ('ec2', ec2_roles)]
+
+    def test_usage(self):
+        usage = ResourceUsage()
+        usage.enable()
+        calls = []
+        manager = Bag(config=Bag(account_id='644160558196', region='us-east-1'))
+        scanners = self.get_scanners(calls)
+        self.assertEqual(
+            usage.get(manager, scanners, MainThreadExecutor),
+            {'role-a': set(['fn-1', 'fn-2', 'i-2']),
+             'role-b': set(['fn-3']),
+             'role-c': set(['i-1'])})
+        # scans are reused, only the missing ones run
+        self.assertEqual(
+            usage.get(manager, scanners[1:], MainThreadExecutor),
+            {'role-a': set(['i-2']), 'role-c': set(['i-1'])})
+        self.assertEqual(sorted(calls), ['ec2', 'lambda'])
+        self.assertEqual(usage.summary(), {'hits': 1, 'misses': 2})
+
+        other = Bag(config=Bag(account_id='644160558196', region='us-west-2'))
+        usage.get(other, scanners, MainThreadExecutor)
+        self.assertEqual(len(calls), 4)
+
+    def test_disabled(self):
+        usage = ResourceUsage()
+        calls = []
+        manager = Bag(config=Bag(account_id='644160558196', region='us-east-1'))
+        usage.get(manager, self.get_scanners(calls), MainThreadExecutor)
+        usage.get(manager, self.get_scanners(calls), MainThreadExecutor)
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(usage.data, {})
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -51,6 +51,19 @@ class HandleTest(BaseTest):
         self.assertEqual(
             handler.dispatch_event({'detail': {}}, None), True)
 
+        # rate limits are configured from the policies' execution options
+        from c7n.policy import Policy
+        from c7n.utils import API_LIMITS
+        self.patch(Policy, 'push', lambda self, event, context: None)
+        with open(os.path.join(self.run_dir, 'config.json'), 'w') as fh:
+            json.dump({'policies': [{
+                'name': 'ec2-periodic', 'resource': 'ec2',
+                'mode': {'type': 'periodic', 'schedule': 'rate(1 day)',
+                         'execution-options': {
+                             'rate_limits': {'ec2': 2}}}}]}, fh)
+        self.assertEqual(handler.dispatch_event({'detail': {}}, None), True)
+        self.assertEqual(API_LIMITS.rates, {'ec2': 2})
+
         config = handler.Config.empty()
         self.assertEqual(config.assume_role, None)
         try:
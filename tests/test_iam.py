@@ -22,7 +22,8 @@ from test_offhours import mock_datetime_now
 
 from dateutil import parser
 
-from c7n.filters.iamaccess import check_cross_account, CrossAccountAccessFilter
+from c7n.filters.iamaccess import (
+    check_cross_account, CrossAccountAccessFilter, PolicyChecks)
 from c7n.mu import LambdaManager, LambdaFunction, PythonPackageArchive
 from c7n.resources.sns import SNS
 from c7n.resources.iam import (
@@ -35,7 +36,8 @@ from c7n.resources.iam import (
     IamGroupUsers, UserPolicy,
     UserCredentialReport, UserAccessKey,
     IamRoleInlinePolicy, IamGroupInlinePolicy,
-    SpecificIamRoleManagedPolicy, NoSpecificIamRoleManagedPolicy)
+    SpecificIamRoleManagedPolicy, NoSpecificIamRoleManagedPolicy,
+    IamInventory, IamInventoryBase, IAM_INVENTORY)
 from c7n.executor import MainThreadExecutor
 
 
@@ -243,7 +245,9 @@ class IamInstanceProfileFilterUsage(BaseTest):
             'resource': 'iam-profile',
             'filters': ['unused']}, session_factory=session_factory)
         resources = p.run()
-        self.assertEqual(len(resources), 2)
+        # root_joshua is used by a launch config and an instance
+        self.assertEqual(
+            [r['InstanceProfileName'] for r in resources], ['mandeep'])
 
 
 class IamPolicyFilterUsage(BaseTest):
@@ -435,6 +439,100 @@ class IamInlinePolicyUsage(BaseTest):
         self.assertEqual(len(resources), 2)
 
 
+class IamInventoryTest(BaseTest):
+
+    def get_filter(self, resource, data, session_factory):
+        p = self.load_policy({
+            'name': 'iam-inventory',
+            'resource': resource,
+            'filters': [data]}, session_factory=session_factory)
+        f = p.resource_manager.filters[0]
+        f.executor_factory = MainThreadExecutor
+        return f
+
+    def test_inventory(self):
+        session_factory = self.replay_flight_data('test_iam_inventory')
+        p = self.load_policy(
+            {'name': 'iam-inventory', 'resource': 'iam-user'},
+            session_factory=session_factory)
+        inventory = IamInventory.get(p.resource_manager)
+        self.assertEqual(sorted(inventory.users), ['alice', 'bob'])
+        self.assertEqual(sorted(inventory.roles), ['app-role', 'idle-role'])
+        self.assertEqual(inventory.group_users, {'admins': ['alice']})
+        self.assertEqual(
+            inventory.get_policy_document(
+                'arn:aws:iam::644160558196:policy/TestForSpecificMP', 'v1'),
+            {'Version': '2012-10-17', 'Statement': [
+                {'Effect': 'Allow', 'Action': '*', 'Resource': '*'}]})
+        self.assertEqual(
+            inventory.get_policy(
+                'arn:aws:iam::aws:policy/AdministratorAccess')['DefaultVersionId'],
+            'v1')
+
+    def test_inventory_filters(self):
+        self.patch(IamInventoryBase, 'InventoryThreshold', 1)
+        session_factory = self.replay_flight_data('test_iam_inventory')
+        roles = [{'RoleName': 'app-role'}, {'RoleName': 'idle-role'}]
+        groups = [{'GroupName': 'admins'}, {'GroupName': 'devs'}]
+
+        def names(resources, key):
+            return [r[key] for r in resources]
+
+        f = self.get_filter('iam-role', 'has-inline-policy', session_factory)
+        self.assertEqual(names(f.process(roles), 'RoleName'), ['app-role'])
+        f = self.get_filter('iam-role', {
+            'type': 'no-specific-managed-policy', 'value': 'TestForSpecificMP'},
+            session_factory)
+        self.assertEqual(names(f.process(roles), 'RoleName'), ['idle-role'])
+        f = self.get_filter('iam-group', 'has-users', session_factory)
+        self.assertEqual(names(f.process(groups), 'GroupName'), ['admins'])
+        f = self.get_filter('iam-group', 'has-inline-policy', session_factory)
+        self.assertEqual(names(f.process(groups), 'GroupName'), ['devs'])
+
+        # only the default version of a policy is checked
+        f = self.get_filter('iam-policy', 'has-allow-all', session_factory)
+        policies = [
+            {'Arn': 'arn:aws:iam::aws:policy/AdministratorAccess',
+             'DefaultVersionId': 'v1'},
+            {'Arn': 'arn:aws:iam::644160558196:policy/TestForSpecificMP',
+             'DefaultVersionId': 'v2'}]
+        self.assertEqual(
+            names(f.process(policies), 'Arn'),
+            ['arn:aws:iam::aws:policy/AdministratorAccess'])
+
+        f = self.get_filter('iam-user', {
+            'type': 'policy', 'key': 'PolicyName',
+            'value': 'AdministratorAccess'}, session_factory)
+        users = [{'UserName': 'alice'}, {'UserName': 'bob'}]
+        self.assertEqual(names(f.process(users), 'UserName'), ['alice'])
+        self.assertEqual(
+            users[0]['c7n:Policies'][0]['PolicyId'], 'ANPAIWMBCKSKIEE64ZLYK')
+        self.assertFalse('PolicyVersionList' in users[0]['c7n:Policies'][0])
+
+    def test_inventory_shared(self):
+        # the filters of a run share an account's inventory
+        self.patch(IamInventoryBase, 'InventoryThreshold', 1)
+        IAM_INVENTORY.enable()
+        session_factory = self.replay_flight_data('test_iam_inventory')
+        roles = [{'RoleName': 'app-role'}, {'RoleName': 'idle-role'}]
+        f = self.get_filter('iam-role', 'has-inline-policy', session_factory)
+        self.assertEqual(len(f.process(roles)), 1)
+        other = self.get_filter('iam-role', {
+            'type': 'has-specific-managed-policy',
+            'value': 'TestForSpecificMP'}, session_factory)
+        self.assertEqual(len(other.process(roles)), 1)
+        self.assertTrue(other.inventory is f.inventory)
+        self.assertEqual(IAM_INVENTORY.summary(), {'hits': 1, 'misses': 1})
+
+    def test_inventory_threshold(self):
+        # small resource sets use per entity calls
+        session_factory = self.replay_flight_data(
+            'test_iam_role_has_inline_policy')
+        f = self.get_filter('iam-role', 'has-inline-policy', session_factory)
+        self.assertEqual(f.get_inventory([{'RoleName': 'app-role'}]), None)
+        self.assertEqual(f.inventory, None)
+
+
 class KMSCrossAccount(BaseTest):
 
     def test_kms_cross_account(self):
@@ -701,3 +799,46 @@ class CrossAccountChecker(TestCase):
                            False, False, False, False]):
             violations = check_cross_account(p, set(['221800032964']))
             self.assertEqual(bool(violations), expected)
+
+    def test_service_principal_unmodified(self):
+        policy = {
+            'Statement': [
+                {'Action': 'SNS:Publish',
+                 'Effect': 'Allow',
+                 'Principal': {'Service': 's3.amazonaws.com'}},
+                {'Action': 'SNS:Publish',
+                 'Effect': 'Allow',
+                 'Principal': {'Service': 'events.amazonaws.com',
+                               'AWS': '123456789012'}}]}
+        for i in range(2):
+            violations = check_cross_account(policy, set(['221800032964']))
+            self.assertEqual(violations, [policy['Statement'][1]])
+        self.assertEqual(
+            policy['Statement'][1]['Principal'],
+            {'Service': 'events.amazonaws.com', 'AWS': '123456789012'})
+
+    def test_policy_checks(self):
+        checks = PolicyChecks(max_size=2)
+        policies = load_data('iam/sqs-policies.json')
+        accounts = set(['221800032964'])
+        for p in policies[:2] * 3:
+            self.assertEqual(
+                checks.check(json.dumps(p), accounts),
+                check_cross_account(p, accounts))
+        self.assertEqual(
+            checks.summary(), {'size': 2, 'hits': 4, 'misses': 2})
+
+        # checked again for other accounts, evicting the oldest policy
+        others = accounts.union(['123456789012'])
+        self.assertEqual(
+            checks.check(json.dumps(policies[1]), others),
+            check_cross_account(policies[1], others))
+        checks.check(policies[2], accounts)
+        self.assertEqual(list(checks.policies), [
+            checks.get_digest(json.dumps(policies[1])),
+            checks.get_digest(policies[2])])
+        self.assertEqual(
+            len(checks.policies[checks.get_digest(
+                json.dumps(policies[1]))]['checks']), 2)
+        self.assertEqual(
+            checks.summary(), {'size': 2, 'hits': 4, 'misses': 4})
@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from c7n.ctx import ExecutionContext
+from c7n.filters import (
+    ValueFilter, COST_MEMORY, COST_BATCH_API, COST_RESOURCE_API)
+from c7n.manager import FILTER_MEMO
 from c7n.resources.ec2 import EC2
 from c7n.tags import Tag
 from common import BaseTest, instance, Bag, Config
@@ -69,3 +72,93 @@ class TestEC2Manager(BaseTest):
         self.assertEqual(ec2.actions[0].data,
                          {'msg': 'Missing proper tags', 'type': 'mark'})
 
+
+    def test_cache_period(self):
+        ec2 = self.get_manager({}, Config.empty(
+            cache_period=15, cache_periods=[('ec2', 60), ('s3', 5)]))
+        self.assertEqual(ec2.get_cache_period(), 60)
+        ec2 = self.get_manager({}, Config.empty(cache_period=15))
+        self.assertEqual(ec2.get_cache_period(), 15)
+
+    def test_filter_order(self):
+        data = {'filters': [
+            {'type': 'metrics', 'name': 'CPUUtilization', 'days': 1,
+             'value': 1, 'op': 'less-than'},
+            {'type': 'health-event'},
+            {'State.Name': 'running'},
+            {'type': 'value', 'key': 'c7n:MatchedFilters', 'value': 'present'},
+            {'type': 'ebs', 'key': 'Encrypted', 'value': False},
+            {'type': 'instance-age', 'days': 1}]}
+        ec2 = self.get_manager(data)
+        self.assertEqual(
+            [f.data.get('type', 'value') for f in ec2.get_filter_order(
+                ec2.filters)],
+            ['value', 'health-event', 'metrics', 'value',
+             'instance-age', 'ebs'])
+        ec2 = self.get_manager(
+            data, Config.empty(preserve_filter_order=True))
+        self.assertEqual(ec2.get_filter_order(ec2.filters), ec2.filters)
+
+    def test_filter_cost(self):
+        ec2 = self.get_manager({'mode': {'type': 'cloudtrail'}, 'filters': [
+            {'State.Name': 'running'},
+            {'type': 'image', 'key': 'Name', 'value': 'ami'},
+            {'type': 'event', 'key': 'detail.state', 'value': 'running'}]})
+        self.assertEqual(
+            [f.get_cost() for f in ec2.filters],
+            [COST_MEMORY, COST_BATCH_API, COST_MEMORY])
+
+        # value filter subclasses fetching their values without declaring
+        # a cost are expensive
+        class Fetching(ValueFilter):
+            def process(self, resources, event=None):
+                return resources
+
+        self.assertEqual(
+            Fetching({'key': 'Name', 'value': 'x'}).get_cost(),
+            COST_RESOURCE_API)
+        self.assertEqual(
+            [f.data.get('type', 'value') for f in ec2.get_filter_order(
+                [Fetching({'key': 'Name', 'value': 'x'}, ec2)] +
+                ec2.filters)],
+            ['value', 'event', 'image', 'value'])
+
+    def test_filter_order_annotations(self):
+        # value filters on the metrics filter's datapoints stay after it
+        for key in ('c7n.metrics', '"c7n.metrics"'):
+            data = {'filters': [
+                {'type': 'metrics', 'name': 'CPUUtilization', 'days': 1,
+                 'value': 1, 'op': 'less-than'},
+                {'type': 'value', 'key': key, 'value': 'present'},
+                {'State.Name': 'running'}]}
+            ec2 = self.get_manager(data)
+            self.assertFalse(ec2.filters[1].is_reorderable())
+            self.assertFalse(ec2.filters[1].is_shareable())
+            self.assertEqual(ec2.get_filter_order(ec2.filters), ec2.filters)
+
+    def test_filter_memo(self):
+        data = {'filters': [
+            {'tag:Env': 'dev'},
+            {'type': 'value', 'key': 'MatchedFilters', 'value': 'present'}]}
+        first = self.get_manager(data)
+        second = self.get_manager(data)
+        self.assertTrue(first.filters[0].is_shareable())
+        self.assertFalse(first.filters[1].is_shareable())
+
+        def resources():
+            return [instance(InstanceId='i-1',
+                             Tags=[{'Key': 'Env', 'Value': 'dev'}]),
+                    instance(InstanceId='i-2', Tags=[])]
+
+        FILTER_MEMO.enable()
+        self.addCleanup(FILTER_MEMO.reset)
+        self.assertEqual(
+            [r['InstanceId'] for r in first.filter_resources(resources())],
+            ['i-1'])
+
+        second.filters[0].process = lambda resources, event=None: []
+        results = second.filter_resources(resources())
+        self.assertEqual([r['InstanceId'] for r in results], ['i-1'])
+        self.assertEqual(
+            results[0]['MatchedFilters'], ['tag:Env', 'MatchedFilters'])
+        self.assertEqual(FILTER_MEMO.summary(), {'hits': 2, 'misses': 2})
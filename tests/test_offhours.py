@@ -16,13 +16,16 @@ import json
 import os
 
 from dateutil import zoneinfo
+from dateutil.tz import tzutc
 
 from mock import mock
 
-from common import BaseTest, instance
+from common import BaseTest, Bag, Config, instance
 
+from c7n import cache
 from c7n.filters import FilterValidationError
-from c7n.filters.offhours import OffHour, OnHour, ScheduleParser, Time
+from c7n.filters.offhours import (
+    OffHour, OnHour, ScheduleParser, Time, TransitionIndex)
 
 
 # Per http://blog.xelnor.net/python-mocking-datetime/
@@ -118,6 +121,209 @@ class OffHoursFilterTest(BaseTest):
         with mock_datetime_now(t, datetime):
             self.assertEqual(f.process(instances), [instances[0]])
 
+    def test_process_distinct_schedules(self):
+        f = OffHour({'default_tz': 'et'})
+        values = ['off=(m-f,19);tz=et', 'off=(m-f,19);tz=et;',
+                  'off=(m-f,20);tz=pt', 'off=(m-f,19);tz=zz']
+        instances = [
+            instance(InstanceId='i-%d' % n, Tags=[
+                {'Key': 'maid_offhours', 'Value': values[n % 4]}])
+            for n in range(40)]
+        evaluated = []
+
+        def evaluate_schedule(value, time_type):
+            evaluated.append(value)
+            return OffHour.evaluate_schedule(f, value, time_type)
+
+        f.evaluate_schedule = evaluate_schedule
+        t = datetime.datetime(
+            year=2015, month=12, day=1, hour=19, minute=5,
+            tzinfo=zoneinfo.gettz('America/New_York'))
+        with mock_datetime_now(t, datetime):
+            results = f.process(instances)
+        self.assertEqual(
+            [i['InstanceId'] for i in results],
+            ['i-%d' % n for n in range(40) if n % 4 < 2])
+        self.assertEqual(len(evaluated), 3)
+        # errors are still recorded per resource
+        self.assertEqual(
+            f.parse_errors,
+            [('i-%d' % n, 'off=(m-f,19);tz=zz') for n in range(3, 40, 4)])
+        self.assertEqual(f.verdicts, None)
+
+    def get_indexed_filter(self, instances, query=None, **config):
+        calls = []
+
+        def get_resources(ids):
+            calls.append(sorted(ids))
+            return [i for i in instances if i['InstanceId'] in ids]
+
+        def fetch_resources(query):
+            calls.append(None)
+            return list(instances)
+
+        def resources(query):
+            calls.append(sorted(query['InstanceIds']))
+            states = query['Filters'][0]['Values']
+            return [i for i in instances
+                    if i['InstanceId'] in query['InstanceIds'] and
+                    i['State']['Name'] in states]
+
+        manager = Bag(
+            type='ec2',
+            config=Config.empty(**config),
+            get_model=lambda: Bag(
+                id='InstanceId', filter_name='InstanceIds',
+                filter_type='list'),
+            get_resource_query=lambda: query,
+            get_resources=get_resources,
+            fetch_resources=fetch_resources,
+            source=Bag(resources=resources),
+            augment=lambda resources: resources)
+        f = OffHour({'default_tz': 'et'}, manager)
+        return f, calls
+
+    def test_transition_index(self):
+        instances = [
+            instance(InstanceId='i-0', Tags=[
+                {'Key': 'maid_offhours', 'Value': 'off=(m-f,19);tz=et'}]),
+            instance(InstanceId='i-1', Tags=[
+                {'Key': 'maid_offhours', 'Value': 'off=(m-f,20);tz=pt;'}]),
+            instance(InstanceId='i-2', Tags=[
+                {'Key': 'maid_offhours', 'Value': 'off'}]),
+            instance(InstanceId='i-3', Tags=[])]
+        f, calls = self.get_indexed_filter(instances)
+        self.assertEqual(
+            f.get_slots('off=(m-f,19);tz=et'),
+            [('et', d, 19) for d in range(5)])
+
+        index = TransitionIndex(f, cache.NullCache(None))
+        self.assertTrue(index.is_stale())
+        index.update(instances, complete=True)
+        self.assertFalse(index.is_stale())
+        self.assertEqual(sorted(index.slots), ['i-0', 'i-1'])
+
+        # tuesday 19:00 et, 16:00 pt
+        t = datetime.datetime(2015, 12, 2, 0, tzinfo=tzutc())
+        self.assertEqual(index.due(t), set(['i-0']))
+        self.assertEqual(
+            index.due(t + datetime.timedelta(hours=4)), set(['i-1']))
+        self.assertEqual(
+            [(h.hour, ids) for h, ids in index.forecast(t, 24)],
+            [(0, ['i-0']), (4, ['i-1'])])
+        # saturday evening, no transitions over the weekend
+        self.assertEqual(
+            index.forecast(t + datetime.timedelta(days=4), 48), [])
+
+        # retagging reschedules, a complete listing drops the missing
+        instances[0] = instance(InstanceId='i-0', Tags=[
+            {'Key': 'maid_offhours', 'Value': 'off=(m-f,20);tz=pt'}])
+        index.update(instances[:1])
+        self.assertEqual(index.due(t), set())
+        self.assertEqual(
+            index.due(t + datetime.timedelta(hours=4)), set(['i-0', 'i-1']))
+        index.update(instances[:1], complete=True)
+        self.assertEqual(
+            index.due(t + datetime.timedelta(hours=4)), set(['i-0']))
+        self.assertEqual(index.values, {'i-0': 'off=(m-f,20);tz=pt'})
+
+    def test_scope_resources(self):
+        instances = [
+            instance(InstanceId='i-%d' % n, Tags=[
+                {'Key': 'maid_offhours',
+                 'Value': 'off=(m-f,%d);tz=et' % (14 + n % 2)}])
+            for n in range(4)]
+        self.addCleanup(cache.stores.clear)
+        self.addCleanup(cache.MemoryCacheManager.clear)
+        f, calls = self.get_indexed_filter(instances)
+        self.assertEqual(f.scope_resources(), None)
+        self.assertEqual(calls, [])
+
+        f, calls = self.get_indexed_filter(instances, offhours_index='memory')
+        # tuesday 14:00 et, the mock ignores the timezone
+        t = datetime.datetime(2015, 12, 1, 19, tzinfo=tzutc())
+        with mock_datetime_now(t, datetime):
+            # the index is built from a complete listing
+            self.assertEqual(
+                [i['InstanceId'] for i in f.scope_resources()],
+                ['i-0', 'i-2'])
+            self.assertEqual(calls, [None])
+            # then only the resources due are retrieved
+            self.assertEqual(
+                [i['InstanceId'] for i in f.scope_resources()],
+                ['i-0', 'i-2'])
+            self.assertEqual(calls, [None, ['i-0', 'i-2']])
+            # resources gone since, rebuilds
+            del instances[0::2]
+            self.assertEqual(f.scope_resources(), [])
+            self.assertEqual(
+                calls, [None, ['i-0', 'i-2'], ['i-0', 'i-2'], None])
+            self.assertEqual(
+                f.get_index().values,
+                {'i-1': 'off=(m-f,15);tz=et', 'i-3': 'off=(m-f,15);tz=et'})
+
+    def test_scope_resources_query(self):
+        instances = [
+            instance(InstanceId='i-%d' % n, State={'Name': state}, Tags=[
+                {'Key': 'maid_offhours', 'Value': 'off=(m-f,14);tz=et'}])
+            for n, state in enumerate(['running', 'stopped', 'running'])]
+        self.addCleanup(cache.stores.clear)
+        self.addCleanup(cache.MemoryCacheManager.clear)
+        f, calls = self.get_indexed_filter(
+            instances, query={'Filters': [
+                {'Name': 'instance-state-name', 'Values': ['running']}]},
+            offhours_index='memory')
+        t = datetime.datetime(2015, 12, 1, 19, tzinfo=tzutc())
+        with mock_datetime_now(t, datetime):
+            f.scope_resources()
+            self.assertEqual(calls, [None])
+            # the due resources are retrieved with the policy's query
+            self.assertEqual(
+                [i['InstanceId'] for i in f.scope_resources()],
+                ['i-0', 'i-2'])
+            self.assertEqual(calls, [None, ['i-0', 'i-1', 'i-2']])
+            # none matching the query isn't a reason to rebuild
+            instances[0]['State']['Name'] = 'stopped'
+            instances[2]['State']['Name'] = 'stopped'
+            self.assertEqual(f.scope_resources(), [])
+            self.assertEqual(
+                calls, [None, ['i-0', 'i-1', 'i-2'], ['i-0', 'i-1', 'i-2']])
+
+    def test_scope_resources_tags(self):
+        instances = [
+            instance(InstanceId='i-%d' % n, Tags=[
+                {'Key': 'maid_offhours', 'Value': 'off=(m-f,14);tz=et'}])
+            for n in range(3)]
+        self.addCleanup(cache.stores.clear)
+        self.addCleanup(cache.MemoryCacheManager.clear)
+        f, calls = self.get_indexed_filter(
+            instances, offhours_index='memory')
+        tags = {}
+        f.get_tag_values = lambda: tags
+        t = datetime.datetime(2015, 12, 1, 19, tzinfo=tzutc())
+        with mock_datetime_now(t, datetime):
+            self.assertEqual(len(f.scope_resources()), 3)
+            self.assertEqual(calls, [None])
+            # retagged, untagged and newly tagged resources are reindexed
+            # from the tag listing without a rebuild
+            tags.update({
+                'i-0': [{'Key': 'Maid_Offhours',
+                         'Value': 'off=(m-f,14);tz=et'}],
+                'i-1': [{'Key': 'maid_offhours',
+                         'Value': 'off=(m-f,15);tz=et'}],
+                'i-3': [{'Key': 'maid_offhours',
+                         'Value': 'off=(m-f,14);tz=et'}]})
+            instances.append(instance(InstanceId='i-3', Tags=tags['i-3']))
+            self.assertEqual(
+                [i['InstanceId'] for i in f.scope_resources()],
+                ['i-0', 'i-3'])
+            self.assertEqual(calls, [None, ['i-0', 'i-3']])
+            self.assertEqual(f.get_index().values, {
+                'i-0': 'off=(m-f,14);tz=et',
+                'i-1': 'off=(m-f,15);tz=et',
+                'i-2': None,
+                'i-3': 'off=(m-f,14);tz=et'})
+
     def test_opt_out_behavior(self):
         # Some users want to match based on policy filters to
         # a resource subset with default opt out behavior
@@ -20,11 +20,39 @@ import shutil
 import os
 
 from c7n.ctx import ExecutionContext
-from c7n.output import S3Output
+from c7n.executor import ThreadPoolExecutor, set_policy_context
+from c7n.output import PolicyFilter, S3Output
 
 from common import Config, Bag
 
 
+class PolicyFilterTest(unittest.TestCase):
+
+    def test_policy_filter(self):
+        policy, other = Bag(name='a'), Bag(name='b')
+        f = PolicyFilter(policy)
+        record = logging.LogRecord(
+            'custodian', logging.INFO, __file__, 1, 'hello', (), None)
+
+        def matched():
+            return f.filter(record)
+
+        self.assertFalse(matched())
+        previous = set_policy_context(policy)
+        try:
+            self.assertTrue(matched())
+            # inherited by the policy's worker threads
+            with ThreadPoolExecutor(max_workers=2) as w:
+                self.assertTrue(all(w.map(lambda x: matched(), range(4))))
+        finally:
+            set_policy_context(previous)
+        self.assertFalse(matched())
+
+        set_policy_context(other)
+        self.addCleanup(set_policy_context, None)
+        self.assertFalse(matched())
+
+
 class S3OutputTest(unittest.TestCase):
 
     def test_path_join(self):
@@ -83,7 +83,8 @@ class PolicyPermissions(BaseTest):
             perms,
             set(('ec2:DescribeInstances',
                  'ec2:DescribeTags',
-                 'cloudwatch:GetMetricStatistics')))
+                 'cloudwatch:GetMetricStatistics',
+                 'cloudwatch:GetMetricData')))
 
     def test_resource_permissions(self):
         self.capture_logging('c7n.cache')
@@ -173,6 +174,55 @@ class TestPolicyCollection(BaseTest):
         self.assertEqual(len(collection), 3)
 
 
+    def test_policy_plan_shared_query(self):
+        session_factory = self.replay_flight_data(
+            'test_ec2_state_transition_age_filter')
+        self.patch(policy.PolicyCollection, 'test_session_factory',
+                   staticmethod(lambda x=None: session_factory))
+        collection = policy.PolicyCollection.from_data(
+            {'policies': [
+                {'name': 'ec2-running',
+                 'resource': 'ec2',
+                 'filters': [{'State.Name': 'running'}]},
+                {'name': 'ec2-stopped',
+                 'resource': 'ec2',
+                 'query': [{'instance-state-name': 'stopped'}]},
+                {'name': 'ec2-all',
+                 'resource': 'ec2'},
+                {'name': 'ec2-lambda',
+                 'resource': 'ec2',
+                 'mode': {'type': 'periodic', 'schedule': 'rate(1 day)'}}]},
+            Config.empty(output_dir=self.get_temp_dir()))
+
+        groups = collection.plan()
+        self.assertEqual(
+            [[p.name for p in g] for g in groups],
+            [['ec2-running', 'ec2-all'], ['ec2-stopped'], ['ec2-lambda']])
+
+        running, shared = groups[0]
+        self.assertIs(
+            running.resource_manager.shared_query,
+            shared.resource_manager.shared_query)
+        self.assertEqual(groups[1][0].resource_manager.shared_query, None)
+
+        fetched = []
+        fetch = EC2.fetch_resources
+
+        def fetch_resources(manager, query=None):
+            fetched.append(manager)
+            return fetch(manager, query)
+        self.patch(EC2, 'fetch_resources', fetch_resources)
+
+        resources = running.resource_manager.resources()
+        self.assertEqual(len(resources), 2)
+        for r in resources:
+            r['c7n:marker'] = True
+        others = shared.resource_manager.resources()
+        self.assertEqual(len(fetched), 1)
+        self.assertEqual(len(others), 3)
+        self.assertFalse([r for r in others if 'c7n:marker' in r])
+
+
 class TestPolicy(BaseTest):
 
     def test_load_policy_validation_error(self):
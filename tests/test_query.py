@@ -29,6 +29,25 @@ class ResourceQueryTest(BaseTest):
         self.assertEqual(len(resources), 1)
         self.assertEqual(resources[0]['InstanceId'], 'i-9432cb49')
 
+    def test_query_filter_pages(self):
+        session_factory = self.replay_flight_data('test_query_filter')
+        q = ResourceQuery(session_factory)
+        pages = list(q.filter_pages(EC2.resource_type))
+        self.assertEqual(len(pages), 1)
+        self.assertEqual(pages[0][0]['InstanceId'], 'i-9432cb49')
+
+        # page calls are made through the retry
+        calls = []
+
+        def retry(func, **kw):
+            calls.append(kw)
+            return func(**kw)
+
+        pages = list(q.filter_pages(
+            EC2.resource_type, retry=retry, MaxResults=10))
+        self.assertEqual(pages[0][0]['InstanceId'], 'i-9432cb49')
+        self.assertEqual(calls, [{'MaxResults': 10}])
+
     def test_query_get(self):
         session_factory = self.replay_flight_data('test_query_get')
         q = ResourceQuery(session_factory)
@@ -67,6 +86,89 @@ class QueryResourceManagerTest(BaseTest):
         p.run()
         self.assertTrue("Using cached internet-gateway: 3", output.getvalue())
         
+    def test_stream_resources(self):
+        session_factory = self.replay_flight_data('test_query_manager')
+        p = self.load_policy(
+            {'name': 'igw-check',
+             'resource': 'internet-gateway',
+             'filters': [
+                 {'InternetGatewayId': 'igw-5bce113e'},
+                 {'type': 'value', 'value_type': 'resource_count',
+                  'op': 'eq', 'value': 1}]},
+            config={'stream': True},
+            session_factory=session_factory)
+        self.assertEqual(
+            [f.is_barrier() for f in p.resource_manager.filters],
+            [False, True])
+        output = self.capture_logging(
+            name=p.resource_manager.log.name, level=logging.DEBUG)
+        resources = p.run()
+        self.assertEqual(len(resources), 1)
+        self.assertIn(
+            "Streamed 3 internetgateway, 1 matched streaming filters",
+            output.getvalue())
+
+    def test_pushdown_filters(self):
+        p = self.load_policy(
+            {'name': 'ec2-pushdown',
+             'resource': 'ec2',
+             'query': [{'image-id': 'ami-1'}],
+             'filters': [
+                 {'State.Name': 'running'},
+                 {'tag:Env': 'prod'},
+                 {'tag:Owner': 'present'},
+                 {'type': 'value', 'key': 'VpcId', 'op': 'in',
+                  'value': ['vpc-1', 'vpc-2']},
+                 {'type': 'value', 'key': 'InstanceType', 'value': 't2.micro'},
+                 {'tag:Expires': 'absent'},
+                 {'type': 'value', 'key': 'ImageId', 'op': 'ne',
+                  'value': 'ami-1'},
+                 {'type': 'value', 'key': 'LaunchTime', 'op': 'gt',
+                  'value_type': 'age', 'value': 30},
+                 {'or': [{'KeyName': 'abc'}, {'KeyName': 'xyz'}]}]})
+        self.assertEqual(
+            p.resource_manager.get_query(),
+            {'Filters': [
+                {'Name': 'image-id', 'Values': ['ami-1']},
+                {'Name': 'instance-state-name', 'Values': ['running']},
+                {'Name': 'tag:Env', 'Values': ['prod']},
+                {'Name': 'tag-key', 'Values': ['Owner']},
+                {'Name': 'vpc-id', 'Values': ['vpc-1', 'vpc-2']},
+                {'Name': 'instance-type', 'Values': ['t2.micro']}]})
+
+        # only the leading filters, those after a barrier or a filter that
+        # can't be pushed down see the complete listing
+        p = self.load_policy(
+            {'name': 'ec2-pushdown-barrier',
+             'resource': 'ec2',
+             'filters': [
+                 {'type': 'value', 'value_type': 'resource_count',
+                  'op': 'gte', 'value': 10},
+                 {'State.Name': 'running'}]})
+        self.assertEqual(
+            p.resource_manager.get_query(),
+            p.resource_manager.get_resource_query())
+        p = self.load_policy(
+            {'name': 'ec2-pushdown-leading',
+             'resource': 'ec2',
+             'filters': [
+                 {'tag:Env': 'prod'},
+                 {'type': 'instance-age', 'days': 1},
+                 {'State.Name': 'running'}]})
+        self.assertEqual(
+            p.resource_manager.get_query(),
+            {'Filters': [{'Name': 'tag:Env', 'Values': ['prod']}]})
+
+        p = self.load_policy(
+            {'name': 'rds-pushdown',
+             'resource': 'rds',
+             'filters': [
+                 {'DBClusterIdentifier': 'prod'},
+                 {'tag:Env': 'prod'}]})
+        self.assertEqual(
+            p.resource_manager.get_query(),
+            {'Filters': [{'Name': 'db-cluster-id', 'Values': ['prod']}]})
+
     def test_get_resources(self):
         session_factory = self.replay_flight_data('test_query_manager_get')
         p = self.load_policy(
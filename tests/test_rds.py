@@ -21,6 +21,7 @@ import uuid
 from collections import OrderedDict
 
 import boto3
+from dateutil.tz import tzutc
 from common import BaseTest
 
 from c7n.executor import MainThreadExecutor
@@ -490,6 +491,57 @@ class RDSSnapshotTest(BaseTest):
         self.assertEqual(resources[0]['DBSnapshotIdentifier'],
                          'rds:originb-2016-12-28-09-15')
 
+    def test_rds_latest_filter_order(self):
+        p = self.load_policy({
+            'name': 'rds-latest-old',
+            'resource': 'rds-snapshot',
+            'filters': ['latest', {'type': 'age', 'days': 30}]})
+        manager = p.resource_manager
+        self.assertEqual(
+            manager.get_filter_order(manager.filters), manager.filters)
+
+        snapshots = self.get_snapshots(
+            ('a', 'manual', 40), ('b', 'manual', 1))
+        # the latest snapshot isn't 30 days old
+        self.assertEqual(manager.filter_resources(snapshots), [])
+
+    def get_snapshots(self, *specs):
+        now = datetime.datetime.now(tzutc())
+        return [
+            {'DBSnapshotIdentifier': name, 'DBInstanceIdentifier': 'db',
+             'SnapshotType': snapshot_type,
+             'SnapshotCreateTime': now - datetime.timedelta(days=days)}
+            for name, snapshot_type, days in specs]
+
+    def test_rds_latest_streaming(self):
+        p = self.load_policy({
+            'name': 'rds-latest-stream',
+            'resource': 'rds-snapshot',
+            'filters': [{'SnapshotType': 'manual'}, 'latest']},
+            config={'stream': True})
+        manager = p.resource_manager
+        pages = [[s] for s in self.get_snapshots(
+            ('a', 'manual', 40), ('b', 'manual', 1))]
+        manager.source.resource_pages = lambda query: iter(pages)
+        manager.augment = lambda resources: resources
+        # latest sees the snapshots of every page, not one at a time
+        self.assertEqual(
+            [s['DBSnapshotIdentifier'] for s in manager.stream_resources()],
+            ['b'])
+
+    def test_rds_latest_or(self):
+        p = self.load_policy({
+            'name': 'rds-latest-or',
+            'resource': 'rds-snapshot',
+            'filters': [{'or': [{'SnapshotType': 'automated'}, 'latest']}]})
+        snapshots = self.get_snapshots(
+            ('a', 'manual', 40), ('b', 'automated', 1))
+        # latest sees all the snapshots, not those the first filter left
+        self.assertEqual(
+            [s['DBSnapshotIdentifier']
+             for s in p.resource_manager.filter_resources(snapshots)],
+            ['b'])
+
     def test_rds_cross_region_copy_lambda(self):
         self.assertRaises(
             FilterValidationError,
@@ -110,8 +110,10 @@ class BucketMetrics(BaseTest):
         self.assertEqual(len(resources), 1)
         self.assertEqual(resources[0]['Name'], 'custodian-skunk-trails')
         self.assertTrue('c7n.metrics' in resources[0])
-        self.assertTrue(
-            'AWS/S3.NumberOfObjects.Average' in resources[0]['c7n.metrics'])
+        self.assertEqual(
+            list(resources[0]['c7n.metrics']),
+            ['AWS/S3.NumberOfObjects.Average.1209600.14.'
+             'BucketName=custodian-skunk-trails,StorageType=AllStorageTypes'])
 
 
 class BucketDelete(BaseTest):
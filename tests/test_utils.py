@@ -11,13 +11,22 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import copy
+from datetime import datetime
+import cPickle
 import json
 import os
 import unittest
 import tempfile
+import threading
 import time
 
+import boto3
+from dateutil.parser import parse
+from dateutil.tz import tzutc
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from botocore.stub import Stubber
 import ipaddress
 
 from c7n import utils
@@ -61,6 +70,64 @@ class Backoff(BaseTest):
             self.assertTrue(i < maxv)
 
 
+class RateLimitTest(BaseTest):
+
+    def setUp(self):
+        self.addCleanup(utils.API_LIMITS.reset)
+
+    def test_token_bucket(self):
+        limiter = utils.RateLimiter(rate=50, burst=1)
+        t = time.time()
+        for i in range(6):
+            limiter.acquire()
+        self.assertTrue(time.time() - t >= 0.09)
+
+    def test_circuit_breaker(self):
+        limiter = utils.RateLimiter()
+        t = time.time()
+        limiter.trip(0.05)
+        limiter.acquire()
+        self.assertTrue(time.time() - t >= 0.05)
+
+    def test_configure_rates(self):
+        limiter = utils.API_LIMITS.limiter('rds', 'us-east-1')
+        self.assertEqual(limiter.rate, None)
+        utils.API_LIMITS.configure([('rds', 2.5)])
+        self.assertEqual(limiter.rate, 2.5)
+        self.assertEqual(
+            utils.API_LIMITS.limiter('rds', 'us-west-2').rate, 2.5)
+        self.assertEqual(
+            utils.API_LIMITS.limiter('ec2', 'us-east-1').rate, None)
+        # the lowest of a service's rates applies
+        utils.API_LIMITS.configure(
+            [('rds', 2.5)], {'rds': 1, 'ec2': 4}, None)
+        self.assertEqual(limiter.rate, 1)
+        self.assertEqual(
+            utils.API_LIMITS.limiter('ec2', 'us-east-1').rate, 4)
+
+    def test_retry_stats(self):
+        client = boto3.Session(
+            region_name='us-east-1', aws_access_key_id='never',
+            aws_secret_access_key='found').client('ec2')
+        stubber = Stubber(client)
+        stubber.add_client_error(
+            'describe_instances', service_error_code='RequestLimitExceeded')
+        stubber.add_client_error(
+            'describe_instances', service_error_code='IncorrectState')
+        stubber.add_response('describe_instances', {'Reservations': []})
+        stubber.activate()
+
+        retry = utils.get_retry(
+            ('RequestLimitExceeded', 'IncorrectState'), min_delay=0.01)
+        self.assertEqual(
+            retry(client.describe_instances)['Reservations'], [])
+        self.assertEqual(
+            utils.API_LIMITS.summary(),
+            {'ec2.describe_instances': {'retries': 2, 'throttles': 1}})
+        self.assertTrue(
+            utils.API_LIMITS.limiter('ec2', 'us-east-1').open_until > 0)
+
+
 class WorkerDecorator(BaseTest):
 
     def test_method_worker(self):
@@ -101,6 +168,160 @@ class WorkerDecorator(BaseTest):
         self.assertTrue("more carrots" in log_output.getvalue())
 
 
+class ClientPoolTest(BaseTest):
+
+    def get_factory(self, region='us-east-1'):
+        def factory(assume=True, region=None):
+            return boto3.Session(
+                region_name=region or default_region,
+                aws_access_key_id='never', aws_secret_access_key='found')
+        default_region = region
+        return factory
+
+    def setUp(self):
+        utils.reset_session_cache()
+        self.addCleanup(utils.reset_session_cache)
+        self.addCleanup(utils.CLIENT_POOL.clear)
+
+    def test_local_session_keyed_by_factory(self):
+        f1, f2 = self.get_factory(), self.get_factory('us-west-2')
+        s1 = utils.local_session(f1)
+        self.assertIs(utils.local_session(f1), s1)
+        s2 = utils.local_session(f2)
+        self.assertIsNot(s1, s2)
+        self.assertEqual(s2.region_name, 'us-west-2')
+        utils.reset_session_cache()
+        self.assertIsNot(utils.local_session(f1), s1)
+
+    def test_pooled_clients(self):
+        factory = self.get_factory()
+        client = utils.local_session(factory).client('ec2')
+        self.assertEqual(client.meta.config.max_pool_connections, 10)
+
+        # reused across threads
+        clients = []
+        t = threading.Thread(target=lambda: clients.append(
+            utils.local_session(factory).client('ec2')))
+        t.start()
+        t.join()
+        self.assertIs(clients[0], client)
+
+        self.assertIsNot(
+            utils.local_session(factory).client('ec2', region_name='us-west-2'),
+            client)
+        self.assertIsNot(utils.local_session(
+            self.get_factory()).client('ec2'), client)
+
+        config = Config(read_timeout=200)
+        s3 = utils.local_session(factory).client('s3', config=config)
+        self.assertEqual(s3.meta.config.read_timeout, 200)
+        self.assertIs(
+            utils.local_session(factory).client(
+                's3', config=Config(read_timeout=200)), s3)
+
+    def test_pool_resize_and_expiry(self):
+        pool = utils.ClientPool()
+        pool.resize(40)
+        self.assertEqual(pool.max_connections, 40)
+        factory = self.get_factory()
+        session = factory()
+        client = pool.client(factory, session, 'sqs')
+        self.assertEqual(client.meta.config.max_pool_connections, 40)
+        # clients with a smaller connection pool are recreated
+        pool.resize(80)
+        resized = pool.client(factory, session, 'sqs')
+        self.assertEqual(resized.meta.config.max_pool_connections, 80)
+        pool.resize(10)
+        self.assertIs(pool.client(factory, session, 'sqs'), resized)
+        self.patch(utils, 'SESSION_TTL', -1)
+        self.assertIsNot(pool.client(factory, session, 'sqs'), resized)
+
+    def test_reset_session_cache(self):
+        factory, other = self.get_factory(), self.get_factory()
+        client = utils.local_session(factory).client('ec2')
+        other_client = utils.local_session(other).client('ec2')
+        # only the given factory's clients
+        utils.reset_session_cache(factory)
+        self.assertIsNot(utils.local_session(factory).client('ec2'), client)
+        self.assertIs(utils.local_session(other).client('ec2'), other_client)
+        utils.reset_session_cache()
+        self.assertIsNot(
+            utils.local_session(other).client('ec2'), other_client)
+
+
+class TagIndexTest(unittest.TestCase):
+
+    def test_tag_index(self):
+        r = {'Tags': [{'Key': 'Name', 'Value': 'a'},
+                      {'Key': 'NAME', 'Value': 'b'},
+                      {'Value': 'orphan'}]}
+        utils.index_tags([r])
+        self.assertTrue(isinstance(r['Tags'], utils.TagIndex))
+        self.assertEqual(utils.get_tag_value(r, 'NAME'), 'b')
+        self.assertEqual(utils.get_tag_value(r, 'name', lower=True), 'a')
+        self.assertEqual(utils.get_tag_value(r, 'Env'), None)
+
+        r['Tags'].append({'Key': 'Env', 'Value': 'dev'})
+        self.assertEqual(utils.get_tag_value(r, 'Env'), 'dev')
+        r['Tags'][:] = []
+        self.assertEqual(utils.tag_map(r), {})
+
+    def test_tag_index_serialization(self):
+        r = {'Tags': [{'Key': 'Name', 'Value': 'a'}]}
+        utils.tag_map(r)
+        self.assertTrue(isinstance(r['Tags'], utils.TagIndex))
+        self.assertEqual(
+            json.loads(utils.dumps(r)),
+            {'Tags': [{'Key': 'Name', 'Value': 'a'}]})
+        self.assertEqual(type(copy.deepcopy(r)['Tags']), list)
+        self.assertEqual(
+            type(cPickle.loads(cPickle.dumps(r, 2))['Tags']), list)
+        self.assertEqual(utils.tag_map({}), {})
+
+
+class JmespathCacheTest(unittest.TestCase):
+
+    def test_jmespath_cache(self):
+        cache = utils.JmespathCache(max_size=2)
+        self.assertEqual(cache.compile('a.b').search({'a': {'b': 1}}), 1)
+        self.assertTrue(cache.compile('a.b') is cache.compile('a.b'))
+        cache.compile('c')
+        cache.compile('a.b')
+        cache.compile('d')
+        self.assertEqual(list(cache.expressions), ['a.b', 'd'])
+        self.assertEqual(
+            cache.summary(), {'size': 2, 'hits': 3, 'misses': 3})
+        cache.reset()
+        self.assertEqual(
+            cache.summary(), {'size': 0, 'hits': 0, 'misses': 0})
+
+    def test_jmespath_search(self):
+        self.assertEqual(
+            utils.jmespath_search('[].Id', [{'Id': 'a'}, {'Id': 'b'}]),
+            ['a', 'b'])
+
+
+class ParseDateTest(unittest.TestCase):
+
+    def test_parse_date(self):
+        now = datetime.now(tz=tzutc())
+        for value in (
+                '2016-04-14T05:17:29.000Z', '2016-04-14T05:17:29+00:00',
+                '2016-04-14T05:17:29.1234567-05:30', '2016-04-14 05:17:29',
+                '2016-04-14T05:17:29+0100', '2016-04-14T05:17',
+                '2016-04-14', '2016/04/14', 'Apr 14 2016'):
+            for default in (None, now):
+                parsed = utils.parse_date(value, default)
+                expected = parse(value, default=default)
+                self.assertEqual(
+                    (parsed.replace(tzinfo=None), parsed.utcoffset()),
+                    (expected.replace(tzinfo=None), expected.utcoffset()))
+        self.assertTrue('2016-04-14T05:17:29.000Z' in utils._date_fields)
+        self.assertFalse('Apr 14 2016' in utils._date_fields)
+        self.assertRaises(ValueError, utils.parse_date, '2016-13-14')
+        self.assertRaises(TypeError, utils.parse_date, None)
+
+
 class UtilTest(unittest.TestCase):
 
     def write_temp_file(self, contents, suffix='.tmp'):
@@ -0,0 +1,76 @@
+# Copyright 2017 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compare row and columnar value filter evaluation on synthetic ec2s.
+
+    python tools/dev/bench_columnar.py [count]
+"""
+from datetime import datetime, timedelta
+import random
+import sys
+import time
+
+from dateutil.tz import tzutc
+
+from c7n.filters import columnar
+from c7n.resources import load_resources
+from c7n.resources.ec2 import filters
+from c7n.utils import index_tags
+
+FILTERS = [
+    {'State.Name': 'running'},
+    {'tag:Env': 'absent'},
+    {'type': 'value', 'key': 'InstanceType', 'op': 'in',
+     'value': ['m3.medium', 'c4.large']},
+    {'type': 'value', 'key': 'CpuOptions.CoreCount', 'op': 'gte',
+     'value': 4},
+    {'type': 'value', 'key': 'LaunchTime', 'op': 'gt',
+     'value_type': 'age', 'value': 30},
+    {'type': 'value', 'key': 'SecurityGroups', 'op': 'gte',
+     'value_type': 'size', 'value': 2}]
+
+
+def generate(count):
+    rand = random.Random(0)
+    now = datetime.now(tz=tzutc())
+    return [{
+        'InstanceId': 'i-%08d' % idx,
+        'State': {'Name': rand.choice(['running', 'stopped'])},
+        'InstanceType': rand.choice(['m3.medium', 't2.micro', 'c4.large']),
+        'CpuOptions': {'CoreCount': rand.choice([1, 2, 4, 8])},
+        'LaunchTime': now - timedelta(rand.randint(0, 90)),
+        'SecurityGroups': [{}] * rand.randint(0, 3),
+        'Tags': [{'Key': rand.choice(['Env', 'App']), 'Value': 'x'}]}
+        for idx in range(count)]
+
+
+def main(count):
+    load_resources()
+    resources = index_tags(generate(count))
+    print("%d resources" % count)
+    for data in FILTERS:
+        f = filters.factory(data)
+        f.annotate = False
+        t = time.time()
+        rows = f.process(resources)
+        row_time = time.time() - t
+        t = time.time()
+        columns = columnar.process(f, resources)
+        column_time = time.time() - t
+        assert rows == columns
+        print("%-60s row:%0.2fs columnar:%0.2fs %0.1fx" % (
+            data, row_time, column_time, row_time / column_time))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
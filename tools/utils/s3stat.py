@@ -14,65 +14,62 @@
 from datetime import datetime, timedelta
 
 
+import argparse
 import boto3
 import json
 import logging
 
-
-def bucket_info(c, bucket):
-    result = {'Bucket': bucket}
-    response = c.get_metric_statistics(
+from c7n.cache import get_datapoint_store
+from c7n.filters.metrics import get_datapoints
+from c7n.utils import get_account_id_from_sts
+
+
+def get_average(c, bucket, metric, storage_type, days, store, account_id):
+    dimensions = [
+        {'Name': 'BucketName', 'Value': bucket},
+        {'Name': 'StorageType', 'Value': storage_type}]
+    period = 60 * 24 * 24
+    key = store and store.get_key(
+        account_id, c.meta.region_name, 'AWS/S3', metric, dimensions,
+        ['Average'], period)
+    end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    datapoints = get_datapoints(
+        c, end - timedelta(days), end, period, store, key,
         Namespace='AWS/S3',
-        MetricName='NumberOfObjects',
-        Dimensions=[
-            {'Name': 'BucketName',
-           'Value': bucket},
-           {'Name': 'StorageType',
-               'Value': 'AllStorageTypes'}
-        ],
-        StartTime=datetime.now().replace(
-            hour=0, minute=0, second=0, microsecond=0) - timedelta(1),
-        EndTime=datetime.now().replace(
-            hour=0, minute=0, second=0, microsecond=0),
-        Period=60 * 24 * 24,
+        MetricName=metric,
+        Dimensions=dimensions,
         Statistics=['Average'])
+    if not datapoints:
+        return 0
+    return datapoints[0]['Average']
 
-    if not response['Datapoints']:
-        result['ObjectCount'] = 0
-    else:
-        result['ObjectCount'] = response['Datapoints'][0]['Average']
-
-    response = c.get_metric_statistics(
-        Namespace='AWS/S3',
-        MetricName='BucketSizeBytes',
-        Dimensions=[
-            {'Name': 'BucketName',
-          'Value': bucket},
-          {'Name': 'StorageType',
-              'Value': 'StandardStorage'},
-        ],
-        StartTime=datetime.now().replace(
-            hour=0, minute=0, second=0, microsecond=0) - timedelta(10),
-        EndTime=datetime.now().replace(
-            hour=0, minute=0, second=0, microsecond=0),
-        Period=60 * 24 * 24,
-        Statistics=['Average'])
 
-    if not response['Datapoints']:
-        result['Size'] = 0
-        result['SizeGB'] = 0
-    else:
-        result['Size'] = response['Datapoints'][0]['Average']
-        result['SizeGB'] = result['Size'] / (1024.0 * 1024 * 1024)
+def bucket_info(c, bucket, store=None, account_id=None):
+    result = {'Bucket': bucket}
+    result['ObjectCount'] = get_average(
+        c, bucket, 'NumberOfObjects', 'AllStorageTypes', 1,
+        store, account_id)
+    result['Size'] = get_average(
+        c, bucket, 'BucketSizeBytes', 'StandardStorage', 10,
+        store, account_id)
+    result['SizeGB'] = result['Size'] / (1024.0 * 1024 * 1024)
     return result
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--metrics-cache", default=None,
+        help="Directory, or sqlite database, persisting cloudwatch "
+             "datapoints across runs, so only new periods are retrieved")
+    options = parser.parse_args()
 
     logging.basicConfig(level=logging.INFO)
     results = {'buckets':[]}
     size_count = obj_count = 0.0
     s = boto3.Session()
+    store = get_datapoint_store(options)
+    account_id = store and get_account_id_from_sts(s)
     s3 = s.client('s3')
     buckets = s3.list_buckets()['Buckets']
     cw_cache = {}
@@ -98,7 +95,7 @@ def main():
         else:
             cw = s.client('cloudwatch', region_name=bucket_region)
             cw_cache[bucket_region] = cw
-        i = bucket_info(cw, b['Name'])
+        i = bucket_info(cw, b['Name'], store, account_id)
 
         results['buckets'].append(i)
         obj_count += i['ObjectCount']